@@ -168,6 +168,25 @@ class structures(object3d):
         # self.materials = []
         # for item in material_characteristics:
         #    self.materials.append(item)
+        self.clear_cache()
+
+    def clear_cache(self):
+        """
+        clears the cached triangles and bounding volume hierarchy, this is called whenever the solids are changed
+        through the class methods, but must be called directly if the meshes in self.solids are modified in place
+
+        Returns
+        --------
+        None
+        """
+        # local frame triangles, in the order of the bounding volume hierarchy leaves, and the index of each in the
+        # order of the solids
+        self._local_triangles = None
+        self._local_bvh = None
+        self._local_order = None
+        # the most recent global frame export, and the pose it was exported with
+        self._posed_environment = None
+        self._posed_pose = None
 
     def remove_structure(self, deletion_index):
         """
@@ -184,7 +203,8 @@ class structures(object3d):
         """
         for entry in range(len(deletion_index)):
             self.solids.pop(deletion_index[entry])
-            self.materials.pop(deletion_index[entry])
+
+        self.clear_cache()
 
     def add_structure(self, new_solids):
         """
@@ -202,6 +222,7 @@ class structures(object3d):
         """
         self.solids.append(new_solids)
         # self.materials.append(new_materials)
+        self.clear_cache()
 
     def rotate_structures(
         self, rotation_matrix, rotation_centre=np.zeros((3, 1), dtype=np.float32)
@@ -226,6 +247,8 @@ class structures(object3d):
                 self.solids[item], rotation_matrix, rotation_centre
             )
 
+        self.clear_cache()
+
     def translate_structures(self, vector):
         """
         translates the structures in the class by the given cartesian vector (x,y,z)
@@ -242,6 +265,8 @@ class structures(object3d):
         for item in range(len(self.solids)):
             self.solids[item].translate(vector)
 
+        self.clear_cache()
+
     def export_vertices(self, structure_index=None):
         """
         Exports the vertices for either all or the indexed point clouds, transformed to the global coordinate frame.
@@ -292,15 +317,71 @@ class structures(object3d):
         Returns
         --------
         triangles : N by 1 numpy array of triangle_t triangles
-            a continuous array of all the triangles in the structure
+            a continuous array of all the triangles in the structure, in the order of the solids
         """
-        triangles = np.empty((0), dtype=base_types.triangle_t)
-        for item in range(len(self.solids)):
-            temp_object = copy.deepcopy(self.solids[item])[0]
-            temp_object.transform(self.pose)
-            triangles = np.append(triangles, RF.convertTriangles(temp_object))
+        triangles, _ = self.raycaster_environment()
+        # the cached triangles are in the order of the bounding volume hierarchy, so a new array is returned in the
+        # order of the solids, use raycaster_environment for the cached triangles
+        ordered_triangles = np.empty_like(triangles)
+        ordered_triangles[self._local_order] = triangles
+        return ordered_triangles
+
+    def local_triangles(self):
+        """
+        the triangles for all the solids in the local coordinate frame of the structure, with the bounding volume
+        hierarchy used by the raycaster. These are cached until the solids are changed.
+
+        Returns
+        --------
+        triangles : N by 1 numpy array of triangle_t triangles
+            a continuous array of all the triangles in the structure, in the order of the bounding volume hierarchy
+        bvh_nodes : numpy array of bvh_node_t
+            the bounding volume hierarchy for the triangles
+        """
+        if self._local_triangles is None:
+            vertices = [np.empty((0, 3))]
+            tri_index = [np.empty((0, 3), dtype=np.int64)]
+            vertex_offset = 0
+            for item in range(len(self.solids)):
+                if self.solids[item] is None:
+                    continue
+                temp_vertices = np.asarray(self.solids[item].vertices)
+                vertices.append(temp_vertices)
+                tri_index.append(np.asarray(self.solids[item].triangles) + vertex_offset)
+                vertex_offset += temp_vertices.shape[0]
+
+            # convert all the solids in a single pass
+            triangles = RF.triangles_from_vertices(
+                np.concatenate(vertices, axis=0), np.concatenate(tri_index, axis=0)
+            )
+            self._local_triangles, self._local_bvh, self._local_order = RF.build_bvh(
+                triangles, return_order=True
+            )
+
+        return self._local_triangles, self._local_bvh
+
+    def raycaster_environment(self):
+        """
+        the triangles for all the solids transformed by the pose of the structure, with the bounding volume hierarchy
+        used by the raycaster. A change of pose only transforms the cached local triangles and refits the hierarchy.
+
+        Returns
+        --------
+        triangles : N by 1 numpy array of triangle_t triangles
+            a continuous array of all the triangles in the structure, in the order of the bounding volume hierarchy
+        bvh_nodes : numpy array of bvh_node_t
+            the bounding volume hierarchy for the triangles
+        """
+        local_triangles, local_bvh = self.local_triangles()
+        if self._posed_pose is None or not np.array_equal(self._posed_pose, self.pose):
+            if np.array_equal(self.pose, np.eye(4)):
+                self._posed_environment = (local_triangles, local_bvh)
+            else:
+                triangles = RF.transform_triangles(local_triangles, self.pose)
+                self._posed_environment = (triangles, RF.refit_bvh(triangles, local_bvh))
+            self._posed_pose = self.pose.copy()
 
-        return triangles
+        return self._posed_environment
 
 
 class antenna_structures(object3d):
@@ -354,6 +435,7 @@ class antenna_structures(object3d):
                 self.structures.solids[item] = GF.open3drotate(
                     self.structures.solids[item], rotation_matrix, rotation_centre
                 )
+        self.structures.clear_cache()
         for item in range(len(self.points.points)):
             if (self.points.points[item] is not None):
                 self.points.points[item] = GF.open3drotate(
@@ -377,6 +459,7 @@ class antenna_structures(object3d):
         self.pose[:3,3]=self.pose[:3,3].ravel()+vector.ravel()
         for item in range(len(self.structures.solids)):
             self.structures.solids[item].translate(vector)
+        self.structures.clear_cache()
         for item in range(len(self.points.points)):
             self.points.points[item].translate(vector)
 
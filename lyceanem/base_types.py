@@ -98,3 +98,60 @@ scattering_point = np.dtype(
 )
 
 scattering_t = from_dtype(scattering_point)  # Create a type that numba can recognize!
+
+
+def unified_point_information(points, normals, weights):
+    """
+    Create the point information for the EM kernels from the sources, sinks and scattering points, all as electric
+    sources in free space.
+
+    Parameters
+    ----------
+    points : n by 3 numpy array of float
+        the positions of the sources, followed by the sinks and scattering points
+    normals : n by 3 numpy array of float
+        the normal vector of each point
+    weights : n by 3 numpy array of complex
+        the excitation vector of each point
+
+    Returns
+    -------
+    point_information : numpy array of :type:`scattering_t`
+        the point information for all sources, sinks and scattering points
+    """
+    point_information = np.zeros((points.shape[0]), dtype=scattering_t)
+    point_information["Electric"] = True
+    point_information["permittivity"] = 8.8541878176e-12
+    point_information["permeability"] = 1.25663706212e-6
+    point_information["px"] = points[:, 0]
+    point_information["py"] = points[:, 1]
+    point_information["pz"] = points[:, 2]
+    point_information["nx"] = normals[:, 0]
+    point_information["ny"] = normals[:, 1]
+    point_information["nz"] = normals[:, 2]
+    point_information["ex"] = weights[:, 0]
+    point_information["ey"] = weights[:, 1]
+    point_information["ez"] = weights[:, 2]
+    return point_information
+
+
+# flattened bounding volume hierarchy node, to accelerate the raycaster
+bvh_node_data = np.dtype(
+    [
+        # axis aligned bounding box
+        ("minx", "f4"),
+        ("miny", "f4"),
+        ("minz", "f4"),
+        ("maxx", "f4"),
+        ("maxy", "f4"),
+        ("maxz", "f4"),
+        # child node indices for interior nodes, -1 for leaf nodes
+        ("left", "i4"),
+        ("right", "i4"),
+        # first triangle and number of triangles for leaf nodes, tri_num is 0 for interior nodes
+        ("first", "i4"),
+        ("tri_num", "i4"),
+    ],
+    align=True,
+)
+bvh_node_t = from_dtype(bvh_node_data)  # Create a type that numba can recognize!
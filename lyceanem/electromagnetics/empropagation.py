@@ -5,19 +5,32 @@ import copy
 import math
 import pathlib
 
-import cupy as cp
 import numpy as np
 import open3d as o3d
+import scipy.sparse
 import scipy.stats
 from matplotlib import cm
+import numba as nb
 from numba import cuda, float32, float64, complex64, njit, guvectorize, prange
 from numpy.linalg import norm
 from scipy.spatial import distance
 
+try:
+    import cupy as cp
+except ImportError:
+    # cupy is only needed for the GPU kernels, the CPU backend runs without it
+    cp = None
+
 import lyceanem.base_types as base_types
 import lyceanem.raycasting.rayfunctions as RF
+import lyceanem.raycasting.pathstore as pathstore
+import lyceanem.electromagnetics.impulseresponse as impulseresponse
 import lyceanem.geometry.geometryfunctions as GF
 
+CPU_ACCUMULATOR_BYTES = 2 ** 28  # memory budget for the per-thread partial scattering networks on the CPU backend
+PRECISIONS = {"double": np.complex128, "single": np.complex64}  # scattering network dtype for each precision
+ACCUMULATORS = ("segment", "scatter")  # methods of summing the paths into the scattering network
+
 
 @cuda.jit(device=True)
 def dot(ax1, ay1, az1, ax2, ay2, az2):
@@ -927,237 +940,138 @@ def scatteringkernaltest(
 
 
 @cuda.jit
-def polaranddistance(network_index, point_information, polar_coefficients, distances):
+def polaranddistance(
+    nodes, path_blocks, point_information, polar_coefficients, distances
+):
 
     cu_ray_num = cuda.grid(1)  # alias for threadIdx.x + ( blockIdx.x * blockDim.x ),
     #           threadIdx.y + ( blockIdx.y * blockDim.y )
     # margin=1e-5
-    if cu_ray_num < network_index.shape[0]:
+    if cu_ray_num < path_blocks[path_blocks.shape[0] - 1, 0]:
         # noinspection PyTypeChecker
         ray_component = cuda.local.array(shape=(3), dtype=np.complex64)
-        i = 0  # emulate a C-style for-loop, exposing the idx increment logic
-        # ray_components[cu_ray_num,:]=0.0
-        # print(scattering_matrix.shape[0],scattering_matrix.shape[1])
-        while i < (network_index.shape[1] - 1):
-            # print(i,cu_ray_num,network_index[cu_ray_num,i],network_index[cu_ray_num,i+1])
-            if i == 0:
-                lengths = float(0)
-                lengths = calc_sep(
-                    point_information[network_index[cu_ray_num, i] - 1],
-                    point_information[network_index[cu_ray_num, i + 1] - 1],
-                    lengths,
-                )
-                if point_information[network_index[cu_ray_num, i] - 1]["Electric"]:
-                    ray_component[0] = point_information[
-                        network_index[cu_ray_num, i] - 1
-                    ]["ex"]
-                    ray_component[1] = point_information[
-                        network_index[cu_ray_num, i] - 1
-                    ]["ey"]
-                    ray_component[2] = point_information[
-                        network_index[cu_ray_num, i] - 1
-                    ]["ez"]
+        lengths = pathpolar(
+            pathstore.pathslice(nodes, path_blocks, cu_ray_num),
+            point_information,
+            ray_component,
+        )
+        polar_coefficients[cu_ray_num, 0] = ray_component[0]
+        polar_coefficients[cu_ray_num, 1] = ray_component[1]
+        polar_coefficients[cu_ray_num, 2] = ray_component[2]
+        distances[cu_ray_num] = lengths
 
-                else:
-                    source_impedance = cmath.sqrt(
-                        point_information[network_index[cu_ray_num, i] - 1][
-                            "permeability"
-                        ].real
-                        / point_information[network_index[cu_ray_num, i] - 1][
-                            "permittivity"
-                        ].real
-                    ).real
-                    # noinspection PyTypeChecker
-                    outgoing_dir = cuda.local.array(shape=(3), dtype=np.complex64)
-                    outgoing_dir = calc_dv(
-                        point_information[network_index[cu_ray_num, i] - 1],
-                        point_information[network_index[cu_ray_num, i + 1] - 1],
-                        outgoing_dir,
-                    )
-                    ray_component[0], ray_component[1], ray_component[2] = cross(
-                        point_information[network_index[cu_ray_num, i] - 1]["ex"],
-                        point_information[network_index[cu_ray_num, i] - 1]["ey"],
-                        point_information[network_index[cu_ray_num, i] - 1]["ez"],
-                        outgoing_dir[0],
-                        outgoing_dir[1],
-                        outgoing_dir[2],
-                    )
-                    ray_component[0] = ray_component[0] / source_impedance
-                    ray_component[1] = ray_component[1] / source_impedance
-                    ray_component[2] = ray_component[2] / source_impedance
-            elif i != 0:
-                # noinspection PyTypeChecker
-                normal = cuda.local.array(shape=(3), dtype=np.complex64)
-                normal[0] = point_information[network_index[cu_ray_num, i] - 1]["nx"]
-                normal[1] = point_information[network_index[cu_ray_num, i] - 1]["ny"]
-                normal[2] = point_information[network_index[cu_ray_num, i] - 1]["nz"]
-                ray_component = sourcelaunchtransformGPU(
-                    ray_component,
-                    point_information[network_index[cu_ray_num, i]],
-                    normal,
-                )
-                lengths = calc_sep(
-                    point_information[network_index[cu_ray_num, i] - 1],
-                    point_information[network_index[cu_ray_num, i + 1] - 1],
-                    lengths,
-                )
 
-            if network_index[cu_ray_num, i + 1] != 0:
-                #     #print(i,cu_ray_num,network_index[cu_ray_num,i],network_index[cu_ray_num,i+1])
-                #     #convert source point field to ray
+@cuda.jit(device=True)
+def pathpolar(path, point_information, ray_component):
+    """
+    Calculate the polarisation of the field arriving at the sink at the end of the path, before the phase and
+    spreading loss are applied, returning the total length of the path. The path ends at the last non-zero entry.
+    """
+    lengths = float(0)
+    for i in range(path.shape[0] - 1):
+        if path[i + 1] == 0:
+            # the path has ended at a sink, the rest of the row is padding
+            break
+        if i == 0:
+            lengths = calc_sep(
+                point_information[path[i] - 1],
+                point_information[path[i + 1] - 1],
+                lengths,
+            )
+            if point_information[path[i] - 1]["Electric"]:
+                ray_component[0] = point_information[path[i] - 1]["ex"]
+                ray_component[1] = point_information[path[i] - 1]["ey"]
+                ray_component[2] = point_information[path[i] - 1]["ez"]
+
+            else:
+                source_impedance = cmath.sqrt(
+                    point_information[path[i] - 1]["permeability"].real
+                    / point_information[path[i] - 1]["permittivity"].real
+                ).real
                 # noinspection PyTypeChecker
                 outgoing_dir = cuda.local.array(shape=(3), dtype=np.complex64)
                 outgoing_dir = calc_dv(
-                    point_information[network_index[cu_ray_num, i] - 1],
-                    point_information[network_index[cu_ray_num, i + 1] - 1],
+                    point_information[path[i] - 1],
+                    point_information[path[i + 1] - 1],
                     outgoing_dir,
                 )
-                ray_component = sourcelaunchtransformGPU(
-                    ray_component,
-                    point_information[network_index[cu_ray_num, i] - 1],
-                    outgoing_dir,
+                ray_component[0], ray_component[1], ray_component[2] = cross(
+                    point_information[path[i] - 1]["ex"],
+                    point_information[path[i] - 1]["ey"],
+                    point_information[path[i] - 1]["ez"],
+                    outgoing_dir[0],
+                    outgoing_dir[1],
+                    outgoing_dir[2],
                 )
+                ray_component[0] = ray_component[0] / source_impedance
+                ray_component[1] = ray_component[1] / source_impedance
+                ray_component[2] = ray_component[2] / source_impedance
 
-                ray_component[0] = (
-                    ray_component[0]
-                    * point_information[network_index[cu_ray_num, i + 1] - 1]["ex"]
-                )
-                ray_component[1] = (
-                    ray_component[1]
-                    * point_information[network_index[cu_ray_num, i + 1] - 1]["ey"]
-                )
-                ray_component[2] = (
-                    ray_component[2]
-                    * point_information[network_index[cu_ray_num, i + 1] - 1]["ez"]
-                )
+        elif i != 0:
+            # noinspection PyTypeChecker
+            normal = cuda.local.array(shape=(3), dtype=np.complex64)
+            normal[0] = point_information[path[i] - 1]["nx"]
+            normal[1] = point_information[path[i] - 1]["ny"]
+            normal[2] = point_information[path[i] - 1]["nz"]
+            ray_component = sourcelaunchtransformGPU(ray_component, normal)
+            lengths = calc_sep(
+                point_information[path[i] - 1],
+                point_information[path[i + 1] - 1],
+                lengths,
+            )
 
-            i = i + 1
+        # convert source point field to ray
+        # noinspection PyTypeChecker
+        outgoing_dir = cuda.local.array(shape=(3), dtype=np.complex64)
+        outgoing_dir = calc_dv(
+            point_information[path[i] - 1],
+            point_information[path[i + 1] - 1],
+            outgoing_dir,
+        )
+        ray_component = sourcelaunchtransformGPU(ray_component, outgoing_dir)
+        ray_component[0] = ray_component[0] * point_information[path[i + 1] - 1]["ex"]
+        ray_component[1] = ray_component[1] * point_information[path[i + 1] - 1]["ey"]
+        ray_component[2] = ray_component[2] * point_information[path[i + 1] - 1]["ez"]
 
-        polar_coefficients[cu_ray_num, 0] = ray_component[0]
-        polar_coefficients[cu_ray_num, 1] = ray_component[1]
-        polar_coefficients[cu_ray_num, 2] = ray_component[2]
-        distances[cu_ray_num] = lengths
+    return lengths
+
+
+@cuda.jit(device=True)
+def freqdomainpath(path, point_information, wavelength, ray_component):
+    """
+    Calculate the field arriving at the sink at the end of the path, including the phase and spreading loss, shared by
+    the frequency domain kernels.
+    """
+    lengths = pathpolar(path, point_information, ray_component)
+    wave_vector = (2.0 * cmath.pi) / wavelength
+    loss = cmath.exp(lengths * wave_vector * 1j) * (
+        wavelength / (4 * cmath.pi * lengths)
+    )
+    ray_component[0] *= loss
+    ray_component[1] *= loss
+    ray_component[2] *= loss
+    return ray_component
 
 
 @cuda.jit
 def freqdomainkernal(
-    network_index, point_information, source_sink_index, wavelength, scattering_network
+    nodes, path_blocks, point_information, source_sink_index, wavelength, scattering_network
 ):
 
     cu_ray_num = cuda.grid(1)  # alias for threadIdx.x + ( blockIdx.x * blockDim.x ),
     #           threadIdx.y + ( blockIdx.y * blockDim.y )
     # margin=1e-5
-    if cu_ray_num < network_index.shape[0]:
+    if cu_ray_num < path_blocks[path_blocks.shape[0] - 1, 0]:
         # noinspection PyTypeChecker
         ray_component = cuda.local.array(shape=(3), dtype=np.complex128)
         # ray_components[cu_ray_num,:]=0.0
         # print(scattering_matrix.shape[0],scattering_matrix.shape[1])
-        for i in range(network_index.shape[1] - 1):
-            # print(i,cu_ray_num,network_index[cu_ray_num,i],network_index[cu_ray_num,i+1])
-            if i == 0:
-                lengths = float(0)
-                lengths = calc_sep(
-                    point_information[network_index[cu_ray_num, i] - 1],
-                    point_information[network_index[cu_ray_num, i + 1] - 1],
-                    lengths,
-                )
-                if point_information[network_index[cu_ray_num, i] - 1]["Electric"]:
-                    ray_component[0] = point_information[
-                        network_index[cu_ray_num, i] - 1
-                    ]["ex"]
-                    ray_component[1] = point_information[
-                        network_index[cu_ray_num, i] - 1
-                    ]["ey"]
-                    ray_component[2] = point_information[
-                        network_index[cu_ray_num, i] - 1
-                    ]["ez"]
-
-                else:
-                    source_impedance = cmath.sqrt(
-                        point_information[network_index[cu_ray_num, i] - 1][
-                            "permeability"
-                        ].real
-                        / point_information[network_index[cu_ray_num, i] - 1][
-                            "permittivity"
-                        ].real
-                    ).real
-                    # noinspection PyTypeChecker
-                    outgoing_dir = cuda.local.array(shape=(3), dtype=np.complex64)
-                    outgoing_dir = calc_dv(
-                        point_information[network_index[cu_ray_num, i] - 1],
-                        point_information[network_index[cu_ray_num, i + 1] - 1],
-                        outgoing_dir,
-                    )
-                    ray_component[0], ray_component[1], ray_component[2] = cross(
-                        point_information[network_index[cu_ray_num, i] - 1]["ex"],
-                        point_information[network_index[cu_ray_num, i] - 1]["ey"],
-                        point_information[network_index[cu_ray_num, i] - 1]["ez"],
-                        outgoing_dir[0],
-                        outgoing_dir[1],
-                        outgoing_dir[2],
-                    )
-                    ray_component[0] = ray_component[0] / source_impedance
-                    ray_component[1] = ray_component[1] / source_impedance
-                    ray_component[2] = ray_component[2] / source_impedance
-
-            elif i != 0:
-                # noinspection PyTypeChecker
-                normal = cuda.local.array(shape=(3), dtype=np.complex64)
-                normal[0] = point_information[network_index[cu_ray_num, i] - 1]["nx"]
-                normal[1] = point_information[network_index[cu_ray_num, i] - 1]["ny"]
-                normal[2] = point_information[network_index[cu_ray_num, i] - 1]["nz"]
-                ray_component = sourcelaunchtransformGPU(ray_component, normal)
-                lengths = calc_sep(
-                    point_information[network_index[cu_ray_num, i] - 1],
-                    point_information[network_index[cu_ray_num, i + 1] - 1],
-                    lengths,
-                )
-
-            if network_index[cu_ray_num, i + 1] != 0:
-                #     #print(i,cu_ray_num,network_index[cu_ray_num,i],network_index[cu_ray_num,i+1])
-                #     #convert source point field to ray
-                # noinspection PyTypeChecker
-                outgoing_dir = cuda.local.array(shape=(3), dtype=np.complex64)
-                outgoing_dir = calc_dv(
-                    point_information[network_index[cu_ray_num, i] - 1],
-                    point_information[network_index[cu_ray_num, i + 1] - 1],
-                    outgoing_dir,
-                )
-                ray_component = sourcelaunchtransformGPU(ray_component, outgoing_dir)
-
-                ray_component[0] = (
-                    ray_component[0]
-                    * point_information[network_index[cu_ray_num, i + 1] - 1]["ex"]
-                )
-                ray_component[1] = (
-                    ray_component[1]
-                    * point_information[network_index[cu_ray_num, i + 1] - 1]["ey"]
-                )
-                ray_component[2] = (
-                    ray_component[2]
-                    * point_information[network_index[cu_ray_num, i + 1] - 1]["ez"]
-                )
-                scatter_index = i
-
-        # print(cu_ray_num,source_sink_index[cu_ray_num,0],source_sink_index[cu_ray_num,1])
-        wave_vector = (2.0 * cmath.pi) / wavelength
-        # scatter_coefficient=(1/(4*cmath.pi))**(complex(scatter_index))
-        if scatter_index == 0:
-            loss = cmath.exp(lengths * wave_vector * 1j) * (
-                wavelength / (4 * cmath.pi * lengths)
-            )
-        elif scatter_index == 1:
-            loss = cmath.exp(lengths * wave_vector * 1j) * (
-                wavelength / (4 * cmath.pi * lengths)
-            )
-        elif scatter_index == 2:
-            loss = cmath.exp(lengths * wave_vector * 1j) * (
-                wavelength / (4 * cmath.pi * lengths)
-            )
-
-        ray_component[0] *= loss
-        ray_component[1] *= loss
-        ray_component[2] *= loss
+        freqdomainpath(
+            pathstore.pathslice(nodes, path_blocks, cu_ray_num),
+            point_information,
+            wavelength,
+            ray_component,
+        )
         # print(ray_component[0].real,ray_component[1].real,ray_component[2].real)
         # add real components
         cuda.atomic.add(
@@ -1205,6 +1119,186 @@ def freqdomainkernal(
         )
 
 
+@cuda.jit
+def freqdomainpathkernal(
+    nodes, path_blocks, point_information, wavelength, path_fields
+):
+    """
+    Variant of :func:`freqdomainkernal` storing the field arriving at the sink for each path in path_fields, so the
+    paths can be summed by :func:`segmentsumkernal` without atomic operations. The field is calculated in double
+    precision, and only rounded to the precision of path_fields when it is stored.
+    """
+    cu_ray_num = cuda.grid(1)
+    if cu_ray_num < path_blocks[path_blocks.shape[0] - 1, 0]:
+        # noinspection PyTypeChecker
+        ray_component = cuda.local.array(shape=(3), dtype=np.complex128)
+        freqdomainpath(
+            pathstore.pathslice(nodes, path_blocks, cu_ray_num),
+            point_information,
+            wavelength,
+            ray_component,
+        )
+        path_fields[cu_ray_num, 0] = ray_component[0]
+        path_fields[cu_ray_num, 1] = ray_component[1]
+        path_fields[cu_ray_num, 2] = ray_component[2]
+
+
+@cuda.jit
+def segmentsumkernal(path_fields, order, offsets, segment_sums):
+    """
+    Compensated (Kahan) summation of the path fields for each (source, sink) pair, with one thread for each pair. The
+    paths of each pair are the entries of order between consecutive offsets.
+    """
+    segment = cuda.grid(1)
+    if segment < segment_sums.shape[0]:
+        for axis in range(3):
+            total = path_fields[order[offsets[segment]], axis]
+            compensation = total - total
+            for entry in range(offsets[segment] + 1, offsets[segment + 1]):
+                value = path_fields[order[entry], axis] - compensation
+                running = total + value
+                compensation = (running - total) - value
+                total = running
+            segment_sums[segment, axis] = total
+
+
+@njit(cache=True, nogil=True)
+def sourcelaunchtransformCPU(ray_field, dx, dy, dz):
+    """
+    CPU equivalent of :func:`sourcelaunchtransformGPU`, removing the component of the field parallel to the direction
+    (dx, dy, dz), with the ray axes locked to the global axis most orthogonal to the direction.
+    """
+    # the magnitude of the cross product of each global axis with the direction
+    x_orth = math.sqrt(dz ** 2 + dy ** 2)
+    y_orth = math.sqrt(dz ** 2 + dx ** 2)
+    z_orth = math.sqrt(dy ** 2 + dx ** 2)
+    if (x_orth > y_orth) and (x_orth > z_orth):
+        ux, uy, uz = 0.0, -dz, dy
+    elif (y_orth >= x_orth) and (y_orth > z_orth):
+        ux, uy, uz = dz, 0.0, -dx
+    else:
+        ux, uy, uz = -dy, dx, 0.0
+    u_norm = math.sqrt(ux ** 2 + uy ** 2 + uz ** 2)
+    ux, uy, uz = ux / u_norm, uy / u_norm, uz / u_norm
+    vx = dy * uz - dz * uy
+    vy = dz * ux - dx * uz
+    vz = dx * uy - dy * ux
+    v_norm = math.sqrt(vx ** 2 + vy ** 2 + vz ** 2)
+    vx, vy, vz = vx / v_norm, vy / v_norm, vz / v_norm
+    e_u = ray_field[0] * ux + ray_field[1] * uy + ray_field[2] * uz
+    e_v = ray_field[0] * vx + ray_field[1] * vy + ray_field[2] * vz
+    ray_field[0] = e_u * ux + e_v * vx
+    ray_field[1] = e_u * uy + e_v * vy
+    ray_field[2] = e_u * uz + e_v * vz
+    return ray_field
+
+
+@njit(cache=True, nogil=True)
+def pathpolarCPU(path, point_information, ray_component):
+    """
+    Calculate the polarisation of the field arriving at the sink at the end of a single path, before the phase and
+    spreading loss are applied, following the same steps as :func:`freqdomainkernal`. The path ends at the last
+    non-zero entry, and the total path length and the index of the sink are returned.
+    """
+    lengths = 0.0
+    terminal = 0
+    for i in range(path.shape[0] - 1):
+        if path[i + 1] == 0:
+            # the path has ended at a sink, the rest of the row is padding
+            break
+        start = point_information[path[i] - 1]
+        end = point_information[path[i + 1] - 1]
+        dx = np.float64(end["px"]) - start["px"]
+        dy = np.float64(end["py"]) - start["py"]
+        dz = np.float64(end["pz"]) - start["pz"]
+        separation = math.sqrt(dx ** 2 + dy ** 2 + dz ** 2)
+        dx, dy, dz = dx / separation, dy / separation, dz / separation
+        if i == 0:
+            if start["Electric"]:
+                ray_component[0] = start["ex"]
+                ray_component[1] = start["ey"]
+                ray_component[2] = start["ez"]
+            else:
+                source_impedance = math.sqrt(
+                    start["permeability"].real / start["permittivity"].real
+                )
+                ray_component[0] = (start["ey"] * dz - start["ez"] * dy) / source_impedance
+                ray_component[1] = (start["ez"] * dx - start["ex"] * dz) / source_impedance
+                ray_component[2] = (start["ex"] * dy - start["ey"] * dx) / source_impedance
+        else:
+            # convert the incident field to the surface current at the scattering point
+            sourcelaunchtransformCPU(
+                ray_component,
+                np.float64(start["nx"]),
+                np.float64(start["ny"]),
+                np.float64(start["nz"]),
+            )
+        lengths += separation
+        # convert the field to a ray towards the next point
+        sourcelaunchtransformCPU(ray_component, dx, dy, dz)
+        ray_component[0] = ray_component[0] * end["ex"]
+        ray_component[1] = ray_component[1] * end["ey"]
+        ray_component[2] = ray_component[2] * end["ez"]
+        terminal = i + 1
+
+    return lengths, path[terminal]
+
+
+@njit(cache=True, nogil=True)
+def freqdomainpathCPU(path, point_information, wavelength, ray_component):
+    """
+    Calculate the field arriving at the sink at the end of a single path, following the same steps as
+    :func:`freqdomainkernal`. The path ends at the last non-zero entry, and returns the index of the sink.
+    """
+    lengths, sink = pathpolarCPU(path, point_information, ray_component)
+    wave_vector = (2.0 * cmath.pi) / wavelength
+    loss = cmath.exp(lengths * wave_vector * 1j) * (wavelength / (4 * cmath.pi * lengths))
+    ray_component[0] *= loss
+    ray_component[1] *= loss
+    ray_component[2] *= loss
+    return sink
+
+
+@njit(parallel=True, nogil=True, cache=True)
+def polaranddistanceCPU(
+    nodes, path_blocks, point_information, polar_coefficients, distances
+):
+    """
+    CPU equivalent of :func:`polaranddistance`, recording the polarisation coefficients and total length of each path.
+    """
+    for ray in prange(path_blocks[path_blocks.shape[0] - 1, 0]):
+        ray_component = np.zeros((3), dtype=np.complex128)
+        lengths, _ = pathpolarCPU(
+            pathstore.pathsliceCPU(nodes, path_blocks, ray),
+            point_information,
+            ray_component,
+        )
+        for axis in range(3):
+            polar_coefficients[ray, axis] = ray_component[axis]
+        distances[ray] = lengths
+
+
+@njit(parallel=True, nogil=True, cache=True)
+def freqdomainkernalCPU(
+    nodes, path_blocks, point_information, source_num, wavelength, partial_networks
+):
+    """
+    CPU equivalent of :func:`freqdomainkernal`. The paths are divided into contiguous blocks, one for each partial
+    scattering network, so each thread accumulates into its own network without atomic operations. The partial
+    networks are summed by the caller.
+    """
+    blocks = partial_networks.shape[0]
+    ray_num = path_blocks[path_blocks.shape[0] - 1, 0]
+    for block in prange(blocks):
+        ray_component = np.zeros((3), dtype=np.complex128)
+        for ray in range(block * ray_num // blocks, (block + 1) * ray_num // blocks):
+            path = pathstore.pathsliceCPU(nodes, path_blocks, ray)
+            sink = freqdomainpathCPU(path, point_information, wavelength, ray_component)
+            source = path[0] - 1
+            for axis in range(3):
+                partial_networks[block, source, sink - source_num - 1, axis] += ray_component[axis]
+
+
 @cuda.jit
 def freqdomainisokernal(
     network_index, point_information, source_sink_index, wavelength, scattering_network
@@ -1489,6 +1583,32 @@ def timedomainkernal(
                 index += 1
 
 
+@cuda.jit
+def timedomaintapkernal(
+    nodes, path_blocks, point_information, time_delays, wavelength, amplitudes, arrival_times
+):
+    """
+    Calculate the tap of the channel impulse response for each path, the amplitude of the field arriving at the sink
+    and the arrival time, following the same steps as :func:`timedomainkernal` without convolving the excitation. The
+    excitation of each point in point_information should be real, with the time delay of each point in time_delays.
+    """
+    cu_ray_num = cuda.grid(1)
+    if cu_ray_num < path_blocks[path_blocks.shape[0] - 1, 0]:
+        # noinspection PyTypeChecker
+        ray_component = cuda.local.array(shape=(3), dtype=np.complex128)
+        path = pathstore.pathslice(nodes, path_blocks, cu_ray_num)
+        lengths = pathpolar(path, point_information, ray_component)
+        loss = wavelength / (4 * cmath.pi * lengths)
+        time_delay = float(0)
+        for i in range(path.shape[0]):
+            if path[i] != 0:
+                time_delay += time_delays[path[i] - 1]
+        amplitudes[cu_ray_num, 0] = ray_component[0].real * loss
+        amplitudes[cu_ray_num, 1] = ray_component[1].real * loss
+        amplitudes[cu_ray_num, 2] = ray_component[2].real * loss
+        arrival_times[cu_ray_num] = (lengths / scipy.constants.c) + time_delay
+
+
 @cuda.jit(device=True)
 def xyztothetaphivectors(ray_component, point_information):
     # assuming a prime vector along the z axis
@@ -2041,25 +2161,158 @@ def EMGPUSummation(scattering_matrix, full_rays, depth_slice, source_index):
 #    return
 
 
-def EMGPUJointPathLengthandPolar(source_num, sink_num, full_index, point_information):
+@njit(parallel=True, nogil=True, cache=True)
+def freqdomainpathkernalCPU(nodes, path_blocks, point_information, wavelength, path_fields):
     """
-    wrapper for the GPU EM processer, outputting the resultant ray components as lengths, allowing for the whole thing to be sorted again.
-    At present, the indexing only supports processing the rays for line of sight and single bounce, but that will be sorted quite quickly
-    Parameters
-    ----------
-    full_index : int array
-        index of all successful rays
-    point_information : TYPE
-        DESCRIPTION.
-    wavelength : TYPE
-        DESCRIPTION.
+    CPU equivalent of :func:`freqdomainpathkernal`, storing the field arriving at the sink for each path.
+    """
+    for ray in prange(path_blocks[path_blocks.shape[0] - 1, 0]):
+        ray_component = np.zeros((3), dtype=np.complex128)
+        freqdomainpathCPU(
+            pathstore.pathsliceCPU(nodes, path_blocks, ray),
+            point_information,
+            wavelength,
+            ray_component,
+        )
+        for axis in range(3):
+            path_fields[ray, axis] = ray_component[axis]
+
+
+@njit(parallel=True, nogil=True, cache=True)
+def segmentsumCPU(path_fields, order, offsets, segment_sums):
+    """
+    CPU equivalent of :func:`segmentsumkernal`, the compensated (Kahan) summation of the path fields for each
+    (source, sink) pair.
+    """
+    for segment in prange(segment_sums.shape[0]):
+        for axis in range(3):
+            total = path_fields[order[offsets[segment]], axis]
+            compensation = total - total
+            for entry in range(offsets[segment] + 1, offsets[segment + 1]):
+                value = path_fields[order[entry], axis] - compensation
+                running = total + value
+                compensation = (running - total) - value
+                total = running
+            segment_sums[segment, axis] = total
+
+
+@njit(parallel=True, nogil=True, cache=True)
+def timedomaintapkernalCPU(
+    nodes, path_blocks, point_information, time_delays, wavelength, amplitudes, arrival_times
+):
+    """
+    CPU equivalent of :func:`timedomaintapkernal`, calculating the amplitude and arrival time of each path.
+    """
+    for ray in prange(path_blocks[path_blocks.shape[0] - 1, 0]):
+        ray_component = np.zeros((3), dtype=np.complex128)
+        path = pathstore.pathsliceCPU(nodes, path_blocks, ray)
+        lengths, _ = pathpolarCPU(path, point_information, ray_component)
+        loss = wavelength / (4 * math.pi * lengths)
+        time_delay = 0.0
+        for i in range(path.shape[0]):
+            if path[i] != 0:
+                time_delay += time_delays[path[i] - 1]
+        for axis in range(3):
+            amplitudes[ray, axis] = ray_component[axis].real * loss
+        arrival_times[ray] = (lengths / scipy.constants.c) + time_delay
+
+
+def path_pairs(source_num, sink_num, full_index):
+    """
+    The flattened (source, sink) pair of each path, source * sink_num + sink, counting both from zero.
+
+    Parameters
+    ----------
+    source_num : int
+        the number of source points
+    sink_num : int
+        the number of sink points
+    full_index : int array
+        index of all successful rays
 
     Returns
     -------
-    resultant_rays : TYPE
-        DESCRIPTION.
+    pairs : numpy array of int
+        the (source, sink) pair of each path
+    """
+    depth_slice, _ = targettingindex(full_index)
+    depth_slice = depth_slice.astype(np.int64)
+    return (depth_slice[:, 0] - 1) * sink_num + (depth_slice[:, 1] - source_num - 1)
+
+
+def path_segments(pairs):
+    """
+    Group the paths by (source, sink) pair, with a stable sort, so each pair can be summed independently.
+
+    Parameters
+    ----------
+    pairs : numpy array of int
+        the (source, sink) pair of each path, from :func:`path_pairs`
 
+    Returns
+    -------
+    order : numpy array of int
+        the paths sorted by pair
+    offsets : numpy array of int
+        the start of each pair in order, followed by the number of paths
+    segment_pairs : numpy array of int
+        the pair of each segment
+    """
+    order = np.argsort(pairs, kind="stable")
+    segment_pairs, starts = np.unique(pairs[order], return_index=True)
+    offsets = np.append(starts, pairs.shape[0]).astype(np.int64)
+    return order.astype(np.int64), offsets, segment_pairs
+
+
+def EMGPUJointPathLengthandPolar(
+    source_num, sink_num, full_index, point_information, scene=None, backend=None
+):
     """
+    wrapper for the GPU EM processer, outputting the resultant ray components as lengths, allowing for the whole thing to be sorted again.
+    The polarisation coefficients do not include the phase or spreading loss, so the same paths can be evaluated at any
+    wavelength with :func:`EMFrequencySweep`.
+
+    Parameters
+    ----------
+    source_num : int
+        the number of source points
+    sink_num : int
+        the number of sink points
+    full_index : int array or :class:`lyceanem.raycasting.pathstore.path_store`
+        index of all successful rays
+    point_information : :type:`lyceanem.base_types.scattering_point`
+        the point information for all sources, sinks and scattering points
+    scene : :class:`lyceanem.raycasting.rayfunctions.raycasting_scene`
+        the scene used for raycasting, defaults to [None]
+    backend : str
+        the backend, either 'cuda' or 'cpu', defaults to [None], using the backend of the scene if provided, otherwise
+        using the GPU if a CUDA device is available, and the Numba parallel CPU kernel otherwise
+
+    Returns
+    -------
+    path_lengths : numpy array of float
+        the total length of each path
+    polar_coefficients : n by 3 numpy array of complex
+        the polarisation coefficients of the field arriving at the sink for each path
+
+    """
+    if scene is not None:
+        backend = scene.backend
+    else:
+        backend = RF.raycasting_backend(backend)
+    nodes, path_blocks = pathstore.path_arrays(full_index)
+    if backend == "cpu":
+        path_lengths = np.zeros((full_index.shape[0]), dtype=np.float64)
+        polar_coefficients = np.zeros((full_index.shape[0], 3), dtype=np.complex128)
+        polaranddistanceCPU(
+            nodes,
+            path_blocks,
+            point_information,
+            polar_coefficients,
+            path_lengths,
+        )
+        return path_lengths, polar_coefficients
+
     # cuda.select_device(0)
     # network_index,point_information,ray_components
     ray_num = full_index.shape[0]
@@ -2068,20 +2321,19 @@ def EMGPUJointPathLengthandPolar(source_num, sink_num, full_index, point_informa
     maximum_chunk_size = 2 ** 8
     path_lengths = np.zeros((ray_num), dtype=np.float32)
     polar_coefficients = np.ones((ray_num, 3), dtype=np.complex64)
-    d_point_information = cuda.device_array(
-        point_information.shape[0], dtype=base_types.scattering_t
-    )
-    d_point_information = cuda.to_device(point_information)
+    if scene is None:
+        d_point_information = cuda.to_device(point_information)
+    else:
+        d_point_information = scene.set_point_information(point_information)
     # divide in terms of a block for each source, then
 
-    d_full_index = cuda.device_array(
-        (full_index.shape[0], full_index.shape[1]), dtype=np.int64
-    )
+    # the paths are uploaded in the compact layout, without conversion to int64
+    d_nodes = cuda.to_device(nodes)
+    d_path_blocks = cuda.to_device(path_blocks)
     # d_paths=cuda.device_array((path_lengths.shape[0]),dtype=np.float32)
     # d_polar_c=cuda.device_array((polar_coefficients.shape),dtype=np.complex64)
     paths = cp.zeros((path_lengths.shape[0]), dtype=np.float32)
     polar_c = cp.zeros((polar_coefficients.shape), dtype=np.complex64)
-    d_full_index = cuda.to_device(full_index)
     # Here, we choose the granularity of the threading on our device. We want
     # to try to cover the entire workload of rays and targets with simulatenous threads, so we'll
     # choose a grid of (source_num/16. target_num/16) blocks, each with (16, 16) threads
@@ -2091,7 +2343,9 @@ def EMGPUJointPathLengthandPolar(source_num, sink_num, full_index, point_informa
     # print(grids,' blocks, ',threads,' threads')
     # Execute the kernel
     # cuda.profile_start()
-    polaranddistance[grids, threads](d_full_index, d_point_information, polar_c, paths)
+    polaranddistance[grids, threads](
+        d_nodes, d_path_blocks, d_point_information, polar_c, paths
+    )
     # cuda.profile_stop()
     # ray_components[ray_chunks[n]:ray_chunks[n+1],:]=d_scatter_matrix.copy_to_host()
     # distmap[source_chunks[n]:source_chunks[n+1],target_chunks[m]:target_chunks[m+1]] = d_distmap_chunked.copy_to_host()
@@ -2108,10 +2362,101 @@ def EMGPUJointPathLengthandPolar(source_num, sink_num, full_index, point_informa
     return path_lengths, polar_coefficients
 
 
-def EMGPUFreqDomain(source_num, sink_num, full_index, point_information, wavelength):
+def EMFrequencySweep(
+    source_num, sink_num, full_index, path_lengths, polar_coefficients, wavelengths
+):
     """
-    Wrapper for the GPU EM processer
-    At present, the indexing only supports processing the rays for line of sight and single or double bounces
+    Evaluate the scattering network at each wavelength from the path lengths and polarisation coefficients of
+    :func:`EMGPUJointPathLengthandPolar`, so the raycasting and polarisation only need to be calculated once for a
+    frequency sweep. The phase and spreading loss of every path are calculated for a block of wavelengths at a time,
+    and summed into the network with a sparse path to (source, sink) matrix.
+
+    Parameters
+    ----------
+    source_num : int
+        the number of source points
+    sink_num : int
+        the number of sink points
+    full_index : int array
+        index of all successful rays
+    path_lengths : numpy array of float
+        the total length of each path
+    polar_coefficients : n by 3 numpy array of complex
+        the polarisation coefficients of each path
+    wavelengths : 1D numpy array of float
+        the wavelengths of interest
+
+    Returns
+    -------
+    scattering_network : numpy array of complex
+        the scattering network for each wavelength, with shape (wavelengths, source_num, sink_num, 3)
+    """
+    wavelengths = np.atleast_1d(np.asarray(wavelengths, dtype=np.float64))
+    ray_num = full_index.shape[0]
+    scattering_network = np.zeros(
+        (wavelengths.shape[0], source_num, sink_num, 3), dtype=np.complex128
+    )
+    if ray_num == 0:
+        return scattering_network
+    pairs = path_pairs(source_num, sink_num, full_index)
+    path_map = scipy.sparse.csr_matrix(
+        (np.ones(ray_num), (pairs, np.arange(ray_num))),
+        shape=(source_num * sink_num, ray_num),
+    )
+    lengths = np.asarray(path_lengths, dtype=np.float64)
+    polar = np.asarray(polar_coefficients, dtype=np.complex128)
+    block = int(max(1, CPU_ACCUMULATOR_BYTES // (ray_num * 3 * 16)))
+    for start in range(0, wavelengths.shape[0], block):
+        block_wavelengths = wavelengths[start : start + block].reshape(1, -1)
+        loss = np.exp(1j * (2.0 * np.pi / block_wavelengths) * lengths.reshape(-1, 1)) * (
+            block_wavelengths / (4 * np.pi * lengths.reshape(-1, 1))
+        )
+        rays = (polar[:, np.newaxis, :] * loss[:, :, np.newaxis]).reshape(ray_num, -1)
+        scattering_network[start : start + block] = np.moveaxis(
+            (path_map @ rays).reshape(source_num, sink_num, -1, 3), 2, 0
+        )
+    return scattering_network
+
+
+def apply_transfer_tensor(transfer_tensor, weights):
+    """
+    Apply source excitations to a transfer tensor, such as the tensor from
+    :func:`lyceanem.models.frequency_domain.calculate_transfer_tensor`.
+
+    Parameters
+    ----------
+    transfer_tensor : numpy array of complex
+        the transfer tensor, with shape (..., sources, sinks, 3, 3)
+    weights : numpy array of complex
+        the excitation vector of each source, with shape (sources, 3), or (..., sources, 3) for a set of excitations
+
+    Returns
+    -------
+    scattering_network : numpy array of complex
+        the field at each sink from each source, with shape (..., sources, sinks, 3)
+    """
+    return np.einsum("...skij,...sj->...ski", transfer_tensor, weights)
+
+
+def EMGPUFreqDomain(
+    source_num,
+    sink_num,
+    full_index,
+    point_information,
+    wavelength,
+    scene=None,
+    backend=None,
+    precision="double",
+    accumulator="segment",
+):
+    """
+    Wrapper for the GPU EM processer, or the CPU equivalent :func:`EMCPUFreqDomain` if there is no CUDA device
+    The indexing supports paths with any number of scatters
+    By default, the field of each path is stored, then the paths are sorted by (source, sink) pair and each pair is
+    summed independently with compensated summation (:func:`EMGPUFreqDomainSegmented`), rather than adding each path
+    into the scattering network with atomic operations, which serialise when many paths arrive at the same sink.
+    In single precision, the path fields and the scattering network are stored as complex64, halving the memory traffic
+    of the summation, while the field of each path is still calculated in double precision.
 
     Parameters
     -----------
@@ -2119,7 +2464,7 @@ def EMGPUFreqDomain(source_num, sink_num, full_index, point_information, wavelen
         the number of source points
     sink_num : (int)
         the number of sink points
-    full_index : (2D numpy array of ints)
+    full_index : (2D numpy array of ints or :class:`lyceanem.raycasting.pathstore.path_store`)
         index of all successful rays
     point_information : :type:`lyceanem.base_types.scattering_point`
         the point information contains the amplitude exciation for the sources, and the positions and normal vectors for
@@ -2127,6 +2472,20 @@ def EMGPUFreqDomain(source_num, sink_num, full_index, point_information, wavelen
          there is only freespace and metal interacting.
     wavelength : (float)
         the wavelength of interest
+    scene : :class:`lyceanem.raycasting.rayfunctions.raycasting_scene`
+        the scene used for raycasting, the point information is kept resident on the GPU and only uploaded if it has
+        changed, defaults to [None]
+    backend : str
+        the backend, either 'cuda' or 'cpu', defaults to [None], using the backend of the scene if provided, otherwise
+        using the GPU if a CUDA device is available, and the Numba parallel CPU kernel otherwise
+    precision : str
+        the precision of the stored path fields and the scattering network, either 'double' for complex128 or 'single'
+        for complex64, defaults to ['double']. The field of each path is always calculated in double precision, so
+        single precision only reduces the storage and the memory traffic of the summation, not the path arithmetic
+    accumulator : str
+        the method of summing the paths, either 'segment' for the sorted segmented sum, or 'scatter' to add each path
+        directly into the scattering network, with atomic operations on the GPU, defaults to ['segment']. The
+        'scatter' accumulator only supports double precision
 
     Returns
     -------
@@ -2134,6 +2493,32 @@ def EMGPUFreqDomain(source_num, sink_num, full_index, point_information, wavelen
         the resultant scattering network for the provided ray paths
 
     """
+    check_accumulation(precision, accumulator)
+    if scene is not None:
+        backend = scene.backend
+    else:
+        backend = RF.raycasting_backend(backend)
+    if backend == "cpu":
+        return EMCPUFreqDomain(
+            source_num,
+            sink_num,
+            full_index,
+            point_information,
+            wavelength,
+            precision=precision,
+            accumulator=accumulator,
+        )
+    if accumulator == "segment":
+        return EMGPUFreqDomainSegmented(
+            source_num,
+            sink_num,
+            full_index,
+            point_information,
+            wavelength,
+            scene=scene,
+            precision=precision,
+        )
+
     free_mem, total_mem = cuda.current_context().get_memory_info()
     max_mem = np.ceil(free_mem * 0.5).astype(int)
 
@@ -2152,30 +2537,26 @@ def EMGPUFreqDomain(source_num, sink_num, full_index, point_information, wavelen
         dtype=np.complex64,
     )
     d_scattering_network = cuda.to_device(scattering_network)
-    d_point_information = cuda.device_array(
-        point_information.shape[0], dtype=base_types.scattering_t
-    )
-    d_point_information = cuda.to_device(point_information)
+    if scene is None:
+        d_point_information = cuda.to_device(point_information)
+    else:
+        d_point_information = scene.set_point_information(point_information)
     d_wavelength = cuda.device_array((1), dtype=np.complex64)
     d_wavelength = cuda.to_device(
         np.csingle(np.ones((1), dtype=np.complex64) * wavelength)
     )
     # divide in terms of a block for each source, then
-    depthslice, _ = targettingindex(copy.deepcopy(full_index))
+    depthslice, _ = targettingindex(full_index)
     depthslice[:, 0] -= 1
     depthslice[:, 1] -= source_num + 1
     d_target_index = cuda.device_array(
         (depthslice.shape[0], depthslice.shape[1]), dtype=np.int64
     )
     d_target_index = cuda.to_device(depthslice)
-    d_full_index = cuda.device_array(
-        (full_index.shape[0], full_index.shape[1]), dtype=np.int64
-    )
-    # d_paths=cuda.device_array((path_lengths.shape[0]),dtype=np.float32)
-    # d_polar_c=cuda.device_array((polar_coefficients.shape),dtype=np.complex64)
-    # paths=cp.zeros((path_lengths.shape[0]),dtype=np.float32)
-    # polar_c=cp.zeros((polar_coefficients.shape),dtype=np.complex64)
-    d_full_index = cuda.to_device(full_index)
+    # the paths are uploaded in the compact layout, without conversion to int64
+    nodes, path_blocks = pathstore.path_arrays(full_index)
+    d_nodes = cuda.to_device(nodes)
+    d_path_blocks = cuda.to_device(path_blocks)
     # Here, we choose the granularity of the threading on our device. We want
     # to try to cover the entire workload of rays and targets with simulatenous threads, so we'll
     # choose a grid of (source_num/16. target_num/16) blocks, each with (16, 16) threads
@@ -2186,8 +2567,9 @@ def EMGPUFreqDomain(source_num, sink_num, full_index, point_information, wavelen
     # Execute the kernel
     # cuda.profile_start()
     freqdomainkernal[grids, threads](
-        d_full_index,
-        point_information,
+        d_nodes,
+        d_path_blocks,
+        d_point_information,
         d_target_index,
         wavelength,
         d_scattering_network,
@@ -2201,7 +2583,7 @@ def EMGPUFreqDomain(source_num, sink_num, full_index, point_information, wavelen
     # chunks=np.linspace(0,path_lengths.shape[0],math.ceil(path_lengths.shape[0]/maximum_chunk_size)+1,dtype=np.int32)
     # for n in range(chunks.shape[0]-1):
     # polar_coefficients=d_polar_c.copy_to_host()
-    scattering_network = cp.asnumpy(d_scattering_network)
+    scattering_network = d_scattering_network.copy_to_host()
     scattering_network_comp = scattering_network.view(dtype=np.complex128)[..., 0]
     # scattering_network_comp = scattering_network[:, :, :, 0] + scattering_network[:, :, :, 1] * 1j
     # path_lengths=d_paths.copy_to_host()
@@ -2210,6 +2592,176 @@ def EMGPUFreqDomain(source_num, sink_num, full_index, point_information, wavelen
     return scattering_network_comp
 
 
+def check_accumulation(precision, accumulator):
+    """
+    Check the precision and accumulator of the frequency domain kernels are supported.
+    """
+    if precision not in PRECISIONS:
+        raise ValueError(
+            "precision must be 'double' or 'single', not {}".format(precision)
+        )
+    if accumulator not in ACCUMULATORS:
+        raise ValueError(
+            "accumulator must be 'segment' or 'scatter', not {}".format(accumulator)
+        )
+    if accumulator == "scatter" and precision != "double":
+        raise ValueError("the scatter accumulator only supports double precision")
+
+
+def EMGPUFreqDomainSegmented(
+    source_num,
+    sink_num,
+    full_index,
+    point_information,
+    wavelength,
+    scene=None,
+    precision="double",
+):
+    """
+    Sort and segment GPU EM processer for :func:`EMGPUFreqDomain`. The field of each path is stored, then the paths are
+    sorted by (source, sink) pair and each pair is summed by a separate thread with compensated summation, without
+    atomic operations.
+
+    Parameters
+    -----------
+    source_num : (int)
+        the number of source points
+    sink_num : (int)
+        the number of sink points
+    full_index : (2D numpy array of ints or :class:`lyceanem.raycasting.pathstore.path_store`)
+        index of all successful rays
+    point_information : :type:`lyceanem.base_types.scattering_point`
+        the point information for all sources, sinks and scattering points
+    wavelength : (float)
+        the wavelength of interest
+    scene : :class:`lyceanem.raycasting.rayfunctions.raycasting_scene`
+        the scene used for raycasting, defaults to [None]
+    precision : str
+        the precision of the stored path fields and the scattering network, either 'double' for complex128 or 'single'
+        for complex64, defaults to ['double']. The field of each path is always calculated in double precision, so
+        single precision only reduces the storage and the memory traffic of the summation, not the path arithmetic
+
+    Returns
+    -------
+    scattering_network_comp : (3D numpy array, complex)
+        the resultant scattering network for the provided ray paths
+
+    """
+    dtype = PRECISIONS[precision]
+    threads_in_block = 256
+    scattering_network = np.zeros((source_num * sink_num, 3), dtype=dtype)
+    if full_index.shape[0] == 0:
+        return scattering_network.reshape(source_num, sink_num, 3)
+    if scene is None:
+        d_point_information = cuda.to_device(point_information)
+    else:
+        d_point_information = scene.set_point_information(point_information)
+    order, offsets, segment_pairs = path_segments(
+        path_pairs(source_num, sink_num, full_index)
+    )
+    nodes, path_blocks = pathstore.path_arrays(full_index)
+    d_path_fields = cuda.device_array((full_index.shape[0], 3), dtype=dtype)
+    grids = math.ceil(full_index.shape[0] / threads_in_block)
+    freqdomainpathkernal[grids, threads_in_block](
+        cuda.to_device(nodes),
+        cuda.to_device(path_blocks),
+        d_point_information,
+        wavelength,
+        d_path_fields,
+    )
+    d_segment_sums = cuda.device_array((segment_pairs.shape[0], 3), dtype=dtype)
+    grids = math.ceil(segment_pairs.shape[0] / threads_in_block)
+    segmentsumkernal[grids, threads_in_block](
+        d_path_fields, cuda.to_device(order), cuda.to_device(offsets), d_segment_sums
+    )
+    scattering_network[segment_pairs] = d_segment_sums.copy_to_host()
+    return scattering_network.reshape(source_num, sink_num, 3)
+
+
+def EMCPUFreqDomain(
+    source_num,
+    sink_num,
+    full_index,
+    point_information,
+    wavelength,
+    precision="double",
+    accumulator="segment",
+):
+    """
+    Numba parallel CPU equivalent of :func:`EMGPUFreqDomain`, for machines without a CUDA device.
+    By default, the field of each path is stored, then the paths are sorted by (source, sink) pair and each pair is
+    summed with compensated summation. With the 'scatter' accumulator, each thread accumulates the paths it processes
+    into its own partial scattering network, and the partial networks are summed once all the paths have been
+    processed. The number of partial networks is limited by CPU_ACCUMULATOR_BYTES.
+
+    Parameters
+    -----------
+    source_num : (int)
+        the number of source points
+    sink_num : (int)
+        the number of sink points
+    full_index : (2D numpy array of ints or :class:`lyceanem.raycasting.pathstore.path_store`)
+        index of all successful rays
+    point_information : :type:`lyceanem.base_types.scattering_point`
+        the point information for all sources, sinks and scattering points
+    wavelength : (float)
+        the wavelength of interest
+    precision : str
+        the precision of the stored path fields and the scattering network, either 'double' for complex128 or 'single'
+        for complex64, defaults to ['double']. The field of each path is always calculated in double precision, so
+        single precision only reduces the storage and the memory traffic of the summation, not the path arithmetic
+    accumulator : str
+        the method of summing the paths, either 'segment' for the sorted segmented sum, or 'scatter' for the per-thread
+        partial scattering networks, defaults to ['segment']. The 'scatter' accumulator only supports double precision
+
+    Returns
+    -------
+    scattering_network_comp : (2D numpy array, complex)
+        the resultant scattering network for the provided ray paths
+
+    """
+    check_accumulation(precision, accumulator)
+    nodes, path_blocks = pathstore.path_arrays(full_index)
+    if accumulator == "segment":
+        dtype = PRECISIONS[precision]
+        scattering_network = np.zeros((source_num * sink_num, 3), dtype=dtype)
+        if full_index.shape[0] == 0:
+            return scattering_network.reshape(source_num, sink_num, 3)
+        path_fields = np.zeros((full_index.shape[0], 3), dtype=dtype)
+        freqdomainpathkernalCPU(
+            nodes, path_blocks, point_information, float(wavelength), path_fields
+        )
+        order, offsets, segment_pairs = path_segments(
+            path_pairs(source_num, sink_num, full_index)
+        )
+        segment_sums = np.zeros((segment_pairs.shape[0], 3), dtype=dtype)
+        segmentsumCPU(path_fields, order, offsets, segment_sums)
+        scattering_network[segment_pairs] = segment_sums
+        return scattering_network.reshape(source_num, sink_num, 3)
+
+    network_bytes = source_num * sink_num * 3 * np.dtype(np.complex128).itemsize
+    blocks = int(
+        max(
+            1,
+            min(
+                nb.get_num_threads(),
+                CPU_ACCUMULATOR_BYTES // max(network_bytes, 1),
+                full_index.shape[0],
+            ),
+        )
+    )
+    partial_networks = np.zeros((blocks, source_num, sink_num, 3), dtype=np.complex128)
+    freqdomainkernalCPU(
+        nodes,
+        path_blocks,
+        point_information,
+        source_num,
+        float(wavelength),
+        partial_networks,
+    )
+    return np.sum(partial_networks, axis=0)
+
+
 def IsoGPUFreqDomain(source_num, sink_num, full_index, point_information, wavelength):
     """
     wrapper for the GPU EM processer, outputting the resultant ray components as lengths, allowing for the whole thing to be sorted again.
@@ -2257,7 +2809,7 @@ def IsoGPUFreqDomain(source_num, sink_num, full_index, point_information, wavele
         np.csingle(np.ones((1), dtype=np.complex64) * wavelength)
     )
     # divide in terms of a block for each source, then
-    depthslice, _ = targettingindex(copy.deepcopy(full_index))
+    depthslice, _ = targettingindex(full_index)
     depthslice[:, 0] -= 1
     depthslice[:, 1] -= source_num + 1
     d_target_index = cuda.device_array(
@@ -2543,9 +3095,45 @@ def TimeDomain(
     excitation_signal,
     sampling_freq,
     num_samples,
+    fractional_delay=False,
 ):
-    # use the path networks to generate a time domain polarimetric plot, representing voltage received in each polarisation
-    time_map = np.zeros((sink_num, 3, num_samples), dtype=np.float32)
+    """
+    Time domain polarimetric response, representing the voltage received at each sink in each polarisation, summed
+    over the sources. The path arrivals are binned into a sparse delay histogram for each sink, then convolved with the
+    excitation signal by FFT overlap-add with :func:`lyceanem.electromagnetics.impulseresponse.overlap_add`, rather
+    than adding a shifted copy of the excitation for every path as :func:`time_sortingv2` does.
+
+    Parameters
+    ----------
+    source_num : int
+        the number of source points
+    sink_num : int
+        the number of sink points
+    point_informationv2 : :type:`lyceanem.base_types.scattering_point`
+        the point information for all sources, sinks and scattering points
+    full_index : 2D numpy array of ints or :class:`lyceanem.raycasting.pathstore.path_store`
+        index of all successful rays
+    scattering_coefficient : float
+        allows for exploration of different spreading factors
+    wavelength : float
+        wavelength of the central frequency
+    excitation_signal : numpy array of float
+        the excitation signal, sampled at sampling_freq
+    sampling_freq : float
+        the sampling frequency in Hz
+    num_samples : int
+        the number of samples in the response
+    fractional_delay : bool
+        if True, each path is divided between the samples either side of its arrival time by linear interpolation,
+        defaults to [False], placing each path in the sample after its arrival
+
+    Returns
+    -------
+    time_map : 3D numpy array of float32
+        the response of size sink_num * 3 * num_samples
+    time_ref : float
+        the earliest arrival time in seconds
+    """
     time_index = np.linspace(0, (1 / sampling_freq) * num_samples, num_samples)
     # paths=EMGPUPathLengths(source_num,sink_num,full_index,point_informationv2)
     # polar_coefficients=np.abs(EMGPUPolarMixing(source_num,sink_num,full_index,point_informationv2))
@@ -2574,18 +3162,22 @@ def TimeDomain(
     #     temp_loss=loss[depthslice[:,1]==sink_index+source_num+1]
     #     for slice_index in range(len(sink_slice)):
     #         time_map[sink_index,0,:]=time_map[sink_index,0,:]+time_indexing(excitation_signal,sink_slice[0],num_samples)
-    time_map = time_sortingv2(
-        source_num,
-        sink_num,
+    fractions = None
+    if fractional_delay:
+        sample_position = arrival_times / (time_index[1] - time_index[0])
+        time_steps = np.floor(sample_position).astype(np.int64)
+        fractions = sample_position - time_steps
+    time_map = impulseresponse.overlap_add(
+        depthslice[:, 1] - source_num - 1,
         time_steps,
-        depthslice,
-        loss,
-        np.abs(polar_coefficients),
-        time_map,
+        loss.reshape(-1, 1) * np.abs(polar_coefficients),
+        sink_num,
         excitation_signal,
+        num_samples,
+        fractions=fractions,
     )
 
-    return time_map, time_ref
+    return np.ascontiguousarray(np.swapaxes(time_map, 1, 2), dtype=np.float32), time_ref
 
 
 def TimeDomainv2(
@@ -2658,7 +3250,7 @@ def TimeDomainv2(
     d_arrival_times = cuda.device_array(full_index.shape[0], dtype=np.float64)
     d_arrival_times = cuda.to_device(np.zeros(full_index.shape[0], dtype=np.float64))
     # divide in terms of a block for each source, then
-    depthslice, _ = targettingindex(copy.deepcopy(full_index))
+    depthslice, _ = targettingindex(full_index)
     depthslice[:, 0] -= 1
     depthslice[:, 1] -= source_num + 1
     d_target_index = cuda.device_array(
@@ -2808,7 +3400,7 @@ def TimeDomainv3(
             d_arrival_times = cuda.to_device(
                 np.zeros(temp_index.shape[0], dtype=np.float64)
             )
-            depthslice, _ = targettingindex(copy.deepcopy(temp_index))
+            depthslice, _ = targettingindex(temp_index)
             depthslice[:, 0] -= 1 + source_chunking[n]
             depthslice[:, 1] -= source_num + 1
             d_target_index = cuda.device_array(
@@ -2881,7 +3473,7 @@ def TimeDomainv3(
             np.zeros(full_index.shape[0], dtype=np.float64)
         )
         # divide in terms of a block for each source, then
-        depthslice, _ = targettingindex(copy.deepcopy(full_index))
+        depthslice, _ = targettingindex(full_index)
         depthslice[:, 0] -= 1
         depthslice[:, 1] -= source_num + 1
         d_target_index = cuda.device_array(
@@ -2958,6 +3550,178 @@ def TimeDomainv3(
     return time_map, wake_times[0]
 
 
+def EMTimeDomainTaps(
+    source_num,
+    sink_num,
+    full_index,
+    point_information,
+    wavelength,
+    scene=None,
+    backend=None,
+):
+    """
+    Calculate the channel impulse response as a sparse list of taps, one for each path, rather than convolving the
+    excitation into a dense time map as :func:`TimeDomainv3` does. The memory required is proportional to the number of
+    paths, and the response to any excitation can then be found with
+    :func:`lyceanem.electromagnetics.impulseresponse.synthesise`.
+    As in the time domain kernels, the real part of the excitation of each point is the amplitude, and the imaginary
+    part of the x excitation is a time delay in seconds.
+
+    Parameters
+    ----------
+    source_num : int
+        the number of source points
+    sink_num : int
+        the number of sink points
+    full_index : 2D numpy array of ints or :class:`lyceanem.raycasting.pathstore.path_store`
+        index of all successful rays
+    point_information : :type:`lyceanem.base_types.scattering_point`
+        the point information for all sources, sinks and scattering points
+    wavelength : float
+        the wavelength of the central frequency, setting the spreading loss
+    scene : :class:`lyceanem.raycasting.rayfunctions.raycasting_scene`
+        the scene used for raycasting, setting the backend, defaults to [None]
+    backend : str
+        the backend, either 'cuda' or 'cpu', defaults to [None], using the backend of the scene if provided, otherwise
+        using the GPU if a CUDA device is available, and the Numba parallel CPU kernel otherwise
+
+    Returns
+    -------
+    taps : :class:`lyceanem.electromagnetics.impulseresponse.channel_taps`
+        the amplitude, arrival time and number of scatters of each path
+    """
+    if scene is not None:
+        backend = scene.backend
+    else:
+        backend = RF.raycasting_backend(backend)
+    time_delays = point_information["ex"].imag.astype(np.float64)
+    amplitude_information = point_information.copy()
+    for axis in ("ex", "ey", "ez"):
+        amplitude_information[axis] = point_information[axis].real
+    ray_num = full_index.shape[0]
+    amplitudes = np.zeros((ray_num, 3), dtype=np.float64)
+    arrival_times = np.zeros((ray_num), dtype=np.float64)
+    if ray_num > 0:
+        nodes, path_blocks = pathstore.path_arrays(full_index)
+        if backend == "cpu":
+            timedomaintapkernalCPU(
+                nodes,
+                path_blocks,
+                amplitude_information,
+                time_delays,
+                float(wavelength),
+                amplitudes,
+                arrival_times,
+            )
+        else:
+            threads_in_block = 256
+            d_amplitudes = cuda.device_array((ray_num, 3), dtype=np.float64)
+            d_arrival_times = cuda.device_array((ray_num), dtype=np.float64)
+            grids = math.ceil(ray_num / threads_in_block)
+            timedomaintapkernal[grids, threads_in_block](
+                cuda.to_device(nodes),
+                cuda.to_device(path_blocks),
+                cuda.to_device(amplitude_information),
+                cuda.to_device(time_delays),
+                float(wavelength),
+                d_amplitudes,
+                d_arrival_times,
+            )
+            amplitudes = d_amplitudes.copy_to_host()
+            arrival_times = d_arrival_times.copy_to_host()
+    depth_slice, scatter_index = targettingindex(full_index)
+    return impulseresponse.channel_taps(
+        source_num,
+        sink_num,
+        depth_slice[:, 0] - 1,
+        depth_slice[:, 1] - source_num - 1,
+        arrival_times,
+        amplitudes,
+        scatter_index - 1,
+    )
+
+
+def TimeDomainv4(
+    source_num,
+    sink_num,
+    point_informationv2,
+    full_index,
+    scattering_coefficient,
+    wavelength,
+    excitation_signal,
+    sampling_freq,
+    num_samples,
+    filename=None,
+    memory_budget=None,
+    scene=None,
+    backend=None,
+):
+    """
+    Streaming equivalent of :func:`TimeDomainv3`, with bounded memory. The amplitude and arrival time of every path are
+    found first with :func:`EMTimeDomainTaps`, so the wake time is known before any of the response is synthesised.
+    The response is then built in independent blocks of sinks and windows of time, all aligned to the same wake time,
+    with :func:`lyceanem.electromagnetics.impulseresponse.synthesise`, and each finished block is written to the
+    memory mapped file if provided, so the whole time map is never held in memory.
+
+    Parameters
+    ----------
+    source_num : int
+        the number of source points
+    sink_num : int
+        the number of sink points
+    point_informationv2 : :type:`lyceanem.base_types.scattering_point`
+        the point information for all sources, sinks and scattering points
+    full_index : 2D numpy array of ints or :class:`lyceanem.raycasting.pathstore.path_store`
+        index of all successful rays
+    scattering_coefficient : float
+        allows for exploration of different spreading factors, unused, as in :func:`TimeDomainv3`
+    wavelength : float
+        wavelength of the central frequency
+    excitation_signal : numpy array of float
+        the excitation signal, sampled at sampling_freq
+    sampling_freq : float
+        the sampling frequency in Hz
+    num_samples : int
+        the number of samples required from the first incoming wave
+    filename : str or :class:`pathlib.Path`
+        if provided, the time map is written to a memory mapped .npy file at this location, defaults to [None],
+        holding the time map in memory
+    memory_budget : int
+        the memory available for synthesising each block of the time map in bytes, defaults to [None], using
+        :data:`lyceanem.electromagnetics.impulseresponse.SYNTHESIS_BATCH_BYTES`
+    scene : :class:`lyceanem.raycasting.rayfunctions.raycasting_scene`
+        the scene used for raycasting, setting the backend, defaults to [None]
+    backend : str
+        the backend, either 'cuda' or 'cpu', defaults to [None], using the backend of the scene if provided, otherwise
+        using the GPU if a CUDA device is available, and the Numba parallel CPU kernel otherwise
+
+    Returns
+    -------
+    time_map : array of floats
+        an array of floats of size source_num * sink_num * num_samples * 3 to contain the 3D polarised information in
+        the time domain, a :class:`numpy.memmap` if a filename is provided
+    wake_time : float
+        the time in seconds that the earliest return arrived at the sinks
+    """
+    taps = EMTimeDomainTaps(
+        source_num,
+        sink_num,
+        full_index,
+        point_informationv2,
+        wavelength,
+        scene=scene,
+        backend=backend,
+    )
+    return impulseresponse.synthesise(
+        taps,
+        excitation_signal,
+        sampling_freq,
+        num_samples,
+        filename=filename,
+        memory_budget=memory_budget,
+    )
+
+
 def TimeDomainThetaPhi(
     source_num,
     sink_num,
@@ -3058,7 +3822,7 @@ def TimeDomainThetaPhi(
             d_arrival_times = cuda.to_device(
                 np.zeros(temp_index.shape[0], dtype=np.float64)
             )
-            depthslice, _ = targettingindex(copy.deepcopy(temp_index))
+            depthslice, _ = targettingindex(temp_index)
             depthslice[:, 0] -= 1 + source_chunking[n]
             depthslice[:, 1] -= source_num + 1
             d_target_index = cuda.device_array(
@@ -3130,7 +3894,7 @@ def TimeDomainThetaPhi(
             np.zeros(full_index.shape[0], dtype=np.float64)
         )
         # divide in terms of a block for each source, then
-        depthslice, _ = targettingindex(copy.deepcopy(full_index))
+        depthslice, _ = targettingindex(full_index)
         depthslice[:, 0] -= 1
         depthslice[:, 1] -= source_num + 1
         d_target_index = cuda.device_array(
@@ -3179,41 +3943,45 @@ def TimeDomainThetaPhi(
     return time_map, wake_times
 
 
-# @njit(cache=True, nogil=True)
+@njit(parallel=True, nogil=True, cache=True)
+def targettingindexCPU(full_index, depth_slice, scatter_index):
+    """
+    Single pass over the full index for :func:`targettingindex`, finding the last non-zero entry of each row.
+    """
+    for ray in prange(full_index.shape[0]):
+        terminal = 0
+        for column in range(full_index.shape[1] - 1, 0, -1):
+            if full_index[ray, column] != 0:
+                terminal = column
+                break
+        depth_slice[ray, 0] = full_index[ray, 0]
+        depth_slice[ray, 1] = full_index[ray, terminal]
+        scatter_index[ray] = terminal
+
+
 def targettingindex(full_index):
-    # slice the full index to produce the source and sink index for each ray
-    scatter_index = np.ones((full_index.shape[0]), dtype=np.int64)
-    if full_index.shape[1] == 2:
-        depth_slice = full_index
-
-    if full_index.shape[1] == 3:
-        depth_slice = full_index[np.all(full_index[:, 2:] == 0, axis=1), :][:, [0, 1]]
-        depth_slice = np.append(
-            depth_slice,
-            full_index[np.all(full_index[:, 2:] != 0, axis=1), :][:, [0, 2]],
-            axis=0,
-        )
-        scatter_index[np.all(full_index[:, 2:] != 0, axis=1)] = 2
-
-    if full_index.shape[1] == 4:
-        depth_slice = full_index[np.all(full_index[:, 2:] == 0, axis=1), :][:, [0, 1]]
-        remainder = full_index[~np.all(full_index[:, 2:] == 0, axis=1), :]
-        depth_slice = np.append(
-            depth_slice,
-            remainder[np.all(remainder[:, 3:] == 0, axis=1), :][:, [0, 2]],
-            axis=0,
-        )
-        remainder2 = remainder[~np.all(remainder[:, 3:] == 0, axis=1), :]
-        depth_slice = np.append(
-            depth_slice,
-            remainder2[np.all(remainder2[:, 3:] != 0, axis=1), :][:, [0, 3]],
-            axis=0,
-        )
-        scatter_index[np.all(full_index[:, 2:] != 0, axis=1)] = 3
-        scatter_index[
-            np.all(np.array([full_index[:, 2] != 0, full_index[:, 3] == 0]), axis=0)
-        ] = 2
+    """
+    slice the full index to produce the source and sink index for each ray, for paths with any number of scatters.
+    The rays are in the same order as the full index, which is not modified.
 
+    Parameters
+    ----------
+    full_index : 2D numpy array of ints or :class:`lyceanem.raycasting.pathstore.path_store`
+        the index of all successful rays, zero padded after the sink index
+
+    Returns
+    -------
+    depth_slice : n by 2 numpy array of ints
+        the source and sink index for each ray
+    scatter_index : numpy array of ints
+        the number of legs in each path, 1 for line of sight
+    """
+    if isinstance(full_index, pathstore.path_store):
+        return full_index.targets(), full_index.depths()
+    full_index = np.asarray(full_index)
+    depth_slice = np.zeros((full_index.shape[0], 2), dtype=full_index.dtype)
+    scatter_index = np.zeros((full_index.shape[0]), dtype=np.int64)
+    targettingindexCPU(full_index, depth_slice, scatter_index)
     return depth_slice, scatter_index
 
 
@@ -0,0 +1,706 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import numpy as np
+import scipy.fft
+
+SYNTHESIS_BATCH_BYTES = 2 ** 28  # memory budget for each batch of the overlap-add convolution, and each block of the response
+
+
+class channel_taps:
+    """
+    Sparse channel impulse response, with a tap for each path from a source to a sink, holding the arrival time, the
+    amplitude of the field in each global axis, and the number of scatters along the path. The memory used is
+    proportional to the number of paths rather than the number of samples, and the response to any excitation is found
+    by convolution with :func:`synthesise`, without repeating the raycasting or the EM calculation.
+
+    Parameters
+    ----------
+    source_num : int
+        the number of source points
+    sink_num : int
+        the number of sink points
+    sources : numpy array of int
+        the source of each tap, numbered from 0
+    sinks : numpy array of int
+        the sink of each tap, numbered from 0
+    delays : numpy array of float
+        the arrival time of each tap in seconds
+    amplitudes : n by 3 numpy array of float
+        the amplitude of each tap in the x, y and z axes
+    depths : numpy array of int
+        the number of scatters along the path of each tap, 0 for line of sight
+    """
+
+    def __init__(self, source_num, sink_num, sources, sinks, delays, amplitudes, depths):
+        self.source_num = int(source_num)
+        self.sink_num = int(sink_num)
+        self.sources = np.asarray(sources, dtype=np.int32)
+        self.sinks = np.asarray(sinks, dtype=np.int32)
+        self.delays = np.asarray(delays, dtype=np.float64)
+        self.amplitudes = np.asarray(amplitudes, dtype=np.float64).reshape(-1, 3)
+        self.depths = np.asarray(depths, dtype=np.int32)
+
+    def __len__(self):
+        return self.delays.shape[0]
+
+    def nbytes(self):
+        """
+        The memory used by the taps in bytes.
+        """
+        return sum(
+            array.nbytes
+            for array in (
+                self.sources,
+                self.sinks,
+                self.delays,
+                self.amplitudes,
+                self.depths,
+            )
+        )
+
+    def wake_time(self):
+        """
+        The earliest arrival time of any tap in seconds, or 0.0 if there are no taps.
+        """
+        if len(self) == 0:
+            return 0.0
+        return float(np.min(self.delays))
+
+    def pairs(self):
+        """
+        The (source, sink) pair of each tap, as the index of the pair in a flattened source by sink array.
+        """
+        return self.sources.astype(np.int64) * self.sink_num + self.sinks
+
+    def sample_index(self, sampling_freq, wake_time=None):
+        """
+        The sample each tap arrives in, counting from the wake time.
+
+        Parameters
+        ----------
+        sampling_freq : float
+            the sampling frequency in Hz
+        wake_time : float
+            the time of the first sample in seconds, defaults to [None], the earliest arrival time of any tap
+
+        Returns
+        -------
+        sample_index : numpy array of int64
+            the sample each tap arrives in
+        """
+        if wake_time is None:
+            wake_time = self.wake_time()
+        return ((self.delays - wake_time) // (1.0 / sampling_freq)).astype(np.int64)
+
+
+class windowed_time_map:
+    """
+    Ragged time domain response, holding only the active window of each (source, sink) pair, from the first sample a
+    path arrives in to the end of the excitation from the last path to arrive, rather than every sample from the start
+    of the time map. The windows of all the pairs are stored consecutively, so the memory used depends upon the spread
+    of the arrival times at each sink, rather than the delay before the first arrival.
+
+    Parameters
+    ----------
+    source_num : int
+        the number of source points
+    sink_num : int
+        the number of sink points
+    num_samples : int
+        the number of samples in the full response
+    starts : numpy array of int
+        the first sample of the window of each pair, in the order of a flattened source by sink array
+    lengths : numpy array of int
+        the number of samples in the window of each pair, 0 if no paths arrive
+    data : n by 3 numpy array of float
+        the x, y and z components of every sample in the windows, in the order of the pairs
+    wake_time : float
+        the time of the first sample of the full response in seconds
+    """
+
+    def __init__(self, source_num, sink_num, num_samples, starts, lengths, data, wake_time):
+        self.source_num = int(source_num)
+        self.sink_num = int(sink_num)
+        self.num_samples = int(num_samples)
+        self.starts = np.asarray(starts, dtype=np.int64)
+        self.lengths = np.asarray(lengths, dtype=np.int64)
+        self.offsets = np.zeros((self.lengths.shape[0] + 1), dtype=np.int64)
+        np.cumsum(self.lengths, out=self.offsets[1:])
+        self.data = np.asarray(data, dtype=np.float64).reshape(-1, 3)
+        self.wake_time = wake_time
+
+    def nbytes(self):
+        """
+        The memory used by the windows in bytes.
+        """
+        return self.data.nbytes + self.starts.nbytes + self.lengths.nbytes + self.offsets.nbytes
+
+    def window(self, source, sink):
+        """
+        The active window of a (source, sink) pair.
+
+        Returns
+        -------
+        start : int
+            the first sample of the window
+        response : n by 3 numpy array of float
+            the x, y and z components of each sample in the window
+        """
+        pair = source * self.sink_num + sink
+        return self.starts[pair], self.data[self.offsets[pair] : self.offsets[pair + 1]]
+
+    def sample_positions(self):
+        """
+        The sample of the full response held in each row of the data.
+        """
+        return np.repeat(self.starts - self.offsets[:-1], self.lengths) + np.arange(
+            self.data.shape[0]
+        )
+
+    def combined(self):
+        """
+        The response summed over the sources and sinks.
+
+        Returns
+        -------
+        response : num_samples by 3 numpy array of float64
+            the x, y and z components of each sample
+        """
+        response = np.zeros((self.num_samples, 3), dtype=np.float64)
+        np.add.at(response, self.sample_positions(), self.data)
+        return response
+
+    def to_time_map(self):
+        """
+        Expand the windows to the full time map.
+
+        Returns
+        -------
+        time_map : 4D numpy array of float64
+            the response of size source_num * sink_num * num_samples * 3, as returned by :func:`synthesise`
+        """
+        time_map = np.zeros(
+            (self.source_num * self.sink_num, self.num_samples, 3), dtype=np.float64
+        )
+        time_map[np.repeat(np.arange(self.lengths.shape[0]), self.lengths), self.sample_positions()] = self.data
+        return time_map.reshape(self.source_num, self.sink_num, self.num_samples, 3)
+
+
+def convolution_layout(excitation_length, num_samples, block_size=None):
+    """
+    The block size, FFT length and number of response blocks touched by each convolved block, used by
+    :func:`overlap_add`.
+
+    Parameters
+    ----------
+    excitation_length : int
+        the number of samples in the excitation signal
+    num_samples : int
+        the number of samples in the response
+    block_size : int
+        the number of samples in each block, defaults to [None], chosen from the length of the excitation signal
+
+    Returns
+    -------
+    block_size : int
+        the number of samples in each block
+    fft_length : int
+        the length of each FFT
+    tail_blocks : int
+        the number of blocks of the response touched by each convolved block
+    """
+    if block_size is None:
+        block_size = (
+            scipy.fft.next_fast_len(2 * excitation_length, real=True)
+            - excitation_length
+            + 1
+        )
+    block_size = int(max(1, min(block_size, num_samples)))
+    fft_length = scipy.fft.next_fast_len(block_size + excitation_length - 1, real=True)
+    tail_blocks = -(-fft_length // block_size)
+    return block_size, fft_length, tail_blocks
+
+
+def segment_bytes(block_size, fft_length):
+    """
+    The scratch memory used by :func:`overlap_add` for each occupied block in a batch of FFTs, for the histogram, the
+    zero padded FFT input, the spectrum, the convolved block and the temporary copies made while adding the tails.
+    """
+    sample_bytes = 3 * np.dtype(np.float64).itemsize
+    return sample_bytes * (4 * block_size + 4 * fft_length + 2 * (fft_length // 2 + 1))
+
+
+def convolution_bytes(channel_num, excitation_length, num_samples, block_size=None):
+    """
+    Upper bound on the memory used by :func:`overlap_add` for the response of channel_num channels of num_samples
+    samples, including the padding after the response for the tails of the final blocks, and the scratch for a single
+    occupied block. The memory used for the impulses themselves is not included.
+    """
+    block_size, fft_length, tail_blocks = convolution_layout(
+        excitation_length, num_samples, block_size
+    )
+    block_num = -(-num_samples // block_size)
+    return channel_num * (block_num + tail_blocks) * block_size * 3 * np.dtype(
+        np.float64
+    ).itemsize + segment_bytes(block_size, fft_length)
+
+
+def budget_window(channel_num, excitation_length, lead, memory_budget, block_size=None):
+    """
+    The largest number of samples of channel_num channels which can be synthesised within the memory budget, including
+    the lead samples before the window in which an impulse can arrive and still reach into it.
+
+    Returns
+    -------
+    window : int
+        the number of samples in the window
+    overhead : int
+        the lead and padding samples held with each channel in addition to the window
+
+    Raises
+    ------
+    ValueError
+        if the budget is too small for even a single sample after the lead
+    """
+    # an upper bound on the layout of any shorter response, as the block size and FFT length only shrink with it
+    block_size, fft_length, _ = convolution_layout(
+        excitation_length, np.iinfo(np.int64).max, block_size
+    )
+    overhead = lead + fft_length + 2 * block_size
+    sample_bytes = channel_num * 3 * np.dtype(np.float64).itemsize
+    window = (memory_budget - segment_bytes(block_size, fft_length)) // sample_bytes - overhead
+    if window < 1:
+        raise ValueError(
+            "a memory budget of {} bytes is too small for an excitation signal of {} samples, at least {} bytes are "
+            "needed".format(
+                memory_budget,
+                excitation_length,
+                segment_bytes(block_size, fft_length) + sample_bytes * (overhead + 1),
+            )
+        )
+    return int(window), int(overhead)
+
+
+def overlap_add(
+    channels,
+    sample_index,
+    amplitudes,
+    channel_num,
+    excitation_signal,
+    num_samples,
+    fractions=None,
+    block_size=None,
+    memory_budget=None,
+):
+    """
+    Convolve a sparse set of impulses with an excitation signal by overlap-add. The impulses of each channel are binned
+    into a histogram of arrival samples, which is only held for the blocks of block_size samples in which at least one
+    impulse arrives. The occupied blocks are convolved with the excitation in batches of FFTs, and each result is added
+    into the response together with the tail which overlaps the following blocks.
+
+    Parameters
+    ----------
+    channels : numpy array of int
+        the output channel of each impulse
+    sample_index : numpy array of int
+        the sample each impulse arrives in, impulses outside the response are ignored
+    amplitudes : n by 3 numpy array of float
+        the amplitude of each impulse in the x, y and z axes
+    channel_num : int
+        the number of output channels
+    excitation_signal : numpy array of float
+        the excitation signal
+    num_samples : int
+        the number of samples in the response
+    fractions : numpy array of float
+        the fraction of a sample after sample_index at which each impulse arrives, for linear interpolation of the
+        delay between adjacent samples, defaults to [None], placing each impulse on its sample
+    block_size : int
+        the number of samples in each block, defaults to [None], chosen from the length of the excitation signal
+    memory_budget : int
+        the memory available for the response and the batches of FFTs in bytes, setting the number of blocks in each
+        batch, defaults to [None], using SYNTHESIS_BATCH_BYTES for each batch
+
+    Returns
+    -------
+    response : 3D numpy array of float64
+        the response of size channel_num * num_samples * 3
+
+    Raises
+    ------
+    ValueError
+        if the memory budget is too small for the response and a single block
+    """
+    excitation_signal = np.asarray(excitation_signal, dtype=np.float64).ravel()
+    channels = np.asarray(channels, dtype=np.int64).ravel()
+    sample_index = np.asarray(sample_index, dtype=np.int64).ravel()
+    amplitudes = np.asarray(amplitudes, dtype=np.float64).reshape(-1, 3)
+    if fractions is not None:
+        # split each impulse between the samples either side of the arrival time
+        fractions = np.asarray(fractions, dtype=np.float64).reshape(-1, 1)
+        channels = np.concatenate((channels, channels))
+        sample_index = np.concatenate((sample_index, sample_index + 1))
+        amplitudes = np.concatenate(
+            (amplitudes * (1.0 - fractions), amplitudes * fractions)
+        )
+    block_size, fft_length, tail_blocks = convolution_layout(
+        excitation_signal.shape[0], num_samples, block_size
+    )
+    block_num = -(-num_samples // block_size)
+    batch_bytes = SYNTHESIS_BATCH_BYTES
+    if memory_budget is not None:
+        batch_bytes = memory_budget - (
+            channel_num * (block_num + tail_blocks) * block_size * 3 * np.dtype(np.float64).itemsize
+        )
+        if batch_bytes < segment_bytes(block_size, fft_length):
+            raise ValueError(
+                "a memory budget of {} bytes is too small for {} channels of {} samples".format(
+                    memory_budget, channel_num, num_samples
+                )
+            )
+    response = np.zeros(
+        (channel_num, block_num + tail_blocks, block_size, 3), dtype=np.float64
+    )
+    arrived = (sample_index >= 0) & (sample_index < num_samples)
+    channels = channels[arrived]
+    sample_index = sample_index[arrived]
+    amplitudes = amplitudes[arrived]
+    if sample_index.shape[0] > 0:
+        segments, segment_index = np.unique(
+            channels * block_num + sample_index // block_size, return_inverse=True
+        )
+        segment_index = segment_index.ravel()
+        # the row of the response holding the first block of each segment
+        segment_rows = (segments // block_num) * (block_num + tail_blocks) + segments % block_num
+        # sort the impulses by segment once, so each batch of segments is a contiguous range of impulses
+        order = np.argsort(segment_index, kind="stable")
+        impulse_bounds = np.searchsorted(
+            segment_index[order], np.arange(segments.shape[0] + 1)
+        )
+        response_rows = response.reshape(-1, block_size, 3)
+        spectrum = scipy.fft.rfft(excitation_signal, fft_length).reshape(1, -1, 1)
+        batch = max(1, batch_bytes // segment_bytes(block_size, fft_length))
+        for first in range(0, segments.shape[0], batch):
+            last = min(first + batch, segments.shape[0])
+            rows = order[impulse_bounds[first] : impulse_bounds[last]]
+            positions = (segment_index[rows] - first) * block_size + sample_index[
+                rows
+            ] % block_size
+            histogram = np.empty(((last - first) * block_size, 3), dtype=np.float64)
+            for axis in range(3):
+                histogram[:, axis] = np.bincount(
+                    positions,
+                    weights=amplitudes[rows, axis],
+                    minlength=histogram.shape[0],
+                )
+            spectra = scipy.fft.rfft(
+                histogram.reshape(last - first, block_size, 3), fft_length, axis=1
+            )
+            del histogram
+            spectra *= spectrum
+            convolved = scipy.fft.irfft(spectra, fft_length, axis=1)
+            del spectra
+            # the segments are unique, so the blocks each tail is added to are distinct
+            for tail in range(tail_blocks):
+                width = min(block_size, fft_length - tail * block_size)
+                response_rows[segment_rows[first:last] + tail, :width, :] += convolved[
+                    :, tail * block_size : tail * block_size + width, :
+                ]
+    return response.reshape(channel_num, -1, 3)[:, :num_samples, :]
+
+
+def tap_samples(taps, sampling_freq, wake_time, fractional_delay=False, wake_sample=0):
+    """
+    The sample each tap arrives in, and the fraction of a sample after it at which the tap arrives if fractional delays
+    are used, shared by :func:`synthesise` and :func:`synthesise_windows`.
+    """
+    sample_index = taps.sample_index(sampling_freq, wake_time)
+    fractions = None
+    if fractional_delay:
+        fractions = np.clip(
+            (taps.delays - wake_time) * sampling_freq - sample_index, 0.0, 1.0
+        )
+    return sample_index + wake_sample, fractions
+
+
+def synthesise(
+    taps,
+    excitation_signal,
+    sampling_freq,
+    num_samples,
+    wake_time=None,
+    fractional_delay=False,
+    block_size=None,
+    filename=None,
+    wake_sample=0,
+    memory_budget=None,
+):
+    """
+    Convolve the channel impulse response with an excitation signal, to give the time domain response at each sink for
+    each source, such as the response of each element of an array in a single pass over the paths. The taps of each
+    (source, sink) pair are binned into a sparse histogram of arrival samples, then convolved with the excitation by
+    :func:`overlap_add`. The response is built in independent blocks of sinks and windows of time, each including the
+    taps which arrive early enough for the excitation to reach into the window, so that only one block is held in
+    memory at a time, and each finished block can be written to a memory mapped file while the next is computed.
+
+    Parameters
+    ----------
+    taps : :class:`channel_taps`
+        the channel impulse response
+    excitation_signal : numpy array of float
+        the excitation signal, sampled at sampling_freq
+    sampling_freq : float
+        the sampling frequency in Hz
+    num_samples : int
+        the number of samples required from the wake time
+    wake_time : float
+        the time of the first sample in seconds, defaults to [None], the earliest arrival time of any tap
+    fractional_delay : bool
+        if True, each tap is divided between the samples either side of its arrival time by linear interpolation,
+        rather than placed in the sample it arrives in, defaults to [False]
+    block_size : int
+        the number of samples in each block of the overlap-add convolution, defaults to [None], chosen from the length
+        of the excitation signal
+    filename : str or :class:`pathlib.Path`
+        if provided, the response is written to a memory mapped .npy file at this location as each block is
+        synthesised, defaults to [None], holding the response in memory
+    wake_sample : int
+        the sample of the response in which the wake time falls, delaying the whole response by a whole number of
+        samples, defaults to [0]
+    memory_budget : int
+        the memory available for synthesising each block in bytes, including the padding and FFT scratch of the
+        convolution but not the output or the taps, setting the number of sinks and samples in each block, defaults
+        to [None], using SYNTHESIS_BATCH_BYTES
+
+    Returns
+    -------
+    time_map : 4D numpy array of float64
+        the response of size source_num * sink_num * num_samples * 3, holding the x, y and z components for each
+        sample from wake_sample samples before the wake time. A :class:`numpy.memmap` if a filename is provided.
+    wake_time : float
+        the time of the first sample in seconds
+
+    Raises
+    ------
+    ValueError
+        if the memory budget is too small for the excitation signal
+    """
+    if wake_time is None:
+        wake_time = taps.wake_time()
+    if memory_budget is None:
+        memory_budget = SYNTHESIS_BATCH_BYTES
+    shape = (taps.source_num, taps.sink_num, num_samples, 3)
+    if filename is None:
+        time_map = np.zeros(shape, dtype=np.float64)
+    else:
+        time_map = np.lib.format.open_memmap(
+            filename, mode="w+", dtype=np.float64, shape=shape
+        )
+    sample_index, fractions = tap_samples(
+        taps, sampling_freq, wake_time, fractional_delay, wake_sample
+    )
+    # the number of samples before a window in which a tap can arrive and still reach into the window
+    excitation_length = np.asarray(excitation_signal).size
+    lead = excitation_length - 1 + int(fractional_delay)
+    # the samples of every sink for a single source which fit in the budget, including the padding and FFT scratch
+    window, overhead = budget_window(
+        taps.source_num, excitation_length, lead, memory_budget, block_size
+    )
+    sink_block = 1
+    if window >= num_samples:
+        # each further sink holds all the samples, with its own lead and padding
+        sink_block = int(
+            min(taps.sink_num, (window + overhead) // (num_samples + overhead))
+        )
+        window = num_samples
+    # group the taps by sink, so each block of sinks is a contiguous range of taps
+    order = np.argsort(taps.sinks, kind="stable")
+    bounds = np.searchsorted(taps.sinks[order], np.arange(taps.sink_num + 1))
+    for first in range(0, taps.sink_num, sink_block):
+        last = min(first + sink_block, taps.sink_num)
+        rows = order[bounds[first] : bounds[last]]
+        for start in range(0, num_samples, window):
+            end = min(start + window, num_samples)
+            window_rows = rows[
+                (sample_index[rows] >= start - lead) & (sample_index[rows] < end)
+            ]
+            if window_rows.shape[0] == 0:
+                continue
+            response = overlap_add(
+                taps.sources[window_rows].astype(np.int64) * (last - first)
+                + taps.sinks[window_rows]
+                - first,
+                sample_index[window_rows] - (start - lead),
+                taps.amplitudes[window_rows],
+                taps.source_num * (last - first),
+                excitation_signal,
+                end - start + lead,
+                fractions=None if fractions is None else fractions[window_rows],
+                block_size=block_size,
+                memory_budget=memory_budget,
+            )
+            time_map[:, first:last, start:end, :] = response[:, lead:, :].reshape(
+                taps.source_num, last - first, end - start, 3
+            )
+            # release the block before the next is synthesised
+            del response
+    if filename is not None:
+        time_map.flush()
+    return time_map, wake_time
+
+
+def synthesise_windows(
+    taps,
+    excitation_signal,
+    sampling_freq,
+    num_samples,
+    wake_time=None,
+    fractional_delay=False,
+    block_size=None,
+    wake_sample=0,
+    memory_budget=None,
+):
+    """
+    Gated equivalent of :func:`synthesise`, returning only the active window of each (source, sink) pair. The earliest
+    and latest arrival of each pair are found from the taps first, so only the samples from the first arrival to the
+    end of the excitation from the last arrival are allocated and synthesised, skipping the empty samples before the
+    wake time and between the responses. The windows are laid end to end along a single channel, with the taps sorted
+    by their position along it once, so each chunk of windows within the memory budget is a contiguous range of taps,
+    and the convolution of each chunk only holds the samples of the windows in it.
+
+    Parameters
+    ----------
+    taps : :class:`channel_taps`
+        the channel impulse response
+    excitation_signal : numpy array of float
+        the excitation signal, sampled at sampling_freq
+    sampling_freq : float
+        the sampling frequency in Hz
+    num_samples : int
+        the number of samples in the full response, samples beyond this are not held
+    wake_time : float
+        the time of the first sample in seconds, defaults to [None], the earliest arrival time of any tap
+    fractional_delay : bool
+        if True, each tap is divided between the samples either side of its arrival time by linear interpolation,
+        rather than placed in the sample it arrives in, defaults to [False]
+    block_size : int
+        the number of samples in each block of the overlap-add convolution, defaults to [None], chosen from the length
+        of the excitation signal
+    wake_sample : int
+        the sample of the response in which the wake time falls, defaults to [0]
+    memory_budget : int
+        the memory available for synthesising each chunk of windows in bytes, including the padding and FFT scratch of
+        the convolution but not the windows returned or the taps, defaults to [None], using SYNTHESIS_BATCH_BYTES
+
+    Returns
+    -------
+    time_map : :class:`windowed_time_map`
+        the active window of each (source, sink) pair
+
+    Raises
+    ------
+    ValueError
+        if the memory budget is too small for the excitation signal
+    """
+    if wake_time is None:
+        wake_time = taps.wake_time()
+    if memory_budget is None:
+        memory_budget = SYNTHESIS_BATCH_BYTES
+    pair_num = taps.source_num * taps.sink_num
+    sample_index, fractions = tap_samples(
+        taps, sampling_freq, wake_time, fractional_delay, wake_sample
+    )
+    # the last sample reached by the excitation of a tap, after the sample it arrives in
+    excitation_length = np.asarray(excitation_signal).size
+    lead = excitation_length - 1 + int(fractional_delay)
+    # only the taps which reach into the response contribute to it
+    rows = np.flatnonzero((sample_index >= -lead) & (sample_index < num_samples))
+    pairs = taps.pairs()[rows]
+    first_arrival = np.full((pair_num), np.iinfo(np.int64).max, dtype=np.int64)
+    last_arrival = np.full((pair_num), np.iinfo(np.int64).min, dtype=np.int64)
+    np.minimum.at(first_arrival, pairs, sample_index[rows])
+    np.maximum.at(last_arrival, pairs, sample_index[rows])
+    # the synthesised window runs from the first arrival to the end of the excitation from the last arrival, but only
+    # the samples within the response are kept
+    arrived = np.flatnonzero(last_arrival >= first_arrival)
+    starts = np.zeros((pair_num), dtype=np.int64)
+    lengths = np.zeros((pair_num), dtype=np.int64)
+    starts[arrived] = np.maximum(first_arrival[arrived], 0)
+    lengths[arrived] = np.minimum(last_arrival[arrived] + lead + 1, num_samples) - starts[arrived]
+    time_map = windowed_time_map(
+        taps.source_num,
+        taps.sink_num,
+        num_samples,
+        starts,
+        lengths,
+        np.zeros((int(np.sum(lengths)), 3), dtype=np.float64),
+        wake_time,
+    )
+    # every pair with a tap which reaches into the response keeps at least one sample
+    active = arrived
+    if active.shape[0] == 0:
+        return time_map
+    # lay the synthesised windows end to end, in the order of the pairs and so of the data
+    spans = last_arrival[active] + lead + 1 - first_arrival[active]
+    span_offsets = np.zeros((active.shape[0] + 1), dtype=np.int64)
+    np.cumsum(spans, out=span_offsets[1:])
+    rank = np.zeros((pair_num), dtype=np.int64)
+    rank[active] = np.arange(active.shape[0])
+    positions = span_offsets[rank[pairs]] + sample_index[rows] - first_arrival[pairs]
+    order = np.argsort(positions, kind="stable")
+    positions = positions[order]
+    rows = rows[order]
+    # the kept samples of each window, along the single channel
+    kept_starts = span_offsets[:-1] + starts[active] - first_arrival[active]
+    kept_ends = kept_starts + lengths[active]
+    # each chunk also holds a mask of the kept samples, one byte per sample
+    window, _ = budget_window(1, excitation_length, lead, memory_budget, block_size)
+    window, _ = budget_window(
+        1, excitation_length, lead, memory_budget - window - 1, block_size
+    )
+    chunk_start = 0
+    while chunk_start < span_offsets[-1]:
+        # end each chunk at the end of a window where one fits, otherwise split the window
+        chunk_end = min(chunk_start + window, span_offsets[-1])
+        boundary = span_offsets[np.searchsorted(span_offsets, chunk_end, side="right") - 1]
+        if boundary > chunk_start:
+            chunk_end = boundary
+        chunk_rows = slice(
+            np.searchsorted(positions, chunk_start - lead),
+            np.searchsorted(positions, chunk_end),
+        )
+        response = overlap_add(
+            np.zeros((rows[chunk_rows].shape[0]), dtype=np.int64),
+            positions[chunk_rows] - (chunk_start - lead),
+            taps.amplitudes[rows[chunk_rows]],
+            1,
+            excitation_signal,
+            chunk_end - chunk_start + lead,
+            fractions=None if fractions is None else fractions[rows[chunk_rows]],
+            block_size=block_size,
+            memory_budget=memory_budget - (chunk_end - chunk_start) - 1,
+        )[0, lead:, :]
+        # the kept samples of the windows in the chunk are a contiguous range of the data
+        first = np.searchsorted(span_offsets, chunk_start, side="right") - 1
+        last = np.searchsorted(span_offsets, chunk_end, side="left")
+        lower = np.maximum(kept_starts[first:last], chunk_start)
+        upper = np.minimum(kept_ends[first:last], chunk_end)
+        occupied = np.flatnonzero(upper > lower)
+        if occupied.shape[0] > 0:
+            # the data position of the first kept sample in the chunk
+            data_start = (
+                time_map.offsets[active[first + occupied[0]]]
+                + lower[occupied[0]]
+                - kept_starts[first + occupied[0]]
+            )
+            data_end = data_start + int(np.sum(upper[occupied] - lower[occupied]))
+            kept = np.zeros((chunk_end - chunk_start + 1), dtype=np.int8)
+            kept[lower[occupied] - chunk_start] += 1
+            kept[upper[occupied] - chunk_start] -= 1
+            np.cumsum(kept, dtype=np.int8, out=kept)
+            np.compress(
+                kept[:-1].view(bool), response, axis=0, out=time_map.data[data_start:data_end]
+            )
+        del response
+        chunk_start = chunk_end
+    return time_map
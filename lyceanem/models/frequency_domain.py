@@ -2,12 +2,116 @@ import numpy as np
 import copy
 import open3d as o3d
 
-from ..base_types import scattering_t
+from ..base_types import scattering_t, unified_point_information
 from ..utility.math_functions import calc_dv_norm
 from ..electromagnetics import empropagation as EM
 from ..geometry import geometryfunctions as GF
 from ..geometry import targets as TL
 from ..raycasting import rayfunctions as RF
+from .model_points import cloud_arrays, excitation_vectors, scattering_cloud
+
+COVERAGE_BATCH_BYTES = 2 ** 28  # memory budget for the paths and scattering network of each tile of a coverage map
+
+
+def frequency_networks(
+    num_sources, num_sinks, full_index, point_information, wavelength, scene=None
+):
+    """
+    Calculate the scattering network for the successful paths at a single wavelength, or at every wavelength in an
+    array of wavelengths. For an array, the path lengths and polarisation coefficients are calculated once, and all
+    the wavelengths are evaluated together.
+
+    Parameters
+    ----------
+    num_sources : int
+        the number of source points
+    num_sinks : int
+        the number of sink points
+    full_index : 2D numpy array of int or :class:`lyceanem.raycasting.pathstore.path_store`
+        index of all successful rays
+    point_information : :type:`lyceanem.base_types.scattering_point`
+        the point information for all sources, sinks and scattering points
+    wavelength : float or 1D numpy array of float
+        the wavelength or wavelengths of interest in metres
+    scene : :class:`lyceanem.raycasting.rayfunctions.raycasting_scene`
+        the scene used for raycasting, defaults to [None]
+
+    Returns
+    -------
+    scatter_map : numpy array of complex
+        the scattering network, with shape (num_sources, num_sinks, 3) for a single wavelength, or
+        (wavelengths, num_sources, num_sinks, 3) for an array of wavelengths
+    """
+    if np.ndim(wavelength) == 0:
+        return EM.EMGPUFreqDomain(
+            num_sources,
+            num_sinks,
+            full_index,
+            point_information,
+            wavelength,
+            scene=scene,
+        )
+    path_lengths, polar_coefficients = EM.EMGPUJointPathLengthandPolar(
+        num_sources, num_sinks, full_index, point_information, scene=scene
+    )
+    return EM.EMFrequencySweep(
+        num_sources,
+        num_sinks,
+        full_index,
+        path_lengths,
+        polar_coefficients,
+        wavelength,
+    )
+
+
+def transfer_networks(
+    num_sources, num_sinks, full_index, point_information, wavelength, scene=None
+):
+    """
+    Calculate the transfer tensor between each source and sink, relating the source excitation vector to the field
+    at the sink. The propagation is linear in the source excitation, so the tensor is built from three launches, with
+    the sources excited along the x, y and z axes in turn. Any excitation can then be applied with
+    :func:`lyceanem.electromagnetics.empropagation.apply_transfer_tensor`.
+
+    Parameters
+    ----------
+    num_sources : int
+        the number of source points
+    num_sinks : int
+        the number of sink points
+    full_index : 2D numpy array of int or :class:`lyceanem.raycasting.pathstore.path_store`
+        index of all successful rays
+    point_information : :type:`lyceanem.base_types.scattering_point`
+        the point information for all sources, sinks and scattering points, the source excitations are ignored
+    wavelength : float or 1D numpy array of float
+        the wavelength or wavelengths of interest in metres
+    scene : :class:`lyceanem.raycasting.rayfunctions.raycasting_scene`
+        the scene used for raycasting, defaults to [None]
+
+    Returns
+    -------
+    transfer_tensor : numpy array of complex
+        the transfer tensor, with shape (num_sources, num_sinks, 3, 3), with the field components along the third
+        axis and the excitation components along the last axis. An array of wavelengths adds a leading wavelength axis
+    """
+    unit_excitation = point_information.copy()
+    networks = []
+    for axis in ["ex", "ey", "ez"]:
+        unit_excitation[0:num_sources]["ex"] = 0.0
+        unit_excitation[0:num_sources]["ey"] = 0.0
+        unit_excitation[0:num_sources]["ez"] = 0.0
+        unit_excitation[0:num_sources][axis] = 1.0
+        networks.append(
+            frequency_networks(
+                num_sources,
+                num_sinks,
+                full_index,
+                unit_excitation,
+                wavelength,
+                scene,
+            )
+        )
+    return np.stack(networks, axis=-1)
 
 
 def aperture_projection(
@@ -44,8 +148,9 @@ def aperture_projection(
     """
     if environment is None:
         blocking_triangles = RF.convertTriangles(aperture)
+        blocking_bvh = None
     else:
-        blocking_triangles = environment.triangles_base_raycaster()
+        blocking_triangles, blocking_bvh = environment.raycaster_environment()
 
     directivity_envelope = np.zeros(
         (elev_range.shape[0], az_range.shape[0]), dtype=np.float32
@@ -60,6 +165,7 @@ def aperture_projection(
         vertex_area=triangle_areas,
         az_range=az_range,
         elev_range=elev_range,
+        bvh_nodes=blocking_bvh,
     )
     directivity_envelope[:, :] = (4 * np.pi * visible_patterns) / (wavelength ** 2)
 
@@ -102,7 +208,8 @@ def calculate_farfield(
     scatter_points : open3d point cloud
         the environment scattering points, defaults to [None]
     wavelength : float
-        wavelength of interest in meters, defaults to [1]
+        wavelength of interest in meters, defaults to [1], an array of wavelengths adds a leading wavelength axis to
+        the results, as for :func:`calculate_farfield_sweep`
     farfield_distance : float
         the distance to evaluate the antenna pattern, defaults to [2]
     scattering: int
@@ -143,7 +250,7 @@ def calculate_farfield(
     sink_cloud.normals = o3d.utility.Vector3dVector(sink_normals)
     num_sources = len(np.asarray(aperture_coords.points))
     num_sinks = len(np.asarray(sink_cloud.points))
-    environment_triangles = antenna_solid.triangles_base_raycaster()
+    environment_triangles, environment_bvh = antenna_solid.raycaster_environment()
     if project_vectors:
         conformal_E_vectors = EM.calculate_conformalVectors(
             desired_E_axis, np.asarray(aperture_coords.normals), antenna_axes
@@ -229,7 +336,7 @@ def calculate_farfield(
         # create scatter points on antenna solids based upon a half wavelength square
         if scatter_points is None:
             scatter_points, areas = TL.source_cloud_from_shape(
-                antenna_solid, 1e-6, (wavelength * mesh_resolution) ** 2 / 2.0
+                antenna_solid, 1e-6, (np.min(wavelength) * mesh_resolution) ** 2 / 2.0
             )
 
         unified_model = np.append(
@@ -336,6 +443,10 @@ def calculate_farfield(
     #                                                        point_informationv2,
     #                                                        RF.convertTriangles(antenna_solid),
     #                                                        scatter_mask)
+    # the environment and point information are uploaded once, and reused for raycasting and the EM kernels
+    scene = RF.raycasting_scene(
+        environment_triangles, environment_bvh, point_information=point_informationv2
+    )
     full_index, rays = RF.workchunkingv2(
         np.asarray(aperture_coords.points).astype(np.float32),
         sinks,
@@ -343,84 +454,56 @@ def calculate_farfield(
         environment_triangles,
         scattering + 1,
         line_of_sight=los,
+        scene=scene,
+        compact=True,
+        direction="auto",
     )
 
     if elements:
-        # create efiles for model
-        etheta = np.zeros(
-            (num_sources, el_range.shape[0], az_range.shape[0]), dtype=np.complex64
-        )
-        ephi = np.zeros(
-            (num_sources, el_range.shape[0], az_range.shape[0]), dtype=np.complex64
+        # the scattering network holds the contribution of each source separately, so every element pattern is
+        # sliced from a single launch with all the elements excited
+        point_informationv2[0:num_sources]["ex"] = conformal_E_vectors[:, 0] / num_sources
+        point_informationv2[0:num_sources]["ey"] = conformal_E_vectors[:, 1] / num_sources
+        point_informationv2[0:num_sources]["ez"] = conformal_E_vectors[:, 2] / num_sources
+        scatter_map = frequency_networks(
+            num_sources,
+            num_sinks,
+            full_index,
+            point_informationv2,
+            wavelength,
+            scene,
         )
-        Ex = np.zeros(
-            (num_sources, el_range.shape[0], az_range.shape[0]), dtype=np.complex64
+        field_shape = scatter_map.shape[:-3] + (
+            num_sources,
+            el_range.shape[0],
+            az_range.shape[0],
         )
-        Ey = np.zeros(
-            (num_sources, el_range.shape[0], az_range.shape[0]), dtype=np.complex64
-        )
-        Ez = np.zeros(
-            (num_sources, el_range.shape[0], az_range.shape[0]), dtype=np.complex64
+        Ex = scatter_map[..., 0].reshape(field_shape).astype(np.complex64)
+        Ey = scatter_map[..., 1].reshape(field_shape).astype(np.complex64)
+        Ez = scatter_map[..., 2].reshape(field_shape).astype(np.complex64)
+        etheta = (
+            Ex * np.cos(np.deg2rad(azaz)) * np.cos(np.deg2rad(theta))
+            + Ey * np.sin(np.deg2rad(azaz)) * np.cos(np.deg2rad(theta))
+            - Ez * np.sin(np.deg2rad(theta))
+        ).astype(np.complex64)
+        ephi = (-Ex * np.sin(np.deg2rad(azaz)) + Ey * np.cos(np.deg2rad(azaz))).astype(
+            np.complex64
         )
 
-        for element in range(num_sources):
-            point_informationv2[0:num_sources]["ex"] = 0.0
-            point_informationv2[0:num_sources]["ey"] = 0.0
-            point_informationv2[0:num_sources]["ez"] = 0.0
-            point_informationv2[element]["ex"] = (
-                conformal_E_vectors[element, 0] / num_sources
-            )
-            point_informationv2[element]["ey"] = (
-                conformal_E_vectors[element, 1] / num_sources
-            )
-            point_informationv2[element]["ez"] = (
-                conformal_E_vectors[element, 2] / num_sources
-            )
-            # unified_weights[0:num_sources, :] = 0.0
-            # unified_weights[element, :] = (conformal_E_vectors[element, :] / num_sources)*v_transmit
-            scatter_map = EM.EMGPUFreqDomain(
-                num_sources, sinks.shape[0], full_index, point_informationv2, wavelength
-            )
-            Ex[element, :, :] = np.dot(
-                np.ones((num_sources)), scatter_map[:, :, 0]
-            ).reshape(el_range.shape[0], az_range.shape[0])
-            Ey[element, :, :] = np.dot(
-                np.ones((num_sources)), scatter_map[:, :, 1]
-            ).reshape(el_range.shape[0], az_range.shape[0])
-            Ez[element, :, :] = np.dot(
-                np.ones((num_sources)), scatter_map[:, :, 2]
-            ).reshape(el_range.shape[0], az_range.shape[0])
-            etheta[element, :, :] = (
-                Ex[element, :, :] * np.cos(np.deg2rad(azaz)) * np.cos(np.deg2rad(theta))
-                + Ey[element, :, :]
-                * np.sin(np.deg2rad(azaz))
-                * np.cos(np.deg2rad(theta))
-                - Ez[element, :, :] * np.sin(np.deg2rad(theta))
-            )
-            ephi[element, :, :] = -Ex[element, :, :] * np.sin(np.deg2rad(azaz)) + Ey[
-                element, :, :
-            ] * np.cos(np.deg2rad(azaz))
-
     else:
         # create efiles for model
-        etheta = np.zeros((el_range.shape[0], az_range.shape[0]), dtype=np.complex64)
-        ephi = np.zeros((el_range.shape[0], az_range.shape[0]), dtype=np.complex64)
-        Ex = np.zeros((el_range.shape[0], az_range.shape[0]), dtype=np.complex64)
-        Ey = np.zeros((el_range.shape[0], az_range.shape[0]), dtype=np.complex64)
-        Ez = np.zeros((el_range.shape[0], az_range.shape[0]), dtype=np.complex64)
-        scatter_map = EM.EMGPUFreqDomain(
-            num_sources, num_sinks, full_index, point_informationv2, wavelength
-        )
-
-        Ex[:, :] = np.sum(scatter_map[:, :, 0], axis=0).reshape(
-            el_range.shape[0], az_range.shape[0]
-        )
-        Ey[:, :] = np.sum(scatter_map[:, :, 1], axis=0).reshape(
-            el_range.shape[0], az_range.shape[0]
-        )
-        Ez[:, :] = np.sum(scatter_map[:, :, 2], axis=0).reshape(
-            el_range.shape[0], az_range.shape[0]
+        scatter_map = frequency_networks(
+            num_sources,
+            num_sinks,
+            full_index,
+            point_informationv2,
+            wavelength,
+            scene,
         )
+        field_shape = scatter_map.shape[:-3] + (el_range.shape[0], az_range.shape[0])
+        Ex = np.sum(scatter_map[..., 0], axis=-2).reshape(field_shape).astype(np.complex64)
+        Ey = np.sum(scatter_map[..., 1], axis=-2).reshape(field_shape).astype(np.complex64)
+        Ez = np.sum(scatter_map[..., 2], axis=-2).reshape(field_shape).astype(np.complex64)
         # convert to etheta,ephi
         etheta = (
             Ex * np.cos(np.deg2rad(azaz)) * np.cos(np.deg2rad(theta))
@@ -429,6 +512,7 @@ def calculate_farfield(
         )
         ephi = -Ex * np.sin(np.deg2rad(azaz)) + Ey * np.cos(np.deg2rad(azaz))
 
+    scene.release()
     return etheta, ephi
 
 
@@ -444,7 +528,8 @@ def calculate_scattering(
     los=True,
     mesh_resolution=0.5,
     project_vectors=False,
-    antenna_axes=np.eye(3)
+    antenna_axes=np.eye(3),
+    transfer_tensor=False,
 ):
     """
     calculating the scattering from the provided source coordinates, to the provided sink coordinates in the environment.
@@ -463,7 +548,8 @@ def calculate_scattering(
     scatter_points : :class:`open3d.geometry.PointCloud`
         the scattering points in the environment. Defaults to [None], in which case scattering points will be generated from the antenna_solid. If no scattering should be considered then set scattering to [0].
     wavelength : float
-        the wavelength of interest in metres
+        the wavelength of interest in metres, an array of wavelengths adds a leading wavelength axis to the results,
+        as for :func:`calculate_scattering_sweep`
     scattering : int
         the number of reflections to be considered, defaults to [0], but up to 2 can be considered. The higher this number to greater to computational effort, and for most situations 1 should be ample.
     elements : boolean
@@ -473,7 +559,9 @@ def calculate_scattering(
     mesh_resolution : float
         the desired mesh resolution in terms of wavelengths if scattering points are not provided. A scattering mesh is generated on the surfaces of all provided trianglemesh structures.
     project_vectors : boolean
-
+    transfer_tensor : boolean
+        if True, the transfer tensor from :func:`transfer_networks` is returned instead of the fields, allowing any
+        excitation to be applied afterwards, see :func:`calculate_transfer_tensor`, defaults to [False]
 
     Returns
     -------
@@ -493,7 +581,7 @@ def calculate_scattering(
     num_sources = len(np.asarray(aperture_coords.points))
     num_sinks = len(np.asarray(sink_coords.points))
 
-    environment_triangles = antenna_solid.triangles_base_raycaster()
+    environment_triangles, environment_bvh = antenna_solid.raycaster_environment()
     if not multiE:
         if project_vectors:
             conformal_E_vectors = EM.calculate_conformalVectors(
@@ -595,7 +683,7 @@ def calculate_scattering(
         # create scatter points on antenna solids based upon a half wavelength square
         if scatter_points is None:
             scatter_points, areas = TL.source_cloud_from_shape(
-                antenna_solid, 1e-6, (wavelength * mesh_resolution) ** 2
+                antenna_solid, 1e-6, (np.min(wavelength) * mesh_resolution) ** 2
             )
 
         if not multiE:
@@ -734,6 +822,10 @@ def calculate_scattering(
     #                                                        RF.convertTriangles(antenna_solid),
     #                                                        scatter_mask)
 
+    # the environment and point information are uploaded once, and reused for raycasting and the EM kernels
+    scene = RF.raycasting_scene(
+        environment_triangles, environment_bvh, point_information=point_informationv2
+    )
     full_index, rays = RF.workchunkingv2(
         np.asarray(aperture_coords.points).astype(np.float32),
         np.asarray(sink_coords.points).astype(np.float32),
@@ -741,36 +833,53 @@ def calculate_scattering(
         environment_triangles,
         scattering + 1,
         line_of_sight=los,
+        scene=scene,
+        compact=True,
+        direction="auto",
     )
 
+    if transfer_tensor:
+        transfer = transfer_networks(
+            num_sources, num_sinks, full_index, point_informationv2, wavelength, scene
+        )
+        scene.release()
+        return transfer
+
     if not elements:
         # create efiles for model
         if multiE:
-            Ex = np.zeros((desired_E_axis.shape[0]), dtype=np.complex64)
-            Ey = np.zeros((desired_E_axis.shape[0]), dtype=np.complex64)
-            Ez = np.zeros((desired_E_axis.shape[0]), dtype=np.complex64)
+            Ex = np.zeros(np.shape(wavelength) + (desired_E_axis.shape[0],), dtype=np.complex64)
+            Ey = np.zeros(np.shape(wavelength) + (desired_E_axis.shape[0],), dtype=np.complex64)
+            Ez = np.zeros(np.shape(wavelength) + (desired_E_axis.shape[0],), dtype=np.complex64)
+            # the propagation is linear in the source excitation, so the transfer tensor is calculated once, and
+            # each excitation is applied to it
+            transfer = transfer_networks(
+                num_sources, num_sinks, full_index, point_informationv2, wavelength, scene
+            )
             for e_inc in range(desired_E_axis.shape[0]):
                 conformal_E_vectors = EM.calculate_conformalVectors(
                     desired_E_axis[e_inc, :],
                     np.asarray(aperture_coords.normals).astype(np.float32),
+                    antenna_axes,
                 )
-                unified_weights[0:num_sources, :] = conformal_E_vectors / num_sources
-                point_informationv2[:]["ex"] = unified_weights[:, 0]
-                point_informationv2[:]["ey"] = unified_weights[:, 1]
-                point_informationv2[:]["ez"] = unified_weights[:, 2]
-                scatter_map = EM.EMGPUFreqDomain(
-                    num_sources, num_sinks, full_index, point_informationv2, wavelength
+                scatter_map = EM.apply_transfer_tensor(
+                    transfer, conformal_E_vectors / num_sources
                 )
-                Ex[e_inc] = np.sum(np.dot(np.ones((num_sources)), scatter_map[:, :, 0]))
-                Ey[e_inc] = np.sum(np.dot(np.ones((num_sources)), scatter_map[:, :, 1]))
-                Ez[e_inc] = np.sum(np.dot(np.ones((num_sources)), scatter_map[:, :, 2]))
+                Ex[..., e_inc] = np.sum(scatter_map[..., 0], axis=(-2, -1))
+                Ey[..., e_inc] = np.sum(scatter_map[..., 1], axis=(-2, -1))
+                Ez[..., e_inc] = np.sum(scatter_map[..., 2], axis=(-2, -1))
         else:
-            scatter_map = EM.EMGPUFreqDomain(
-                num_sources, num_sinks, full_index, point_informationv2, wavelength
+            scatter_map = frequency_networks(
+                num_sources,
+                num_sinks,
+                full_index,
+                point_informationv2,
+                wavelength,
+                scene,
             )
-            Ex = np.sum(np.dot(np.ones((num_sources)), scatter_map[:, :, 0]))
-            Ey = np.sum(np.dot(np.ones((num_sources)), scatter_map[:, :, 1]))
-            Ez = np.sum(np.dot(np.ones((num_sources)), scatter_map[:, :, 2]))
+            Ex = np.sum(scatter_map[..., 0], axis=(-2, -1))
+            Ey = np.sum(scatter_map[..., 1], axis=(-2, -1))
+            Ez = np.sum(scatter_map[..., 2], axis=(-2, -1))
 
         # convert to etheta,ephi
 
@@ -808,6 +917,7 @@ def calculate_scattering(
                         full_index,
                         point_informationv2,
                         wavelength,
+                        scene=scene,
                     )
                     Ex[element, :, e_inc] = np.dot(
                         np.ones((num_sources)), scatter_map[:, :, 0]
@@ -819,36 +929,382 @@ def calculate_scattering(
                         np.ones((num_sources)), scatter_map[:, :, 2]
                     )
         else:
-            Ex = np.zeros((num_sources, num_sinks), dtype=np.complex64)
-            Ey = np.zeros((num_sources, num_sinks), dtype=np.complex64)
-            Ez = np.zeros((num_sources, num_sinks), dtype=np.complex64)
-            for element in range(num_sources):
-                point_informationv2[0:num_sources]["ex"] = 0.0
-                point_informationv2[0:num_sources]["ey"] = 0.0
-                point_informationv2[0:num_sources]["ez"] = 0.0
-                point_informationv2[element]["ex"] = (
-                    conformal_E_vectors[element, 0] #/ num_sources
-                )
-                point_informationv2[element]["ey"] = (
-                    conformal_E_vectors[element, 1] #/ num_sources
-                )
-                point_informationv2[element]["ez"] = (
-                    conformal_E_vectors[element, 2] #/ num_sources
-                )
-                unified_weights[0:num_sources, :] = 0.0
-                unified_weights[element, :] = (
-                    conformal_E_vectors[element, :] #/ num_sources
-                )
-                scatter_map = EM.EMGPUFreqDomain(
-                    num_sources, num_sinks, full_index, point_informationv2, wavelength
-                )
-                Ex[element, :] = np.dot(np.ones((num_sources)), scatter_map[:, :, 0])
-                Ey[element, :] = np.dot(np.ones((num_sources)), scatter_map[:, :, 1])
-                Ez[element, :] = np.dot(np.ones((num_sources)), scatter_map[:, :, 2])
+            # each element response is a row of the scattering network from a single launch
+            point_informationv2[0:num_sources]["ex"] = conformal_E_vectors[:, 0]
+            point_informationv2[0:num_sources]["ey"] = conformal_E_vectors[:, 1]
+            point_informationv2[0:num_sources]["ez"] = conformal_E_vectors[:, 2]
+            unified_weights[0:num_sources, :] = conformal_E_vectors
+            scatter_map = frequency_networks(
+                num_sources,
+                num_sinks,
+                full_index,
+                point_informationv2,
+                wavelength,
+                scene,
+            )
+            Ex = scatter_map[..., 0].astype(np.complex64)
+            Ey = scatter_map[..., 1].astype(np.complex64)
+            Ez = scatter_map[..., 2].astype(np.complex64)
 
+    scene.release()
     return Ex, Ey, Ez
 
 
+def calculate_transfer_tensor(
+    aperture_coords,
+    sink_coords,
+    antenna_solid,
+    scatter_points=None,
+    wavelength=1.0,
+    scattering=0,
+    los=True,
+    mesh_resolution=0.5,
+):
+    """
+    Calculate the excitation independent transfer tensor from each source to each sink, so that any excitation vector
+    or beamforming weights can be applied afterwards with
+    :func:`lyceanem.electromagnetics.empropagation.apply_transfer_tensor`, without raycasting or launching the
+    electromagnetics kernels again.
+
+    Parameters
+    ----------
+    aperture_coords : :class:`open3d.geometry.PointCloud`
+        source coordinates
+    sink_coords : :class:`open3d.geometry.PointCloud`
+        sink coordinates
+    antenna_solid : :class:`lyceanem.base_classes.structures`
+        the class should contain all the environment for scattering, providing the blocking for the rays
+    scatter_points : :class:`open3d.geometry.PointCloud`
+        the scattering points in the environment, defaults to [None]
+    wavelength : float
+        the wavelength of interest in metres, an array of wavelengths adds a leading wavelength axis
+    scattering : int
+        the number of reflections to be considered, defaults to [0]
+    los : boolean
+        The line of sight component can be ignored by setting los to [False], defaults to [True]
+    mesh_resolution : float
+        the desired mesh resolution in terms of wavelengths if scattering points are not provided
+
+    Returns
+    -------
+    transfer_tensor : numpy array of complex
+        the transfer tensor, with shape (sources, sinks, 3, 3), mapping the excitation vector of each source (last
+        axis) to the field at each sink (third axis)
+
+    """
+    return calculate_scattering(
+        aperture_coords,
+        sink_coords,
+        antenna_solid,
+        np.array([1.0, 0.0, 0.0]),
+        scatter_points=scatter_points,
+        wavelength=wavelength,
+        scattering=scattering,
+        los=los,
+        mesh_resolution=mesh_resolution,
+        transfer_tensor=True,
+    )
+
+
+def calculate_farfield_sweep(
+    aperture_coords,
+    antenna_solid,
+    desired_E_axis,
+    az_range,
+    el_range,
+    wavelengths,
+    scatter_points=None,
+    farfield_distance=2.0,
+    scattering=0,
+    source_weights=None,
+    scattering_weight=1.0,
+    mesh_resolution=0.5,
+    elements=False,
+    los=True,
+    project_vectors=False,
+    antenna_axes=np.eye(3),
+):
+    """
+    Frequency sweep version of :func:`calculate_farfield`. The raycasting only depends upon the geometry, so it is
+    performed once, and the path lengths and polarisation of each path are reused for every wavelength.
+    If scattering points are generated from the antenna_solid, the mesh resolution is based upon the shortest
+    wavelength.
+
+    Parameters
+    ---------
+    aperture_coords : :class:`open3d.geometry.PointCloud`
+        open3d of the aperture coordinates, from a single point to a mesh sampling across and aperture or surface
+    antenna_solid : :class:`lyceanem.base_classes.structures`
+        the class should contain all the environment for scattering, providing the blocking for the rays
+    desired_E_axis :
+        1*3 numpy array of the desired excitation vector
+    az_range : 1D numpy array of float
+        the desired azimuth planes in degrees
+    el_range : 1D numpy array of float
+        the desired elevation planes in degrees
+    wavelengths : 1D numpy array of float
+        the wavelengths of interest in meters
+    scatter_points : open3d point cloud
+        the environment scattering points, defaults to [None]
+    farfield_distance : float
+        the distance to evaluate the antenna pattern, defaults to [2]
+    scattering: int
+        the number of scatters required, defaults to [0]
+    source_weights : numpy array complex
+        the desired source weights if the source field is to be specified explicitly, defaults to [None]
+    scattering_weight :
+    mesh_resolution :
+    elements : boolean
+        whether the sources and sinks should be considered as elements of a phased array, defaults to [False]
+    los : boolean
+        The line of sight component can be ignored by setting los to [False], defaults to [True]
+    project_vectors : boolean
+        should the excitation vector/vectors be projected to be conformal with the surface of the source coordinates
+
+    Returns
+    ---------
+    etheta : numpy array of complex
+        The Etheta farfield component, with the wavelength as the first axis
+    ephi : numpy array of complex
+        The EPhi farfield component, with the wavelength as the first axis
+    """
+    return calculate_farfield(
+        aperture_coords,
+        antenna_solid,
+        desired_E_axis,
+        az_range,
+        el_range,
+        scatter_points=scatter_points,
+        wavelength=np.atleast_1d(np.asarray(wavelengths, dtype=np.float64)),
+        farfield_distance=farfield_distance,
+        scattering=scattering,
+        source_weights=source_weights,
+        scattering_weight=scattering_weight,
+        mesh_resolution=mesh_resolution,
+        elements=elements,
+        los=los,
+        project_vectors=project_vectors,
+        antenna_axes=antenna_axes,
+    )
+
+
+def calculate_scattering_sweep(
+    aperture_coords,
+    sink_coords,
+    antenna_solid,
+    desired_E_axis,
+    wavelengths,
+    scatter_points=None,
+    scattering=0,
+    elements=False,
+    los=True,
+    mesh_resolution=0.5,
+    project_vectors=False,
+    antenna_axes=np.eye(3),
+):
+    """
+    Frequency sweep version of :func:`calculate_scattering`. The raycasting only depends upon the geometry, so it is
+    performed once, and the path lengths and polarisation of each path are reused for every wavelength.
+    If scattering points are generated from the antenna_solid, the mesh resolution is based upon the shortest
+    wavelength.
+
+    Parameters
+    ----------
+    aperture_coords : :class:`open3d.geometry.PointCloud`
+        source coordinates
+    sink_coords : :class:`open3d.geometry.PointCloud`
+        sink coordinates
+    antenna_solid : :class:`lyceanem.base_classes.structures`
+        the class should contain all the environment for scattering, providing the blocking for the rays
+    desired_E_axis : 1D numpy array of floats
+        the desired excitation vector, can be a 1*3 array or a n*3 array if multiple different exciations are desired in one lauch
+    wavelengths : 1D numpy array of float
+        the wavelengths of interest in metres
+    scatter_points : :class:`open3d.geometry.PointCloud`
+        the scattering points in the environment, defaults to [None]
+    scattering : int
+        the number of reflections to be considered, defaults to [0]
+    elements : boolean
+        whether the sources and sinks should be considered as elements of a phased array, defaults to [False]
+    los : boolean
+        The line of sight component can be ignored by setting los to [False], defaults to [True]
+    mesh_resolution : float
+        the desired mesh resolution in terms of wavelengths if scattering points are not provided
+    project_vectors : boolean
+
+    Returns
+    -------
+    Ex : numpy array of complex
+        with the wavelength as the first axis
+    Ey : numpy array of complex
+        with the wavelength as the first axis
+    Ez : numpy array of complex
+        with the wavelength as the first axis
+
+    """
+    return calculate_scattering(
+        aperture_coords,
+        sink_coords,
+        antenna_solid,
+        desired_E_axis,
+        scatter_points=scatter_points,
+        wavelength=np.atleast_1d(np.asarray(wavelengths, dtype=np.float64)),
+        scattering=scattering,
+        elements=elements,
+        los=los,
+        mesh_resolution=mesh_resolution,
+        project_vectors=project_vectors,
+        antenna_axes=antenna_axes,
+    )
+
+
+def calculate_coverage(
+    aperture_coords,
+    sink_coords,
+    antenna_solid,
+    desired_E_axis,
+    scatter_points=None,
+    wavelength=1.0,
+    scattering=0,
+    los=True,
+    mesh_resolution=0.5,
+    project_vectors=False,
+    antenna_axes=np.eye(3),
+    batch_size=None,
+    filename=None,
+):
+    """
+    Coverage map version of :func:`calculate_scattering`, calculating the field at a large number of sink positions,
+    such as a grid of receiver positions over a platform. The sinks are processed in tiles of batch_size, so the
+    memory used does not grow with the number of sinks. The rays from the sources to the scattering points do not
+    depend upon the sinks, so they are cast once and shared between all the tiles, and the environment is uploaded
+    once. The field at each tile of sinks is written to the output as it is completed, which can be a memory mapped
+    .npy file.
+
+    Parameters
+    ----------
+    aperture_coords : :class:`open3d.geometry.PointCloud`
+        source coordinates
+    sink_coords : :class:`open3d.geometry.PointCloud`
+        sink coordinates, the normals are not required
+    antenna_solid : :class:`lyceanem.base_classes.structures`
+        the class should contain all the environment for scattering, providing the blocking for the rays
+    desired_E_axis : numpy array of complex
+        the desired excitation vector, either 1*3 for all the sources, or n*3 for each source
+    scatter_points : :class:`open3d.geometry.PointCloud`
+        the scattering points in the environment, defaults to [None], in which case scattering points will be
+        generated from the antenna_solid
+    wavelength : float
+        the wavelength of interest in metres, an array of wavelengths adds a leading wavelength axis to the results
+    scattering : int
+        the number of reflections to be considered, defaults to [0]
+    los : boolean
+        The line of sight component can be ignored by setting los to [False], defaults to [True]
+    mesh_resolution : float
+        the desired mesh resolution in terms of wavelengths if scattering points are not provided
+    project_vectors : boolean
+        should the excitation vector be projected to be conformal with the surface of the source coordinates,
+        defaults to [False]
+    antenna_axes : 3 by 3 numpy array of float
+        the axes of the antenna, used if the excitation is projected, defaults to [np.eye(3)]
+    batch_size : int
+        the number of sinks in each tile, defaults to [None], estimating the number of sinks which can be processed
+        within COVERAGE_BATCH_BYTES
+    filename : str or :class:`pathlib.Path`
+        if provided, the results are written to a memory mapped .npy file at this location, defaults to [None],
+        holding the results in memory
+
+    Returns
+    -------
+    coverage : numpy array of complex64
+        the Ex, Ey and Ez field at each sink from all the sources, with shape (sinks, 3), or (wavelengths, sinks, 3)
+        for an array of wavelengths. A :class:`numpy.memmap` if a filename is provided.
+
+    """
+    source_points, source_normals = cloud_arrays(aperture_coords)
+    sink_points, sink_normals = cloud_arrays(sink_coords)
+    num_sources = source_points.shape[0]
+    num_sinks = sink_points.shape[0]
+    conformal_E_vectors = excitation_vectors(
+        desired_E_axis,
+        source_normals,
+        project_vectors=project_vectors,
+        antenna_axes=antenna_axes,
+    )
+    scatter_points = scattering_cloud(
+        antenna_solid, scatter_points, wavelength, scattering, mesh_resolution
+    )
+    scattering_points, scattering_normals = cloud_arrays(scatter_points)
+
+    if batch_size is None:
+        # estimate of the paths and scattering network for each sink
+        sink_bytes = num_sources * (
+            (1 + scattering_points.shape[0]) * (scattering + 2) * 4
+            + 3 * 16 * np.size(wavelength)
+        )
+        batch_size = int(max(1, COVERAGE_BATCH_BYTES // sink_bytes))
+
+    shape = np.shape(wavelength) + (num_sinks, 3)
+    if filename is None:
+        coverage = np.zeros(shape, dtype=np.complex64)
+    else:
+        coverage = np.lib.format.open_memmap(
+            filename, mode="w+", dtype=np.complex64, shape=shape
+        )
+
+    environment_triangles, environment_bvh = antenna_solid.raycaster_environment()
+    with RF.raycasting_scene(environment_triangles, environment_bvh) as scene:
+        if scattering > 0:
+            # the first leg of the scattered paths is shared between the tiles
+            first_leg, _ = RF.transmitter_paths(
+                source_points, scattering_points, scene
+            )
+        else:
+            first_leg = None
+        for start in range(0, num_sinks, batch_size):
+            tile = slice(start, min(start + batch_size, num_sinks))
+            tile_sinks = sink_points[tile]
+            point_information = unified_point_information(
+                np.concatenate((source_points, tile_sinks, scattering_points), axis=0),
+                np.concatenate(
+                    (source_normals, sink_normals[tile], scattering_normals), axis=0
+                ),
+                np.concatenate(
+                    (
+                        conformal_E_vectors,
+                        np.ones((tile_sinks.shape[0], 3), dtype=np.complex64),
+                        np.ones((scattering_points.shape[0], 3), dtype=np.complex64),
+                    ),
+                    axis=0,
+                ),
+            )
+            paths, _ = RF.workchunkingv2(
+                source_points,
+                tile_sinks,
+                scattering_points,
+                environment_triangles,
+                scattering + 1,
+                line_of_sight=los,
+                scene=scene,
+                compact=True,
+                first_leg=first_leg,
+                direction="auto",
+            )
+            scatter_map = frequency_networks(
+                num_sources,
+                tile_sinks.shape[0],
+                paths,
+                point_information,
+                wavelength,
+                scene,
+            )
+            coverage[..., tile, :] = np.sum(scatter_map, axis=-3)
+
+    if filename is not None:
+        coverage.flush()
+    return coverage
+
+
 def calculate_scattering_isotropic(
     aperture_coords,
     sink_coords,
@@ -864,6 +1320,7 @@ def calculate_scattering_isotropic(
     """
     num_sources = len(np.asarray(aperture_coords.points))
     num_sinks = len(np.asarray(sink_coords.points))
+    environment_triangles, environment_bvh = antenna_solid.raycaster_environment()
 
     if scattering == 0:
         # only use the aperture point cloud, no scattering required.
@@ -1051,12 +1508,18 @@ def calculate_scattering_isotropic(
     #                                                        point_informationv2,
     #                                                        RF.convertTriangles(antenna_solid),
     #                                                        scatter_mask)
+    # the environment and point information are uploaded once, and reused for raycasting and the EM kernels
+    scene = RF.raycasting_scene(
+        environment_triangles, environment_bvh, point_information=point_informationv2
+    )
     full_index, rays = RF.workchunkingv2(
         np.asarray(aperture_coords.points).astype(np.float32),
         np.asarray(sink_coords.points).astype(np.float32),
         np.asarray(scatter_points.points).astype(np.float32),
-        antenna_solid.triangles_base_raycaster(),
+        environment_triangles,
         scattering + 1,
+        scene=scene,
+        direction="auto",
     )
 
     if not elements:
@@ -1085,10 +1548,16 @@ def calculate_scattering_isotropic(
             unified_weights[0:num_sources, :] = 0.0
             unified_weights[element, :] = 1.0 / num_sources
             scatter_map = EM.EMGPUFreqDomain(
-                num_sources, num_sinks, full_index, point_informationv2, wavelength
+                num_sources,
+                num_sinks,
+                full_index,
+                point_informationv2,
+                wavelength,
+                scene=scene,
             )
             final_scattering_map[element, :] = np.dot(
                 np.ones((num_sources)), scatter_map[:, :, 0]
             )
 
+    scene.release()
     return final_scattering_map
@@ -0,0 +1,165 @@
+import numpy as np
+import open3d as o3d
+
+from ..base_types import unified_point_information
+from ..electromagnetics import empropagation as EM
+from ..geometry import targets as TL
+
+
+def excitation_vectors(
+    desired_E_axis, source_normals, project_vectors=True, antenna_axes=np.eye(3)
+):
+    """
+    The excitation vector of each source, from the desired excitation for the whole aperture or for each source.
+
+    Parameters
+    ----------
+    desired_E_axis : numpy array of complex
+        the desired excitation vector, either 1*3 for all the sources, or n*3 for each source
+    source_normals : n by 3 numpy array of float
+        the normal vector of each source
+    project_vectors : bool
+        if True, the desired excitation vector is projected onto the surface of the aperture, defaults to [True]
+    antenna_axes : 3 by 3 numpy array of float
+        the orientation of the antenna, used if the excitation is projected, defaults to [np.eye(3)]
+
+    Returns
+    -------
+    conformal_E_vectors : n by 3 numpy array of complex
+        the excitation vector of each source
+    """
+    num_sources = source_normals.shape[0]
+    desired_E_axis = np.asarray(desired_E_axis)
+    if desired_E_axis.ndim == 1:
+        desired_E_axis = desired_E_axis.reshape(-1, 3)
+    if project_vectors:
+        return EM.calculate_conformalVectors(desired_E_axis, source_normals, antenna_axes)
+    if desired_E_axis.size == num_sources * 3:
+        return desired_E_axis.reshape(num_sources, 3)
+    return np.repeat(
+        desired_E_axis.reshape(1, 3).astype(np.complex64), num_sources, axis=0
+    )
+
+
+def scattering_cloud(
+    antenna_solid, scatter_points=None, wavelength=1.0, scattering=0, mesh_resolution=0.5
+):
+    """
+    The scattering points in the environment, generated from the antenna_solid if they are not provided.
+
+    Parameters
+    ----------
+    antenna_solid : :class:`lyceanem.base_classes.structures`
+        the environment for scattering
+    scatter_points : :class:`open3d.geometry.PointCloud`
+        the scattering points in the environment, defaults to [None], in which case scattering points will be
+        generated from the antenna_solid
+    wavelength : float
+        the wavelength of interest in metres, or an array of wavelengths, in which case the mesh is generated for the
+        shortest wavelength
+    scattering : int
+        the number of reflections to be considered, defaults to [0], in which case there are no scattering points
+    mesh_resolution : float
+        the desired mesh resolution in terms of wavelengths if scattering points are not provided, defaults to [0.5]
+
+    Returns
+    -------
+    scatter_points : :class:`open3d.geometry.PointCloud`
+        the scattering points
+    """
+    if scattering == 0:
+        return o3d.geometry.PointCloud()
+    if scatter_points is None:
+        scatter_points, _ = TL.source_cloud_from_shape(
+            antenna_solid, 1e-6, (np.min(wavelength) * mesh_resolution) ** 2
+        )
+    return scatter_points
+
+
+def cloud_arrays(cloud):
+    """
+    The points and normals of a point cloud as n by 3 arrays of float32, with zero normals if the cloud has none.
+    """
+    points = np.asarray(cloud.points).astype(np.float32).reshape(-1, 3)
+    if cloud.has_normals():
+        normals = np.asarray(cloud.normals).astype(np.float32).reshape(-1, 3)
+    else:
+        normals = np.zeros((points.shape[0], 3), dtype=np.float32)
+    return points, normals
+
+
+def model_points(
+    aperture_coords,
+    sink_coords,
+    antenna_solid,
+    desired_E_axis,
+    scatter_points=None,
+    wavelength=1.0,
+    scattering=0,
+    mesh_resolution=0.5,
+    antenna_axes=np.eye(3),
+    project_vectors=True,
+):
+    """
+    The sources, sinks and scattering points of a model, and the point information for the EM kernels, with the total
+    amplitude of the aperture, the sinks and the scattering points each set to 1.
+
+    Parameters
+    ----------
+    aperture_coords : :class:`open3d.geometry.PointCloud`
+        source coordinates
+    sink_coords : :class:`open3d.geometry.PointCloud`
+        sink coordinates
+    antenna_solid : :class:`lyceanem.base_classes.structures`
+        the environment for scattering
+    desired_E_axis : numpy array of complex
+        the desired excitation vector, either 1*3 for all the sources, or n*3 for each source
+    scatter_points : :class:`open3d.geometry.PointCloud`
+        the scattering points in the environment, defaults to [None], in which case scattering points will be
+        generated from the antenna_solid
+    wavelength : float
+        the wavelength of interest in metres
+    scattering : int
+        the number of reflections to be considered, defaults to [0]
+    mesh_resolution : float
+        the desired mesh resolution in terms of wavelengths if scattering points are not provided, defaults to [0.5]
+    antenna_axes : 3 by 3 numpy array of float
+        the orientation of the antenna, defaults to [np.eye(3)]
+    project_vectors : bool
+        if True, the desired excitation vector is projected onto the surface of the aperture, defaults to [True]
+
+    Returns
+    -------
+    sources : n by 3 numpy array of float32
+    sinks : m by 3 numpy array of float32
+    scattering_points : o by 3 numpy array of float32
+    point_information : numpy array of :type:`lyceanem.base_types.scattering_t`
+        the point information for all sources, sinks and scattering points
+    """
+    conformal_E_vectors = excitation_vectors(
+        desired_E_axis,
+        np.asarray(aperture_coords.normals),
+        project_vectors=project_vectors,
+        antenna_axes=antenna_axes,
+    )
+    scatter_points = scattering_cloud(
+        antenna_solid, scatter_points, wavelength, scattering, mesh_resolution
+    )
+    sources, source_normals = cloud_arrays(aperture_coords)
+    sinks, sink_normals = cloud_arrays(sink_coords)
+    scattering_points, scattering_normals = cloud_arrays(scatter_points)
+    num_sources = sources.shape[0]
+    num_sinks = sinks.shape[0]
+    weights = np.ones(
+        (num_sources + num_sinks + scattering_points.shape[0], 3), dtype=np.complex64
+    )
+    weights[0:num_sources, :] = conformal_E_vectors / num_sources
+    weights[num_sources : num_sources + num_sinks, :] = 1 / num_sinks
+    if scattering_points.shape[0] > 0:
+        weights[num_sources + num_sinks :, :] = 1 / scattering_points.shape[0]
+    point_information = unified_point_information(
+        np.concatenate((sources, sinks, scattering_points), axis=0),
+        np.concatenate((source_normals, sink_normals, scattering_normals), axis=0),
+        weights,
+    )
+    return sources, sinks, scattering_points, point_information
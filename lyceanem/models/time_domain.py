@@ -1,12 +1,10 @@
 import numpy as np
-import open3d as o3d
 import scipy.constants
-import copy
 
-from ..base_types import scattering_t
 from ..electromagnetics import empropagation as EM
-from ..geometry import targets as TL
+from ..electromagnetics import impulseresponse as IR
 from ..raycasting import rayfunctions as RF
+from .model_points import model_points
 
 
 def calculate_scattering(
@@ -23,7 +21,8 @@ def calculate_scattering(
     num_samples=10000,
     mesh_resolution=0.5,
     antenna_axes=np.eye(3),
-    project_vectors=True
+    project_vectors=True,
+    filename=None,
 ):
     """
     Based upon the parameters given, calculate the time domain scattering for the apertures and sinks.
@@ -53,17 +52,21 @@ def calculate_scattering(
         the length of the desired sampling, can be calculated from the desired model time
     mesh_resolution : float
         the desired mesh resolution in terms of wavelengths if scattering points are not provided. A scattering mesh is generated on the surfaces of all provided trianglemesh structures.
+    filename : str or :class:`pathlib.Path`
+        if provided with elements=True and a single excitation vector, the element responses are written to a memory
+        mapped .npy file at this location, with shape (elements, sinks, samples, 3), defaults to [None], holding the
+        responses in memory
 
     Return
     -------
     Ex : numpy array of float
-        the x directed voltage at the sink coordinates in the time domain, if elements=True, then it will be an array of num_sinks * num_samples, otherwise it will be a 1D array
+        the x directed voltage at the sink coordinates in the time domain, if elements=True, then it will be an array of num_sources * num_sinks * num_samples, otherwise it will be a 1D array
     Ey : numpy array of float
-        the y directed voltage at the sink coordinates in the time domain, if elements=True, then it will be an array of num_sinks * num_samples, otherwise it will be a 1D array
+        the y directed voltage at the sink coordinates in the time domain, if elements=True, then it will be an array of num_sources * num_sinks * num_samples, otherwise it will be a 1D array
     Ez : numpy array of float
-        the z directed voltage at the sink coordinates in the time domain, if elements=True, then it will be an array of num_sinks * num_samples, otherwise it will be a 1D array
+        the z directed voltage at the sink coordinates in the time domain, if elements=True, then it will be an array of num_sources * num_sinks * num_samples, otherwise it will be a 1D array
     Waketimes : numpy array of float
-        the shortest time required for a ray to reach any sink from any source, as long as elements=False. If elements=True, then this is not implemented in the same way, and will return the shortest time required for the final source.
+        the shortest time required for a ray to reach any sink from any source. If elements=True with multiple excitation vectors, then this will return the shortest time required for the final source.
     """
 
     time_index = np.linspace(0, num_samples / sampling_freq, num_samples)
@@ -73,227 +76,37 @@ def calculate_scattering(
     else:
         multiE = False
 
-    num_sources = len(np.asarray(aperture_coords.points))
-    num_sinks = len(np.asarray(sink_coords.points))
-    environment_triangles = antenna_solid.triangles_base_raycaster()
-
-    if not multiE:
-        if project_vectors:
-            conformal_E_vectors = EM.calculate_conformalVectors(
-                desired_E_axis, np.asarray(aperture_coords.normals), antenna_axes
-            )
-        else:
-            if desired_E_axis.shape[0] == np.asarray(aperture_coords.normals).shape[0]:
-                conformal_E_vectors = copy.deepcopy(desired_E_axis)
-            else:
-                conformal_E_vectors = np.repeat(
-                    desired_E_axis.reshape(1, 3).astype(np.complex64), num_sources, axis=0
-                )
-    else:
-        if project_vectors:
-            conformal_E_vectors = EM.calculate_conformalVectors(
-                desired_E_axis, np.asarray(aperture_coords.normals), antenna_axes
-            )
-        else:
-            if desired_E_axis.size == 3:
-                conformal_E_vectors = np.repeat(
-                    desired_E_axis[0, :].astype(np.float32), num_sources, axis=0
-                ).reshape(num_sources, 3)
-            else:
-                conformal_E_vectors = desired_E_axis.reshape(num_sources, 3)
-
-    if scattering == 0:
-        # only use the aperture point cloud, no scattering required.
-        scatter_points = o3d.geometry.PointCloud()
-
-        unified_model = np.append(
-            np.asarray(aperture_coords.points).astype(np.float32),
-            np.asarray(sink_coords.points).astype(np.float32),
-            axis=0,
-        )
-        unified_normals = np.append(
-            np.asarray(aperture_coords.normals).astype(np.float32),
-            np.asarray(sink_coords.normals).astype(np.float32),
-            axis=0,
-        )
-        unified_weights = np.ones((unified_model.shape[0], 3), dtype=np.complex64)
-        unified_weights[0:num_sources, :] = (
-            conformal_E_vectors / num_sources
-        )  # set total amplitude to 1 for the aperture
-        unified_weights[num_sources : num_sources + num_sinks, :] = (
-            1 / num_sinks
-        )  # set total amplitude to 1 for the aperture
-        point_informationv2 = np.empty((len(unified_model)), dtype=scattering_t)
-        # set all sources as magnetic current sources, and permittivity and permeability as free space
-        point_informationv2[:]["Electric"] = True
-        point_informationv2[:]["permittivity"] = 8.8541878176e-12
-        point_informationv2[:]["permeability"] = 1.25663706212e-6
-        # set position, velocity, normal, and weight of sources
-        point_informationv2[0:num_sources]["px"] = np.asarray(
-            aperture_coords.points
-        ).astype(np.float32)[:, 0]
-        point_informationv2[0:num_sources]["py"] = np.asarray(
-            aperture_coords.points
-        ).astype(np.float32)[:, 1]
-        point_informationv2[0:num_sources]["pz"] = np.asarray(
-            aperture_coords.points
-        ).astype(np.float32)[:, 2]
-        point_informationv2[0:num_sources]["nx"] = np.asarray(
-            aperture_coords.normals
-        ).astype(np.float32)[:, 0]
-        point_informationv2[0:num_sources]["ny"] = np.asarray(
-            aperture_coords.normals
-        ).astype(np.float32)[:, 1]
-        point_informationv2[0:num_sources]["nz"] = np.asarray(
-            aperture_coords.normals
-        ).astype(np.float32)[:, 2]
-        # set position and velocity of sinks
-        point_informationv2[num_sources : (num_sources + num_sinks)]["px"] = np.asarray(
-            sink_coords.points
-        ).astype(np.float32)[:, 0]
-        point_informationv2[num_sources : (num_sources + num_sinks)]["py"] = np.asarray(
-            sink_coords.points
-        ).astype(np.float32)[:, 1]
-        point_informationv2[num_sources : (num_sources + num_sinks)]["pz"] = np.asarray(
-            sink_coords.points
-        ).astype(np.float32)[:, 2]
-        point_informationv2[num_sources : (num_sources + num_sinks)]["nx"] = np.asarray(
-            sink_coords.normals
-        ).astype(np.float32)[:, 0]
-        point_informationv2[num_sources : (num_sources + num_sinks)]["ny"] = np.asarray(
-            sink_coords.normals
-        ).astype(np.float32)[:, 1]
-        point_informationv2[num_sources : (num_sources + num_sinks)]["nz"] = np.asarray(
-            sink_coords.normals
-        ).astype(np.float32)[:, 2]
-
-        point_informationv2[:]["ex"] = unified_weights[:, 0]
-        point_informationv2[:]["ey"] = unified_weights[:, 1]
-        point_informationv2[:]["ez"] = unified_weights[:, 2]
-        scatter_mask = np.zeros((point_informationv2.shape[0]), dtype=np.int32)
-        scatter_mask[0:num_sources] = 0
-        scatter_mask[(num_sources + num_sinks) :] = 0
-
-    else:
-        # create scatter points on antenna solids based upon a half wavelength square
-        if scatter_points is None:
-            scatter_points, areas = TL.source_cloud_from_shape(
-                antenna_solid, 1e-6, (wavelength * mesh_resolution) ** 2
-            )
-
-        unified_model = np.append(
-            np.append(
-                np.asarray(aperture_coords.points).astype(np.float32),
-                np.asarray(sink_coords.points).astype(np.float32),
-                axis=0,
-            ),
-            np.asarray(scatter_points.points).astype(np.float32),
-            axis=0,
-        )
-        unified_normals = np.append(
-            np.append(
-                np.asarray(aperture_coords.normals).astype(np.float32),
-                np.asarray(sink_coords.normals).astype(np.float32),
-                axis=0,
-            ),
-            np.asarray(scatter_points.normals).astype(np.float32),
-            axis=0,
-        )
-        unified_weights = np.ones((unified_model.shape[0], 3), dtype=np.complex64)
-        unified_weights[0:num_sources, :] = (
-            conformal_E_vectors / num_sources
-        )  # set total amplitude to 1 for the aperture
-        unified_weights[num_sources : num_sources + num_sinks, :] = (
-            1 / num_sinks
-        )  # set total amplitude to 1 for the aperture
-        unified_weights[num_sources + num_sinks :, :] = 1 / len(
-            np.asarray(scatter_points.points)
-        )  # set total amplitude to 1 for the aperture
-        point_informationv2 = np.empty((len(unified_model)), dtype=scattering_t)
-        # set all sources as magnetic current sources, and permittivity and permeability as free space
-        point_informationv2[:]["Electric"] = True
-        point_informationv2[:]["permittivity"] = 8.8541878176e-12
-        point_informationv2[:]["permeability"] = 1.25663706212e-6
-        # set position, velocity, normal, and weight of sources
-        point_informationv2[0:num_sources]["px"] = np.asarray(
-            aperture_coords.points
-        ).astype(np.float32)[:, 0]
-        point_informationv2[0:num_sources]["py"] = np.asarray(
-            aperture_coords.points
-        ).astype(np.float32)[:, 1]
-        point_informationv2[0:num_sources]["pz"] = np.asarray(
-            aperture_coords.points
-        ).astype(np.float32)[:, 2]
-        point_informationv2[0:num_sources]["nx"] = np.asarray(
-            aperture_coords.normals
-        ).astype(np.float32)[:, 0]
-        point_informationv2[0:num_sources]["ny"] = np.asarray(
-            aperture_coords.normals
-        ).astype(np.float32)[:, 1]
-        point_informationv2[0:num_sources]["nz"] = np.asarray(
-            aperture_coords.normals
-        ).astype(np.float32)[:, 2]
-        # point_informationv2[0:num_sources]['ex']=unified_weights[0:num_sources,0]
-        # point_informationv2[0:num_sources]['ey']=unified_weights[0:num_sources,1]
-        # point_informationv2[0:num_sources]['ez']=unified_weights[0:num_sources,2]
-        # set position and velocity of sinks
-        point_informationv2[num_sources : (num_sources + num_sinks)]["px"] = np.asarray(
-            sink_coords.points
-        ).astype(np.float32)[:, 0]
-        point_informationv2[num_sources : (num_sources + num_sinks)]["py"] = np.asarray(
-            sink_coords.points
-        ).astype(np.float32)[:, 1]
-        point_informationv2[num_sources : (num_sources + num_sinks)]["pz"] = np.asarray(
-            sink_coords.points
-        ).astype(np.float32)[:, 2]
-        # point_informationv2[num_sources:(num_sources+num_sinks)]['vx']=0.0
-        # point_informationv2[num_sources:(num_sources+num_sinks)]['vy']=0.0
-        # point_informationv2[num_sources:(num_sources+num_sinks)]['vz']=0.0
-        point_informationv2[num_sources : (num_sources + num_sinks)]["nx"] = np.asarray(
-            sink_coords.normals
-        ).astype(np.float32)[:, 0]
-        point_informationv2[num_sources : (num_sources + num_sinks)]["ny"] = np.asarray(
-            sink_coords.normals
-        ).astype(np.float32)[:, 1]
-        point_informationv2[num_sources : (num_sources + num_sinks)]["nz"] = np.asarray(
-            sink_coords.normals
-        ).astype(np.float32)[:, 2]
-        point_informationv2[(num_sources + num_sinks) :]["px"] = np.asarray(
-            scatter_points.points
-        ).astype(np.float32)[:, 0]
-        point_informationv2[(num_sources + num_sinks) :]["py"] = np.asarray(
-            scatter_points.points
-        ).astype(np.float32)[:, 1]
-        point_informationv2[(num_sources + num_sinks) :]["pz"] = np.asarray(
-            scatter_points.points
-        ).astype(np.float32)[:, 2]
-        point_informationv2[(num_sources + num_sinks) :]["nx"] = np.asarray(
-            scatter_points.normals
-        ).astype(np.float32)[:, 0]
-        point_informationv2[(num_sources + num_sinks) :]["ny"] = np.asarray(
-            scatter_points.normals
-        ).astype(np.float32)[:, 1]
-        point_informationv2[(num_sources + num_sinks) :]["nz"] = np.asarray(
-            scatter_points.normals
-        ).astype(np.float32)[:, 2]
-        point_informationv2[:]["ex"] = unified_weights[:, 0]
-        point_informationv2[:]["ey"] = unified_weights[:, 1]
-        point_informationv2[:]["ez"] = unified_weights[:, 2]
-        # scatter_mask = np.zeros((point_informationv2.shape[0]), dtype=np.int32)
-        # scatter_mask[0:num_sources] = 0
-        # scatter_mask[(num_sources + num_sinks):] = scattering
+    sources, sinks, scattering_points, point_informationv2 = model_points(
+        aperture_coords,
+        sink_coords,
+        antenna_solid,
+        desired_E_axis,
+        scatter_points=scatter_points,
+        wavelength=wavelength,
+        scattering=scattering,
+        mesh_resolution=mesh_resolution,
+        antenna_axes=antenna_axes,
+        project_vectors=project_vectors,
+    )
+    num_sources = sources.shape[0]
+    num_sinks = sinks.shape[0]
+    environment_triangles, environment_bvh = antenna_solid.raycaster_environment()
 
     # full_index, initial_index = RF.integratedraycastersetup(num_sources,
     #                                                        num_sinks,
     #                                                        point_informationv2,
     #                                                        RF.convertTriangles(antenna_solid),
     #                                                        scatter_mask)
+    # the environment is uploaded once, and reused for every raycasting stage
+    scene = RF.raycasting_scene(environment_triangles, environment_bvh)
     full_index, rays = RF.workchunkingv2(
-        np.asarray(aperture_coords.points).astype(np.float32),
-        np.asarray(sink_coords.points).astype(np.float32),
-        np.asarray(scatter_points.points).astype(np.float32),
+        sources,
+        sinks,
+        scattering_points,
         environment_triangles,
         scattering + 1,
+        scene=scene,
+        direction="auto",
     )
 
     if not elements:
@@ -307,79 +120,32 @@ def calculate_scattering(
                     desired_E_axis[e_inc, :],
                     np.asarray(aperture_coords.normals).astype(np.float32),
                 )
-                unified_weights[0:num_sources, :] = conformal_E_vectors / num_sources
-                point_informationv2[:]["ex"] = unified_weights[:, 0]
-                point_informationv2[:]["ey"] = unified_weights[:, 1]
-                point_informationv2[:]["ez"] = unified_weights[:, 2]
-                scattering_coefficient = 1 / 4 * scipy.constants.pi
-                TimeMap, WakeTimes = EM.TimeDomainv3(
+                point_informationv2[0:num_sources]["ex"] = conformal_E_vectors[:, 0] / num_sources
+                point_informationv2[0:num_sources]["ey"] = conformal_E_vectors[:, 1] / num_sources
+                point_informationv2[0:num_sources]["ez"] = conformal_E_vectors[:, 2] / num_sources
+                taps = EM.EMTimeDomainTaps(
                     num_sources,
                     num_sinks,
-                    point_informationv2,
                     full_index,
-                    scattering_coefficient,
+                    point_informationv2,
                     wavelength,
-                    excitation_function,
-                    sampling_freq,
-                    num_samples,
-                )
-                wake_index = np.digitize(WakeTimes, time_index)
-                Ex[e_inc, wake_index:] = np.dot(
-                    np.ones((num_sources)),
-                    np.dot(
-                        np.ones((num_sinks)),
-                        TimeMap[:, :, : (num_samples - wake_index), 0],
-                    ),
+                    scene=scene,
                 )
-                Ey[e_inc, wake_index:] = np.dot(
-                    np.ones((num_sources)),
-                    np.dot(
-                        np.ones((num_sinks)),
-                        TimeMap[:, :, : (num_samples - wake_index), 1],
-                    ),
-                )
-                Ez[e_inc, wake_index:] = np.dot(
-                    np.ones((num_sources)),
-                    np.dot(
-                        np.ones((num_sinks)),
-                        TimeMap[:, :, : (num_samples - wake_index), 2],
-                    ),
+                Ex[e_inc], Ey[e_inc], Ez[e_inc], WakeTimes = apply_excitation(
+                    taps, excitation_function, sampling_freq, num_samples
                 )
 
         else:
-            Ex = np.zeros((num_samples), dtype=np.float64)
-            Ey = np.zeros((num_samples), dtype=np.float64)
-            Ez = np.zeros((num_samples), dtype=np.float64)
-            scattering_coefficient = 1 / 4 * scipy.constants.pi
-            TimeMap, WakeTimes = EM.TimeDomainv3(
+            taps = EM.EMTimeDomainTaps(
                 num_sources,
                 num_sinks,
-                point_informationv2,
                 full_index,
-                scattering_coefficient,
+                point_informationv2,
                 wavelength,
-                excitation_function,
-                sampling_freq,
-                num_samples,
-            )
-            wake_index = np.digitize(WakeTimes, time_index)
-            Ex[wake_index:] = np.dot(
-                np.ones((num_sources)),
-                np.dot(
-                    np.ones((num_sinks)), TimeMap[:, :, : (num_samples - wake_index), 0]
-                ),
-            )
-            Ey[wake_index:] = np.dot(
-                np.ones((num_sources)),
-                np.dot(
-                    np.ones((num_sinks)), TimeMap[:, :, : (num_samples - wake_index), 1]
-                ),
+                scene=scene,
             )
-            Ez[wake_index:] = np.dot(
-                np.ones((num_sources)),
-                np.dot(
-                    np.ones((num_sinks)), TimeMap[:, :, : (num_samples - wake_index), 2]
-                ),
+            Ex, Ey, Ez, WakeTimes = apply_excitation(
+                taps, excitation_function, sampling_freq, num_samples
             )
 
         # convert to etheta,ephi
@@ -414,10 +180,6 @@ def calculate_scattering(
                     point_informationv2[element]["ez"] = (
                         conformal_E_vectors[element, 2] / num_sources
                     )
-                    unified_weights[0:num_sources, :] = 0.0
-                    unified_weights[element, :] = (
-                        conformal_E_vectors[element, :] / num_sources
-                    )
                     scattering_coefficient = 1 / 4 * scipy.constants.pi
                     TimeMap, WakeTimes = EM.TimeDomainv3(
                         num_sources,
@@ -454,49 +216,165 @@ def calculate_scattering(
                     )
 
         else:
-            Ex = np.zeros((num_sources, num_sinks, num_samples), dtype=np.float64)
-            Ey = np.zeros((num_sources, num_sinks, num_samples), dtype=np.float64)
-            Ez = np.zeros((num_sources, num_sinks, num_samples), dtype=np.float64)
-            for element in range(num_sources):
-                point_informationv2[0:num_sources]["ex"] = 0.0
-                point_informationv2[0:num_sources]["ey"] = 0.0
-                point_informationv2[0:num_sources]["ez"] = 0.0
-                point_informationv2[element]["ex"] = (
-                    conformal_E_vectors[element, 0] / num_sources
-                )
-                point_informationv2[element]["ey"] = (
-                    conformal_E_vectors[element, 1] / num_sources
-                )
-                point_informationv2[element]["ez"] = (
-                    conformal_E_vectors[element, 2] / num_sources
-                )
-                unified_weights[0:num_sources, :] = 0.0
-                unified_weights[element, :] = (
-                    conformal_E_vectors[element, :] / num_sources
-                )
-                scattering_coefficient = 1 / 4 * scipy.constants.pi
-                TimeMap, WakeTimes = EM.TimeDomainv3(
-                    num_sources,
-                    num_sinks,
-                    point_informationv2,
-                    full_index,
-                    scattering_coefficient,
-                    wavelength,
-                    excitation_function,
-                    sampling_freq,
-                    num_samples,
-                )
-                Ex[element, :, :] = np.dot(
-                    np.ones((num_sources)),
-                    np.dot(np.ones((num_sinks)), TimeMap[:, :, :, 0]),
-                )
-                Ey[element, :, :] = np.dot(
-                    np.ones((num_sources)),
-                    np.dot(np.ones((num_sinks)), TimeMap[:, :, :, 1]),
-                )
-                Ez[element, :, :] = np.dot(
-                    np.ones((num_sources)),
-                    np.dot(np.ones((num_sinks)), TimeMap[:, :, :, 2]),
-                )
+            # each path is launched from a single element, so the response of every element is found from the taps
+            # of a single pass over the paths, with all the elements excited
+            taps = EM.EMTimeDomainTaps(
+                num_sources,
+                num_sinks,
+                full_index,
+                point_informationv2,
+                wavelength,
+                scene=scene,
+            )
+            WakeTimes = taps.wake_time()
+            wake_index = np.digitize(WakeTimes, time_index)
+            # align the response with the time index, as for the combined response
+            TimeMap, _ = IR.synthesise(
+                taps,
+                excitation_function,
+                sampling_freq,
+                num_samples,
+                filename=filename,
+                wake_sample=wake_index,
+            )
+            Ex = TimeMap[..., 0]
+            Ey = TimeMap[..., 1]
+            Ez = TimeMap[..., 2]
 
+    scene.release()
     return Ex, Ey, Ez, WakeTimes
+
+
+def calculate_impulse_response(
+    aperture_coords,
+    sink_coords,
+    antenna_solid,
+    desired_E_axis,
+    scatter_points=None,
+    wavelength=1.0,
+    scattering=0,
+    mesh_resolution=0.5,
+    antenna_axes=np.eye(3),
+    project_vectors=True,
+):
+    """
+    Based upon the parameters given, calculate the channel impulse response between the apertures and sinks, as a
+    sparse list of taps with the arrival time, polarised amplitude and number of scatters of each path. The memory
+    required is proportional to the number of paths rather than the number of samples, and the response to any
+    excitation signal can be found with :func:`apply_excitation`, without repeating the raycasting.
+
+    Parameters
+    ----------
+    aperture_coords : :class:`open3d.geometry.TriangleMesh`
+        source coordinates
+    sink_coords : :class:`open3d.geometry.TriangleMesh`
+        sink coordinates
+    antenna_solid : :class:`lyceanem.base_classes.structures`
+        the class should contain all the environment for scattering, providing the blocking for the rays
+    desired_E_axis : 1D numpy array of floats
+        the desired excitation vector, can be a 1*3 array or a n*3 array to set the excitation of each source
+    scatter_points : :class:`open3d.geometry.TriangleMesh`
+        the scattering points in the environment. Defaults to [None], in which case scattering points will be generated from the antenna_solid. If no scattering should be considered then set scattering to [0].
+    wavelength : float
+        the wavelength of the central frequency in metres, setting the spreading loss
+    scattering : int
+        the number of reflections to be considered, defaults to [0]
+    mesh_resolution : float
+        the desired mesh resolution in terms of wavelengths if scattering points are not provided. A scattering mesh is generated on the surfaces of all provided trianglemesh structures.
+    antenna_axes : 3 by 3 numpy array of float
+        the orientation of the antenna, defaults to [np.eye(3)]
+    project_vectors : bool
+        if True, the desired excitation vector is projected onto the surface of the aperture, defaults to [True]
+
+    Returns
+    -------
+    taps : :class:`lyceanem.electromagnetics.impulseresponse.channel_taps`
+        the amplitude, arrival time and number of scatters of each path
+    """
+    sources, sinks, scattering_points, point_informationv2 = model_points(
+        aperture_coords,
+        sink_coords,
+        antenna_solid,
+        desired_E_axis,
+        scatter_points=scatter_points,
+        wavelength=wavelength,
+        scattering=scattering,
+        mesh_resolution=mesh_resolution,
+        antenna_axes=antenna_axes,
+        project_vectors=project_vectors,
+    )
+    num_sources = sources.shape[0]
+    num_sinks = sinks.shape[0]
+    environment_triangles, environment_bvh = antenna_solid.raycaster_environment()
+
+    # the environment is uploaded once, and reused for the raycasting and the EM kernels
+    scene = RF.raycasting_scene(environment_triangles, environment_bvh)
+    full_index, rays = RF.workchunkingv2(
+        sources,
+        sinks,
+        scattering_points,
+        environment_triangles,
+        scattering + 1,
+        scene=scene,
+        compact=True,
+        direction="auto",
+    )
+    taps = EM.EMTimeDomainTaps(
+        num_sources, num_sinks, full_index, point_informationv2, wavelength, scene=scene
+    )
+    scene.release()
+    return taps
+
+
+def apply_excitation(taps, excitation_function, sampling_freq=1e9, num_samples=10000):
+    """
+    Convolve a channel impulse response from :func:`calculate_impulse_response` with an excitation signal, giving the
+    time domain voltage summed over the sources and sinks, as returned by :func:`calculate_scattering`. The taps of
+    every path are combined before a single FFT convolution, so each new excitation signal costs one FFT, and only the
+    samples from the first arrival to the end of the excitation from the last arrival are synthesised.
+
+    Parameters
+    ----------
+    taps : :class:`lyceanem.electromagnetics.impulseresponse.channel_taps`
+        the channel impulse response
+    excitation_function : numpy array of float
+        the excitation signal, sampled at sampling_freq
+    sampling_freq : float
+        the sampling frequency, defaults to [1e9]
+    num_samples : int
+        the length of the desired sampling, defaults to [10000]
+
+    Returns
+    -------
+    Ex : numpy array of float
+        the x directed voltage at the sink coordinates in the time domain
+    Ey : numpy array of float
+        the y directed voltage at the sink coordinates in the time domain
+    Ez : numpy array of float
+        the z directed voltage at the sink coordinates in the time domain
+    Waketimes : float
+        the shortest time required for a ray to reach any sink from any source
+    """
+    time_index = np.linspace(0, num_samples / sampling_freq, num_samples)
+    # the response summed over the sources and sinks is the response of all the taps combined
+    combined_taps = IR.channel_taps(
+        1,
+        1,
+        np.zeros(len(taps), dtype=np.int32),
+        np.zeros(len(taps), dtype=np.int32),
+        taps.delays,
+        taps.amplitudes,
+        taps.depths,
+    )
+    WakeTimes = taps.wake_time()
+    wake_index = np.digitize(WakeTimes, time_index)
+    # the samples before the wake time are never allocated, the window is placed directly at the wake index
+    TimeMap = IR.synthesise_windows(
+        combined_taps,
+        excitation_function,
+        sampling_freq,
+        num_samples,
+        wake_sample=wake_index,
+    )
+    response = TimeMap.combined()
+    return response[:, 0], response[:, 1], response[:, 2], WakeTimes
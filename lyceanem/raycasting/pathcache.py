@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import hashlib
+import os
+import pathlib
+import uuid
+
+import numpy as np
+
+from . import pathstore
+
+PATH_CACHE_DIRECTORY = "LYCEANEM_PATH_CACHE"  # environment variable enabling the path cache in the given directory
+PATH_CACHE_SIZE = "LYCEANEM_PATH_CACHE_SIZE"  # environment variable setting the path cache size limit in bytes
+DEFAULT_CACHE_BYTES = 2 ** 32  # size limit of the path cache if not otherwise specified
+
+_default_cache = None
+
+
+def path_key(
+    sources,
+    sinks,
+    scattering_points,
+    environment,
+    max_scatter,
+    line_of_sight=True,
+    max_rays_total=None,
+    first_leg=None,
+    visibility=None,
+):
+    """
+    Content hash identifying a raycasting problem, so the successful paths can be reused while the geometry is
+    unchanged. The environment is hashed in a canonical order, so the same triangles give the same key whether or not
+    they have been reordered for a bounding volume hierarchy. Tracing in reverse finds the same paths, so the key
+    describes the forward problem whichever direction the paths were traced in.
+
+    Parameters
+    ----------
+    sources : n*3 numpy array of float
+    sinks : m*3 numpy array of float
+    scattering_points : o*3 numpy array of float
+    environment : numpy array of triangle_t
+        blocking environment
+    max_scatter : int
+        the maximum number of legs in each path
+    line_of_sight : boolean
+        whether line of sight paths are included, defaults to [True]
+    max_rays_total : int
+        cap on the total number of rays cast, defaults to [None]
+    first_leg : numpy array of int
+        the first leg of the paths, if supplied rather than cast, defaults to [None]
+    visibility : tuple
+        the (offsets, neighbours) visibility graph, if supplied rather than cast, defaults to [None]
+
+    Returns
+    -------
+    key : str
+        the hexadecimal SHA-256 digest of the problem
+    """
+    digest = hashlib.sha256()
+    arrays = [sources, sinks, scattering_points, canonical_environment(environment)]
+    # the paths found from a supplied first leg or visibility graph depend upon it, not only upon the geometry
+    for extra in (first_leg, visibility):
+        if extra is None:
+            arrays.append(np.empty(0, dtype=np.int8))
+        else:
+            arrays.extend(extra if isinstance(extra, tuple) else (extra,))
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        digest.update(str((array.dtype.descr, array.shape)).encode())
+        digest.update(array.tobytes())
+    digest.update(
+        str((int(max_scatter), bool(line_of_sight), max_rays_total)).encode()
+    )
+    return digest.hexdigest()
+
+
+def canonical_environment(environment):
+    """
+    The environment triangles sorted by their contents, so that the order of the triangles does not change the key.
+    """
+    environment = np.ascontiguousarray(environment)
+    if environment.ndim != 1 or environment.shape[0] == 0:
+        return environment
+    rows = environment.view(np.dtype((np.void, environment.dtype.itemsize)))
+    return environment[np.argsort(rows, kind="stable")]
+
+
+class path_cache:
+    """
+    On disk cache of raycasting results, holding the successful paths in the compact form of
+    :class:`lyceanem.raycasting.pathstore.path_store`, as .npy files of the nodes and blocks named by the content hash
+    from :func:`path_key`. Cached paths are returned with memory mapped nodes. When the total size of the cache exceeds
+    the limit, the least recently used entries are removed.
+
+    Parameters
+    ----------
+    directory : str or :class:`pathlib.Path`
+        the cache directory, which will be created if it does not exist
+    max_bytes : int
+        the size limit of the cache in bytes, defaults to [None], using the LYCEANEM_PATH_CACHE_SIZE environment
+        variable if set, otherwise 4 GiB
+    """
+
+    def __init__(self, directory, max_bytes=None):
+        self.directory = pathlib.Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        if max_bytes is None:
+            max_bytes = int(os.environ.get(PATH_CACHE_SIZE, DEFAULT_CACHE_BYTES))
+        self.max_bytes = int(max_bytes)
+
+    def files(self, key):
+        return (
+            self.directory / "{}_nodes.npy".format(key),
+            self.directory / "{}_blocks.npy".format(key),
+        )
+
+    def load(self, key):
+        """
+        Load the paths for the key, marking the entry as recently used.
+
+        Parameters
+        ----------
+        key : str
+            the content hash from :func:`path_key`
+
+        Returns
+        -------
+        paths : :class:`lyceanem.raycasting.pathstore.path_store` or None
+            the compact store of all successful rays, with memory mapped nodes, or None if the key is not in the cache
+        """
+        nodes_file, blocks_file = self.files(key)
+        try:
+            # copy on write, so the cache cannot be modified through the returned paths
+            nodes = np.load(nodes_file, mmap_mode="c")
+            blocks = np.load(blocks_file)
+            os.utime(nodes_file)
+            os.utime(blocks_file)
+        except (OSError, ValueError):
+            return None
+        return pathstore.path_store(nodes, blocks)
+
+    def store(self, key, paths):
+        """
+        Store the paths for the key, then remove the least recently used entries if the cache is over the size limit.
+
+        Parameters
+        ----------
+        key : str
+            the content hash from :func:`path_key`
+        paths : :class:`lyceanem.raycasting.pathstore.path_store` or 2D numpy array of int
+            the successful rays, either as a compact store, or as a full index which will be compacted
+        """
+        if not isinstance(paths, pathstore.path_store):
+            paths = pathstore.compact_paths(paths)
+        for filename, array in zip(self.files(key), (paths.nodes, paths.blocks)):
+            # write to a temporary file first, so that other processes never see a partial entry
+            temporary = filename.with_name("{}.{}.tmp".format(filename.stem, uuid.uuid4().hex))
+            with open(temporary, "wb") as file:
+                np.save(file, np.ascontiguousarray(array))
+            os.replace(temporary, filename)
+        self.evict(keep=key)
+
+    def size(self):
+        """
+        The total size of the cache entries in bytes.
+        """
+        return sum(entry.stat().st_size for entry in self.directory.glob("*.npy"))
+
+    def evict(self, keep=None):
+        """
+        Remove the least recently used entries until the cache is within the size limit.
+
+        Parameters
+        ----------
+        keep : str
+            a key which should not be removed, defaults to [None]
+        """
+        entries = {}
+        for entry in self.directory.glob("*.npy"):
+            key = entry.name.rsplit("_", 1)[0]
+            stat = entry.stat()
+            used, size = entries.get(key, (0.0, 0))
+            entries[key] = (max(used, stat.st_mtime), size + stat.st_size)
+        total = sum(size for _, size in entries.values())
+        for key, (_, size) in sorted(entries.items(), key=lambda item: item[1][0]):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            for filename in self.files(key):
+                try:
+                    filename.unlink()
+                except FileNotFoundError:
+                    pass
+            total -= size
+
+    def clear(self):
+        """
+        Remove every entry from the cache.
+        """
+        for entry in self.directory.glob("*.npy"):
+            entry.unlink()
+
+
+def set_path_cache(directory, max_bytes=None):
+    """
+    Set the path cache used by :func:`lyceanem.raycasting.rayfunctions.workchunkingv2` when no cache is specified,
+    overriding the LYCEANEM_PATH_CACHE environment variable.
+
+    Parameters
+    ----------
+    directory : str or :class:`pathlib.Path`
+        the cache directory, or None to disable the cache
+    max_bytes : int
+        the size limit of the cache in bytes, defaults to [None], using the LYCEANEM_PATH_CACHE_SIZE environment
+        variable if set, otherwise 4 GiB
+
+    Returns
+    -------
+    cache : :class:`path_cache`
+        the new default cache, or None if the cache is disabled
+    """
+    global _default_cache
+    if directory is None:
+        _default_cache = False
+    else:
+        _default_cache = path_cache(directory, max_bytes)
+    return default_path_cache()
+
+
+def default_path_cache():
+    """
+    The path cache used when no cache is specified, set by :func:`set_path_cache`, or by the LYCEANEM_PATH_CACHE
+    environment variable.
+
+    Returns
+    -------
+    cache : :class:`path_cache`
+        the default cache, or None if caching is not enabled
+    """
+    global _default_cache
+    if _default_cache is None:
+        directory = os.environ.get(PATH_CACHE_DIRECTORY)
+        if not directory:
+            return None
+        _default_cache = path_cache(directory)
+    if _default_cache is False:
+        return None
+    return _default_cache
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import numpy as np
+from numba import cuda, njit
+
+
+class path_store:
+    """
+    Compact, depth encoded store of the successful paths. The nodes of every path are held in a single flat int32
+    array, without the zero padding of the full index, as consecutive blocks of paths with the same number of nodes.
+    Each block is described by its first row, the position of its first node, and the number of nodes in each path, so
+    there is no per path overhead, and the paths from each wavefront of the raycaster form a single block. The rows
+    are in the same order as the equivalent full index, and the shape is that of the full index, (paths, nodes in the
+    longest path).
+
+    Parameters
+    ----------
+    nodes : numpy array of int
+        the source, scattering point and sink indices of every path, with the same numbering as the full index
+    blocks : (k+1) by 3 numpy array of int
+        the first row, first node and path width of each block, followed by the total number of paths and nodes, with
+        a width of zero
+    """
+
+    def __init__(self, nodes, blocks):
+        self.nodes = np.asarray(nodes, dtype=np.int32)
+        self.blocks = np.asarray(blocks, dtype=np.int64).reshape(-1, 3)
+        self.shape = (int(self.blocks[-1, 0]), int(np.max(self.blocks[:, 2])))
+
+    def __len__(self):
+        return self.shape[0]
+
+    def nbytes(self):
+        """
+        The memory used by the store in bytes.
+        """
+        return self.nodes.nbytes + self.blocks.nbytes
+
+    def depths(self):
+        """
+        The number of legs in each path, 1 for line of sight.
+        """
+        return np.repeat(self.blocks[:-1, 2] - 1, np.diff(self.blocks[:, 0]))
+
+    def block_paths(self, block):
+        """
+        The paths of a block, as a 2D view of the nodes.
+        """
+        first_row, first_node, width = self.blocks[block]
+        rows = self.blocks[block + 1, 0] - first_row
+        return self.nodes[first_node : first_node + rows * width].reshape(rows, width)
+
+    def targets(self):
+        """
+        The source and sink index of each path.
+
+        Returns
+        -------
+        depth_slice : n by 2 numpy array of int32
+            the source and sink index for each path
+        """
+        depth_slice = np.zeros((self.shape[0], 2), dtype=np.int32)
+        for block in range(self.blocks.shape[0] - 1):
+            paths = self.block_paths(block)
+            rows = slice(self.blocks[block, 0], self.blocks[block + 1, 0])
+            depth_slice[rows, 0] = paths[:, 0]
+            depth_slice[rows, 1] = paths[:, -1]
+        return depth_slice
+
+    def to_full_index(self, width=None):
+        """
+        Expand the store to the equivalent full index, zero padded after the sink index.
+
+        Parameters
+        ----------
+        width : int
+            the width of the full index, defaults to [None], the number of nodes in the longest path
+
+        Returns
+        -------
+        full_index : 2D numpy array of int32
+            the index of all the paths
+        """
+        if width is None:
+            width = self.shape[1]
+        full_index = np.zeros((self.shape[0], width), dtype=np.int32)
+        for block in range(self.blocks.shape[0] - 1):
+            paths = self.block_paths(block)
+            rows = slice(self.blocks[block, 0], self.blocks[block + 1, 0])
+            full_index[rows, : paths.shape[1]] = paths
+        return full_index
+
+
+def compact_paths(full_index):
+    """
+    Convert a zero padded full index to a :class:`path_store`. Each run of consecutive rows with the same number of
+    nodes becomes a block, so the store is most compact when the rows are grouped by depth, as they are from
+    :func:`lyceanem.raycasting.rayfunctions.workchunkingv2`.
+
+    Parameters
+    ----------
+    full_index : 2D numpy array of int
+        the index of all the paths, zero padded after the sink index
+
+    Returns
+    -------
+    paths : :class:`path_store`
+        the compact store of the paths
+    """
+    full_index = np.asarray(full_index)
+    lengths = np.count_nonzero(full_index, axis=1)
+    first_rows = np.flatnonzero(np.diff(lengths, prepend=-1))
+    widths = lengths[first_rows]
+    rows = np.diff(np.append(first_rows, full_index.shape[0]))
+    blocks = np.zeros((first_rows.shape[0] + 1, 3), dtype=np.int64)
+    blocks[:-1, 0] = first_rows
+    blocks[-1, 0] = full_index.shape[0]
+    np.cumsum(rows * widths, out=blocks[1:, 1])
+    blocks[:-1, 2] = widths
+    # the padding is only ever after the sink, so the non-zero entries in row order are the nodes of each path
+    return path_store(full_index[full_index != 0], blocks)
+
+
+def stack_paths(blocks):
+    """
+    Create a :class:`path_store` from blocks of paths, each block holding paths with the same number of nodes, such as
+    the completed paths of each wavefront in :func:`lyceanem.raycasting.rayfunctions.workchunkingv2`.
+
+    Parameters
+    ----------
+    blocks : list of 2D numpy arrays of int
+        the blocks of paths, without padding
+
+    Returns
+    -------
+    paths : :class:`path_store`
+        the compact store of the paths
+    """
+    blocks = [block for block in blocks if block.shape[0] > 0]
+    table = np.zeros((len(blocks) + 1, 3), dtype=np.int64)
+    for index, block in enumerate(blocks):
+        table[index + 1, 0] = table[index, 0] + block.shape[0]
+        table[index + 1, 1] = table[index, 1] + block.size
+        table[index, 2] = block.shape[1]
+    nodes = np.concatenate(
+        [np.asarray(block, dtype=np.int32).ravel() for block in blocks]
+        + [np.zeros((0), dtype=np.int32)]
+    )
+    return path_store(nodes, table)
+
+
+def path_arrays(paths):
+    """
+    The flat node array and block table used by the EM kernels, for either a :class:`path_store` or a zero padded full
+    index. A full index is used in place as a single block, with the padding ending each path.
+
+    Parameters
+    ----------
+    paths : :class:`path_store` or 2D numpy array of int
+        the paths
+
+    Returns
+    -------
+    nodes : numpy array of int
+        the nodes of every path
+    blocks : (k+1) by 3 numpy array of int64
+        the first row, first node and path width of each block, followed by the total number of paths and nodes
+    """
+    if isinstance(paths, path_store):
+        return paths.nodes, paths.blocks
+    paths = np.ascontiguousarray(paths)
+    blocks = np.array(
+        [[0, 0, paths.shape[1]], [paths.shape[0], paths.size, 0]], dtype=np.int64
+    )
+    return paths.reshape(-1), blocks
+
+
+@cuda.jit(device=True)
+def pathslice(nodes, blocks, ray):
+    """
+    The nodes of a single path, finding the block holding the path with a binary search of the block table.
+    """
+    lower = 0
+    upper = blocks.shape[0] - 1
+    while upper - lower > 1:
+        middle = (lower + upper) // 2
+        if blocks[middle, 0] <= ray:
+            lower = middle
+        else:
+            upper = middle
+    start = blocks[lower, 1] + (ray - blocks[lower, 0]) * blocks[lower, 2]
+    return nodes[start : start + blocks[lower, 2]]
+
+
+@njit(cache=True, nogil=True)
+def pathsliceCPU(nodes, blocks, ray):
+    """
+    CPU equivalent of :func:`pathslice`.
+    """
+    lower = 0
+    upper = blocks.shape[0] - 1
+    while upper - lower > 1:
+        middle = (lower + upper) // 2
+        if blocks[middle, 0] <= ray:
+            lower = middle
+        else:
+            upper = middle
+    start = blocks[lower, 1] + (ray - blocks[lower, 0]) * blocks[lower, 2]
+    return nodes[start : start + blocks[lower, 2]]
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 import copy
 import math
+import warnings
 from timeit import default_timer as timer
 
 import numba as nb
@@ -14,9 +15,17 @@ from scipy.spatial import distance
 
 import lyceanem.base_types as base_types
 from ..utility import math_functions as math_functions
+from . import pathcache as pathcache
+from . import pathstore as pathstore
 import lyceanem.electromagnetics.empropagation as EM
 
 EPSILON = 1e-6  # how close to zero do we consider zero? example used 1e-7
+CPU_RAY_LIMIT = 2 ** 24  # maximum number of rays in a single launch on the CPU backend
+BVH_BINS = 16  # number of bins used to evaluate the surface area heuristic
+BVH_LEAF_SIZE = 2  # nodes with this many triangles or fewer are always leaves
+BVH_MAX_LEAF_SIZE = 16  # nodes with more triangles than this are always split if possible
+BVH_MAX_DEPTH = 48  # maximum depth of the bounding volume hierarchy
+BVH_STACK_SIZE = 64  # traversal stack size, must exceed BVH_MAX_DEPTH + 1
 
 # # A numpy record array (like a struct) to record triangle
 # point_data = np.dtype([
@@ -364,7 +373,7 @@ def kernel1Dv2(rays, environment):
 
 
 @cuda.jit
-def kernel1Dv3(rays, environment):
+def kernel1Dv3(rays, environment, any_hit):
 
     cu_ray_num = cuda.grid(1)  # alias for threadIdx.x + ( blockIdx.x * blockDim.x ),
 
@@ -392,6 +401,9 @@ def kernel1Dv3(rays, environment):
                 # print('conventional',cu_ray_num,i,dist_temp,rays[cu_ray_num]['dist'])
                 rays[cu_ray_num]["dist"] = dist_temp
                 rays[cu_ray_num]["intersect"] = True
+                if any_hit:
+                    # the ray is occluded, the nearest occluder is not required
+                    break
 
                 # ray_flag[cu_ray_num]=True
 
@@ -399,6 +411,761 @@ def kernel1Dv3(rays, environment):
         nb.cuda.syncthreads()
 
 
+@njit(cache=True, nogil=True)
+def dotCPU(ax1, ay1, az1, ax2, ay2, az2):
+    result = ax1 * ax2 + ay1 * ay2 + az1 * az2
+    return result
+
+
+@njit(cache=True, nogil=True)
+def crossCPU(ax1, ay1, az1, ax2, ay2, az2):
+    rx = ay1 * az2 - az1 * ay2
+    ry = az1 * ax2 - ax1 * az2
+    rz = ax1 * ay2 - ay1 * ax2
+    return rx, ry, rz
+
+
+@njit(cache=True, nogil=True)
+def hitCPU(ray, triangle):
+    """
+    CPU implementation of :func:`hit`, using the Möller–Trumbore ray-triangle intersection algorithm.
+    The arithmetic and order of operations are kept identical to the GPU device function so that both backends
+    reach the same decision for each ray and triangle pair.
+    """
+    # find edge vectors
+    e1x = triangle.v1x - triangle.v0x
+    e1y = triangle.v1y - triangle.v0y
+    e1z = triangle.v1z - triangle.v0z
+
+    e2x = triangle.v2x - triangle.v0x
+    e2y = triangle.v2y - triangle.v0y
+    e2z = triangle.v2z - triangle.v0z
+    # calculate determinant cross product of DV and E2
+    pvecx, pvecy, pvecz = crossCPU(ray.dx, ray.dy, ray.dz, e2x, e2y, e2z)
+    # determinant is dot product of edge 1 and pvec
+    A = dotCPU(pvecx, pvecy, pvecz, e1x, e1y, e1z)
+    # if A is near zero, then ray lies in the plane of the triangle
+    if -EPSILON < A < EPSILON:
+        return False, math.inf
+
+    # if A is less than zero, then the ray is coming from behind the triangle
+    # cull backface triangles
+    if A < 0:
+        return False, math.inf
+    # calculate distance from vertice 0 to ray origin
+    tvecx = ray.ox - triangle.v0x  # s
+    tvecy = ray.oy - triangle.v0y  # s
+    tvecz = ray.oz - triangle.v0z  # s
+    # inverse determinant and calculate bounds of triangle
+    F = 1.0 / A
+    U = F * dotCPU(tvecx, tvecy, tvecz, pvecx, pvecy, pvecz)
+    if U < 0.0 or U > (1.0):
+        # in U coordinates, if U is less than 0 or greater than 1, it is outside the triangle
+        return False, math.inf
+
+    # cross product of tvec and E1
+    qx, qy, qz = crossCPU(tvecx, tvecy, tvecz, e1x, e1y, e1z)
+    V = F * dotCPU(ray.dx, ray.dy, ray.dz, qx, qy, qz)
+    if V < 0.0 or (U + V) > (1.0):
+        # in UV coordinates, intersection is within triangle
+        return False, math.inf
+
+    intersect_distance = F * dotCPU(e2x, e2y, e2z, qx, qy, qz)
+    if (intersect_distance > (2 * EPSILON)) and (
+        intersect_distance < (ray.dist - (2 * EPSILON))
+    ):
+        # intersection on triangle
+        return True, intersect_distance
+
+    return False, math.inf
+
+
+@njit(parallel=True, nogil=True, cache=True)
+def kernel1Dv3CPU(rays, environment, any_hit):
+    """
+    CPU equivalent of :func:`kernel1Dv3`, with each ray assigned to a thread. The triangles are tested in the same
+    order as the GPU kernel, and the ray distance and intersection flag are updated in the same way.
+    """
+    max_tri_num = len(environment)
+    for ray_num in prange(rays.shape[0]):
+        i = 0
+        while i < max_tri_num:
+            hit_bool, dist_temp = hitCPU(rays[ray_num], environment[i])
+            i += 1
+            if hit_bool and (dist_temp < rays[ray_num]["dist"]):
+                # hit something
+                rays[ray_num]["dist"] = dist_temp
+                rays[ray_num]["intersect"] = True
+                if any_hit:
+                    break
+
+
+@njit(cache=True, nogil=True)
+def triangle_bounds(environment):
+    """
+    Calculate the axis aligned bounding box and centroid of each triangle in the environment.
+
+    Parameters
+    ----------
+    environment : numpy array of triangle_t
+        blocking environment
+
+    Returns
+    -------
+    bounds : n by 6 numpy array of float
+        minimum and maximum xyz coordinates of each triangle
+    centroids : n by 3 numpy array of float
+        centroid of each triangle
+    """
+    bounds = np.empty((environment.shape[0], 6), dtype=np.float64)
+    centroids = np.empty((environment.shape[0], 3), dtype=np.float64)
+    for idx in range(environment.shape[0]):
+        tri = environment[idx]
+        bounds[idx, 0] = min(tri.v0x, tri.v1x, tri.v2x)
+        bounds[idx, 1] = min(tri.v0y, tri.v1y, tri.v2y)
+        bounds[idx, 2] = min(tri.v0z, tri.v1z, tri.v2z)
+        bounds[idx, 3] = max(tri.v0x, tri.v1x, tri.v2x)
+        bounds[idx, 4] = max(tri.v0y, tri.v1y, tri.v2y)
+        bounds[idx, 5] = max(tri.v0z, tri.v1z, tri.v2z)
+        centroids[idx, 0] = (tri.v0x + tri.v1x + tri.v2x) / 3.0
+        centroids[idx, 1] = (tri.v0y + tri.v1y + tri.v2y) / 3.0
+        centroids[idx, 2] = (tri.v0z + tri.v1z + tri.v2z) / 3.0
+
+    return bounds, centroids
+
+
+@njit(cache=True, nogil=True)
+def half_area(minx, miny, minz, maxx, maxy, maxz):
+    # half the surface area of an axis aligned box, sufficient for the surface area heuristic
+    ex = maxx - minx
+    ey = maxy - miny
+    ez = maxz - minz
+    return ex * ey + ey * ez + ez * ex
+
+
+@njit(cache=True, nogil=True)
+def bvh_build(bounds, centroids):
+    """
+    Build a bounding volume hierarchy over the triangle bounds using a binned surface area heuristic. The tree is
+    built depth first with an explicit stack, and returned as flat arrays.
+
+    Parameters
+    ----------
+    bounds : n by 6 numpy array of float
+        minimum and maximum xyz coordinates of each triangle
+    centroids : n by 3 numpy array of float
+        centroid of each triangle
+
+    Returns
+    -------
+    node_bounds : m by 6 numpy array of float
+        minimum and maximum xyz coordinates of each node
+    node_links : m by 4 numpy array of int
+        left child, right child, first triangle and number of triangles for each node
+    order : numpy array of int
+        the triangle order, so that each leaf refers to a contiguous range of triangles
+    """
+    tri_num = bounds.shape[0]
+    max_nodes = 2 * tri_num - 1
+    node_bounds = np.empty((max_nodes, 6), dtype=np.float64)
+    node_links = np.full((max_nodes, 4), -1, dtype=np.int32)
+    order = np.arange(tri_num)
+    bin_count = np.zeros(BVH_BINS, dtype=np.int64)
+    bin_bounds = np.empty((BVH_BINS, 6), dtype=np.float64)
+    right_area = np.empty(BVH_BINS, dtype=np.float64)
+    right_count = np.empty(BVH_BINS, dtype=np.int64)
+    stack = np.empty((BVH_MAX_DEPTH + 2, 4), dtype=np.int64)
+    stack[0, 0] = 0
+    stack[0, 1] = 0
+    stack[0, 2] = tri_num
+    stack[0, 3] = 0
+    stack_size = 1
+    node_num = 1
+    while stack_size > 0:
+        stack_size -= 1
+        node = stack[stack_size, 0]
+        start = stack[stack_size, 1]
+        end = stack[stack_size, 2]
+        depth = stack[stack_size, 3]
+        # node and centroid bounds
+        node_bounds[node, :3] = np.inf
+        node_bounds[node, 3:] = -np.inf
+        cmin = np.full(3, np.inf)
+        cmax = np.full(3, -np.inf)
+        for idx in range(start, end):
+            tri = order[idx]
+            for axis in range(3):
+                node_bounds[node, axis] = min(node_bounds[node, axis], bounds[tri, axis])
+                node_bounds[node, axis + 3] = max(
+                    node_bounds[node, axis + 3], bounds[tri, axis + 3]
+                )
+                cmin[axis] = min(cmin[axis], centroids[tri, axis])
+                cmax[axis] = max(cmax[axis], centroids[tri, axis])
+
+        count = end - start
+        if count <= BVH_LEAF_SIZE or depth >= BVH_MAX_DEPTH:
+            node_links[node, 2] = start
+            node_links[node, 3] = count
+            continue
+
+        # find the lowest cost split over all axes
+        best_cost = np.inf
+        best_axis = -1
+        best_bin = -1
+        for axis in range(3):
+            extent = cmax[axis] - cmin[axis]
+            if extent <= 0.0:
+                continue
+            bin_count[:] = 0
+            bin_bounds[:, :3] = np.inf
+            bin_bounds[:, 3:] = -np.inf
+            for idx in range(start, end):
+                tri = order[idx]
+                b = min(
+                    int(BVH_BINS * (centroids[tri, axis] - cmin[axis]) / extent),
+                    BVH_BINS - 1,
+                )
+                bin_count[b] += 1
+                for k in range(3):
+                    bin_bounds[b, k] = min(bin_bounds[b, k], bounds[tri, k])
+                    bin_bounds[b, k + 3] = max(bin_bounds[b, k + 3], bounds[tri, k + 3])
+
+            # sweep from the right to find the area and count right of each split
+            sweep = np.full(6, np.inf)
+            sweep[3:] = -np.inf
+            running = 0
+            for b in range(BVH_BINS - 1, 0, -1):
+                running += bin_count[b]
+                for k in range(3):
+                    sweep[k] = min(sweep[k], bin_bounds[b, k])
+                    sweep[k + 3] = max(sweep[k + 3], bin_bounds[b, k + 3])
+                right_count[b] = running
+                if running > 0:
+                    right_area[b] = half_area(
+                        sweep[0], sweep[1], sweep[2], sweep[3], sweep[4], sweep[5]
+                    )
+                else:
+                    right_area[b] = 0.0
+
+            # sweep from the left, evaluating the cost of splitting after each bin
+            sweep[:3] = np.inf
+            sweep[3:] = -np.inf
+            running = 0
+            for b in range(BVH_BINS - 1):
+                running += bin_count[b]
+                for k in range(3):
+                    sweep[k] = min(sweep[k], bin_bounds[b, k])
+                    sweep[k + 3] = max(sweep[k + 3], bin_bounds[b, k + 3])
+                if running == 0 or right_count[b + 1] == 0:
+                    continue
+                cost = running * half_area(
+                    sweep[0], sweep[1], sweep[2], sweep[3], sweep[4], sweep[5]
+                ) + right_count[b + 1] * right_area[b + 1]
+                if cost < best_cost:
+                    best_cost = cost
+                    best_axis = axis
+                    best_bin = b
+
+        node_area = half_area(
+            node_bounds[node, 0],
+            node_bounds[node, 1],
+            node_bounds[node, 2],
+            node_bounds[node, 3],
+            node_bounds[node, 4],
+            node_bounds[node, 5],
+        )
+        if best_axis == -1 or (
+            count <= BVH_MAX_LEAF_SIZE
+            and node_area > 0.0
+            and (1.0 + best_cost / node_area) >= count
+        ):
+            # splitting is not possible, or is more expensive than testing the triangles directly
+            node_links[node, 2] = start
+            node_links[node, 3] = count
+            continue
+
+        # partition the triangles about the chosen split
+        extent = cmax[best_axis] - cmin[best_axis]
+        i = start
+        j = end - 1
+        while i <= j:
+            b = min(
+                int(BVH_BINS * (centroids[order[i], best_axis] - cmin[best_axis]) / extent),
+                BVH_BINS - 1,
+            )
+            if b <= best_bin:
+                i += 1
+            else:
+                temp = order[i]
+                order[i] = order[j]
+                order[j] = temp
+                j -= 1
+
+        left = node_num
+        right = node_num + 1
+        node_num += 2
+        node_links[node, 0] = left
+        node_links[node, 1] = right
+        node_links[node, 3] = 0
+        stack[stack_size, 0] = right
+        stack[stack_size, 1] = i
+        stack[stack_size, 2] = end
+        stack[stack_size, 3] = depth + 1
+        stack[stack_size + 1, 0] = left
+        stack[stack_size + 1, 1] = start
+        stack[stack_size + 1, 2] = i
+        stack[stack_size + 1, 3] = depth + 1
+        stack_size += 2
+
+    return node_bounds[:node_num], node_links[:node_num], order
+
+
+def build_bvh(environment, return_order=False):
+    """
+    Build a bounding volume hierarchy over the environment triangles, using a binned surface area heuristic. The tree
+    is flattened into an array of :data:`lyceanem.base_types.bvh_node_t`, so that it can be traversed by both the
+    CUDA and CPU raycasting kernels.
+
+    Parameters
+    ----------
+    environment : numpy array of triangle_t
+        blocking environment
+    return_order : bool
+        if True, the index of each reordered triangle in the original environment is also returned, defaults to [False]
+
+    Returns
+    -------
+    environment : numpy array of triangle_t
+        the environment triangles, reordered so that each leaf node refers to a contiguous range of triangles
+    bvh_nodes : numpy array of bvh_node_t
+        the flattened tree, with the root node first
+    order : numpy array of int
+        the index of each reordered triangle in the original environment, only returned if return_order is True
+    """
+    if environment.shape[0] == 0:
+        order = np.zeros(0, dtype=np.int64)
+        bvh_nodes = np.empty(0, dtype=base_types.bvh_node_data)
+        if return_order:
+            return environment, bvh_nodes, order
+        return environment, bvh_nodes
+
+    bounds, centroids = triangle_bounds(environment)
+    node_bounds, node_links, order = bvh_build(bounds, centroids)
+    if return_order:
+        return environment[order], bvh_nodes_from_arrays(node_bounds, node_links), order
+    return environment[order], bvh_nodes_from_arrays(node_bounds, node_links)
+
+
+def bvh_nodes_from_arrays(node_bounds, node_links):
+    """
+    Flatten the node bounds and links into an array of :data:`lyceanem.base_types.bvh_node_t`, padding the boxes so
+    that rounding in the slab test can never reject a triangle the raycaster would hit.
+    """
+    scene_extent = np.max(np.abs(node_bounds[0, :]))
+    padding = scene_extent * 1e-6 + EPSILON
+    bvh_nodes = np.empty(node_bounds.shape[0], dtype=base_types.bvh_node_data)
+    bvh_nodes["minx"] = node_bounds[:, 0] - padding
+    bvh_nodes["miny"] = node_bounds[:, 1] - padding
+    bvh_nodes["minz"] = node_bounds[:, 2] - padding
+    bvh_nodes["maxx"] = node_bounds[:, 3] + padding
+    bvh_nodes["maxy"] = node_bounds[:, 4] + padding
+    bvh_nodes["maxz"] = node_bounds[:, 5] + padding
+    bvh_nodes["left"] = node_links[:, 0]
+    bvh_nodes["right"] = node_links[:, 1]
+    bvh_nodes["first"] = node_links[:, 2]
+    bvh_nodes["tri_num"] = node_links[:, 3]
+    return bvh_nodes
+
+
+@njit(cache=True, nogil=True)
+def bvh_refit_bounds(bounds, node_links):
+    # child nodes are always stored after their parent, so a reverse sweep updates the children first
+    node_bounds = np.empty((node_links.shape[0], 6), dtype=np.float64)
+    for node in range(node_links.shape[0] - 1, -1, -1):
+        if node_links[node, 3] > 0:
+            first = node_links[node, 2]
+            for k in range(3):
+                node_bounds[node, k] = np.min(
+                    bounds[first : first + node_links[node, 3], k]
+                )
+                node_bounds[node, k + 3] = np.max(
+                    bounds[first : first + node_links[node, 3], k + 3]
+                )
+        else:
+            left = node_links[node, 0]
+            right = node_links[node, 1]
+            for k in range(3):
+                node_bounds[node, k] = min(node_bounds[left, k], node_bounds[right, k])
+                node_bounds[node, k + 3] = max(
+                    node_bounds[left, k + 3], node_bounds[right, k + 3]
+                )
+
+    return node_bounds
+
+
+def refit_bvh(environment, bvh_nodes):
+    """
+    Update the boxes of an existing bounding volume hierarchy after the triangles have been moved, keeping the tree
+    topology. This is much cheaper than rebuilding the tree, and is exact for any transform, although the boxes may be
+    looser than a new build after large rotations.
+
+    Parameters
+    ----------
+    environment : numpy array of triangle_t
+        the moved triangles, in the order returned by :func:`build_bvh`
+    bvh_nodes : numpy array of bvh_node_t
+        the bounding volume hierarchy built for the triangles before they were moved
+
+    Returns
+    -------
+    bvh_nodes : numpy array of bvh_node_t
+        the refitted bounding volume hierarchy
+    """
+    if bvh_nodes.shape[0] == 0:
+        return bvh_nodes
+
+    bounds, _ = triangle_bounds(environment)
+    node_links = np.stack(
+        (bvh_nodes["left"], bvh_nodes["right"], bvh_nodes["first"], bvh_nodes["tri_num"]),
+        axis=1,
+    )
+    node_bounds = bvh_refit_bounds(bounds, node_links)
+    return bvh_nodes_from_arrays(node_bounds, node_links)
+
+
+@cuda.jit(device=True, inline=True)
+def slab(origin, direction, box_min, box_max, t_near, t_far):
+    # clip the ray interval against one pair of box planes
+    if direction == 0.0:
+        if origin < box_min or origin > box_max:
+            return t_near, -1.0
+        return t_near, t_far
+    t0 = (box_min - origin) / direction
+    t1 = (box_max - origin) / direction
+    if t0 > t1:
+        t0, t1 = t1, t0
+    return max(t_near, t0), min(t_far, t1)
+
+
+@cuda.jit(device=True, inline=True)
+def box_hit(ray, node):
+    # slab test of the ray against the node bounding box, limited to the current ray distance
+    t_near, t_far = slab(ray.ox, ray.dx, node.minx, node.maxx, 0.0, ray.dist)
+    t_near, t_far = slab(ray.oy, ray.dy, node.miny, node.maxy, t_near, t_far)
+    t_near, t_far = slab(ray.oz, ray.dz, node.minz, node.maxz, t_near, t_far)
+    return t_near <= t_far
+
+
+@cuda.jit
+def kernel1DBVH(rays, environment, bvh_nodes, any_hit):
+    """
+    Equivalent of :func:`kernel1Dv3`, traversing the bounding volume hierarchy nearest child first, so that only
+    triangles in boxes crossed by the ray are tested, and boxes beyond the nearest intersection are skipped. In any
+    hit mode the traversal stops at the first intersection found.
+    """
+    cu_ray_num = cuda.grid(1)
+    if cu_ray_num < rays.shape[0] and bvh_nodes.shape[0] > 0:
+        stack = cuda.local.array(BVH_STACK_SIZE, dtype=nb.int32)
+        stack[0] = 0
+        stack_size = 1
+        while stack_size > 0:
+            stack_size -= 1
+            node = bvh_nodes[stack[stack_size]]
+            if not box_hit(rays[cu_ray_num], node):
+                continue
+            if node.tri_num > 0:
+                for i in range(node.first, node.first + node.tri_num):
+                    hit_bool, dist_temp = hit(rays[cu_ray_num], environment[i])
+                    if hit_bool and (dist_temp < rays[cu_ray_num]["dist"]):
+                        # hit something
+                        rays[cu_ray_num]["dist"] = dist_temp
+                        rays[cu_ray_num]["intersect"] = True
+                        if any_hit:
+                            stack_size = 0
+                            break
+            else:
+                left = bvh_nodes[node.left]
+                right = bvh_nodes[node.right]
+                # push the far child first, so the near child is visited first
+                direction = (
+                    (left.minx + left.maxx - right.minx - right.maxx) * rays[cu_ray_num].dx
+                    + (left.miny + left.maxy - right.miny - right.maxy) * rays[cu_ray_num].dy
+                    + (left.minz + left.maxz - right.minz - right.maxz) * rays[cu_ray_num].dz
+                )
+                if direction > 0:
+                    stack[stack_size] = node.left
+                    stack[stack_size + 1] = node.right
+                else:
+                    stack[stack_size] = node.right
+                    stack[stack_size + 1] = node.left
+                stack_size += 2
+
+
+@njit(cache=True, nogil=True)
+def slabCPU(origin, direction, box_min, box_max, t_near, t_far):
+    # clip the ray interval against one pair of box planes
+    if direction == 0.0:
+        if origin < box_min or origin > box_max:
+            return t_near, -1.0
+        return t_near, t_far
+    t0 = (box_min - origin) / direction
+    t1 = (box_max - origin) / direction
+    if t0 > t1:
+        t0, t1 = t1, t0
+    return max(t_near, t0), min(t_far, t1)
+
+
+@njit(cache=True, nogil=True)
+def box_hitCPU(ray, node):
+    # slab test of the ray against the node bounding box, limited to the current ray distance
+    t_near, t_far = slabCPU(ray.ox, ray.dx, node.minx, node.maxx, 0.0, ray.dist)
+    t_near, t_far = slabCPU(ray.oy, ray.dy, node.miny, node.maxy, t_near, t_far)
+    t_near, t_far = slabCPU(ray.oz, ray.dz, node.minz, node.maxz, t_near, t_far)
+    return t_near <= t_far
+
+
+@njit(parallel=True, nogil=True, cache=True)
+def kernel1DBVHCPU(rays, environment, bvh_nodes, any_hit):
+    """
+    CPU equivalent of :func:`kernel1DBVH`, with each ray assigned to a thread.
+    """
+    if bvh_nodes.shape[0] == 0:
+        return
+    for ray_num in prange(rays.shape[0]):
+        stack = np.empty(BVH_STACK_SIZE, dtype=np.int32)
+        stack[0] = 0
+        stack_size = 1
+        while stack_size > 0:
+            stack_size -= 1
+            node = bvh_nodes[stack[stack_size]]
+            if not box_hitCPU(rays[ray_num], node):
+                continue
+            if node.tri_num > 0:
+                for i in range(node.first, node.first + node.tri_num):
+                    hit_bool, dist_temp = hitCPU(rays[ray_num], environment[i])
+                    if hit_bool and (dist_temp < rays[ray_num]["dist"]):
+                        # hit something
+                        rays[ray_num]["dist"] = dist_temp
+                        rays[ray_num]["intersect"] = True
+                        if any_hit:
+                            stack_size = 0
+                            break
+            else:
+                left = bvh_nodes[node.left]
+                right = bvh_nodes[node.right]
+                # push the far child first, so the near child is visited first
+                direction = (
+                    (left.minx + left.maxx - right.minx - right.maxx) * rays[ray_num].dx
+                    + (left.miny + left.maxy - right.miny - right.maxy) * rays[ray_num].dy
+                    + (left.minz + left.maxz - right.minz - right.maxz) * rays[ray_num].dz
+                )
+                if direction > 0:
+                    stack[stack_size] = node.left
+                    stack[stack_size + 1] = node.right
+                else:
+                    stack[stack_size] = node.right
+                    stack[stack_size + 1] = node.left
+                stack_size += 2
+
+
+def raycasting_backend(backend=None):
+    """
+    Resolve the raycasting backend to be used. If no backend is specified, then the CUDA backend is used if a CUDA
+    device is available, otherwise the Numba parallel CPU backend is used.
+
+    Parameters
+    ----------
+    backend : str
+        the desired backend, either 'cuda' or 'cpu', defaults to [None], selecting the backend automatically
+
+    Returns
+    -------
+    backend : str
+        the backend which will be used, either 'cuda' or 'cpu'
+    """
+    if backend is None:
+        if cuda.is_available():
+            backend = "cuda"
+        else:
+            backend = "cpu"
+    elif backend not in ("cuda", "cpu"):
+        raise ValueError(
+            "Unknown raycasting backend '{}', expected 'cuda' or 'cpu'".format(backend)
+        )
+    elif backend == "cuda" and not cuda.is_available():
+        raise RuntimeError("The CUDA backend was requested, but no CUDA device is available")
+
+    return backend
+
+
+def ray_limit(environment, memory_fraction, backend):
+    """
+    Estimate the maximum number of rays which can be cast in a single launch, based upon the free memory on the GPU,
+    or a fixed limit for the CPU backend.
+
+    Parameters
+    ----------
+    environment : numpy array of triangle_t or :class:`raycasting_scene`
+        blocking environment
+    memory_fraction : float
+        the fraction of the free GPU memory which can be used for the rays
+    backend : str
+        the raycasting backend, either 'cuda' or 'cpu'
+
+    Returns
+    -------
+    ray_limit : int
+        the maximum number of rays in a single launch
+    """
+    if isinstance(environment, raycasting_scene):
+        environment = environment.environment
+    if backend == "cuda":
+        free_mem, total_mem = cuda.current_context().get_memory_info()
+        max_mem = np.ceil(free_mem * memory_fraction).astype(int)
+        limit = (
+            np.floor(
+                np.floor((max_mem - environment.nbytes) / base_types.ray_t.size) / 1e7
+            )
+            * 1e7
+        ).astype(int)
+    else:
+        limit = CPU_RAY_LIMIT
+
+    return limit
+
+
+def raycastGPU(ray_payload, environment_local, bvh_nodes=None, any_hit=False):
+    """
+    Cast the ray payload against the environment on the GPU using :func:`kernel1Dv3`, or :func:`kernel1DBVH` if a
+    bounding volume hierarchy is provided.
+
+    Parameters
+    ----------
+    ray_payload : numpy array of ray_t
+        the rays to be cast
+    environment_local : numpy array of triangle_t
+        blocking environment
+    bvh_nodes : numpy array of bvh_node_t
+        bounding volume hierarchy from :func:`build_bvh`, defaults to [None], testing every triangle
+    any_hit : bool
+        if True, each ray stops at the first intersection found rather than the nearest, so only the intersection flag
+        is meaningful, defaults to [False]
+
+    Returns
+    -------
+    ray_payload : numpy array of ray_t
+        the rays, with the intersection flags and distances updated
+    """
+    d_environment = cuda.to_device(environment_local)
+    if bvh_nodes is None:
+        d_bvh_nodes = None
+    else:
+        d_bvh_nodes = cuda.to_device(bvh_nodes)
+    return raycastDevice(ray_payload, d_environment, d_bvh_nodes, any_hit)
+
+
+def raycastDevice(ray_payload, d_environment, d_bvh_nodes=None, any_hit=False):
+    """
+    Cast the ray payload against an environment which is already resident on the GPU.
+
+    Parameters
+    ----------
+    ray_payload : numpy array of ray_t
+        the rays to be cast
+    d_environment : numba device array of triangle_t
+        blocking environment
+    d_bvh_nodes : numba device array of bvh_node_t
+        bounding volume hierarchy from :func:`build_bvh`, defaults to [None], testing every triangle
+    any_hit : bool
+        if True, each ray stops at the first intersection found rather than the nearest, defaults to [False]
+
+    Returns
+    -------
+    ray_payload : numpy array of ray_t
+        the rays, with the intersection flags and distances updated
+    """
+    threads_in_block = 256
+    d_chunk_payload = cuda.to_device(ray_payload)
+    # Here, we choose the granularity of the threading on our device. We want
+    # to try to cover the entire workload of rays with simulatenous threads
+    grids = math.ceil(ray_payload.shape[0] / threads_in_block)
+    threads = threads_in_block
+    # Execute the kernel
+    if d_bvh_nodes is None:
+        kernel1Dv3[grids, threads](d_chunk_payload, d_environment, any_hit)
+    else:
+        kernel1DBVH[grids, threads](d_chunk_payload, d_environment, d_bvh_nodes, any_hit)
+    ray_payload = d_chunk_payload.copy_to_host()
+    return ray_payload
+
+
+def raycastCPU(ray_payload, environment_local, bvh_nodes=None, any_hit=False):
+    """
+    Cast the ray payload against the environment on the CPU using :func:`kernel1Dv3CPU`, or :func:`kernel1DBVHCPU` if
+    a bounding volume hierarchy is provided.
+
+    Parameters
+    ----------
+    ray_payload : numpy array of ray_t
+        the rays to be cast
+    environment_local : numpy array of triangle_t
+        blocking environment
+    bvh_nodes : numpy array of bvh_node_t
+        bounding volume hierarchy from :func:`build_bvh`, defaults to [None], testing every triangle
+    any_hit : bool
+        if True, each ray stops at the first intersection found rather than the nearest, so only the intersection flag
+        is meaningful, defaults to [False]
+
+    Returns
+    -------
+    ray_payload : numpy array of ray_t
+        the rays, with the intersection flags and distances updated
+    """
+    if bvh_nodes is None:
+        kernel1Dv3CPU(ray_payload, environment_local, any_hit)
+    else:
+        kernel1DBVHCPU(ray_payload, environment_local, bvh_nodes, any_hit)
+    return ray_payload
+
+
+def castRays(
+    ray_payload, environment_local, backend=None, bvh_nodes=None, any_hit=False
+):
+    """
+    Cast the ray payload against the environment using the selected backend.
+
+    Parameters
+    ----------
+    ray_payload : numpy array of ray_t
+        the rays to be cast
+    environment_local : numpy array of triangle_t
+        blocking environment
+    backend : str
+        the raycasting backend, either 'cuda' or 'cpu', defaults to [None], selecting the backend automatically
+    bvh_nodes : numpy array of bvh_node_t
+        bounding volume hierarchy from :func:`build_bvh`, defaults to [None], testing every triangle
+    any_hit : bool
+        if True, each ray stops at the first intersection found rather than the nearest, so only the intersection flag
+        is meaningful, defaults to [False]
+
+    Returns
+    -------
+    ray_payload : numpy array of ray_t
+        the rays, with the intersection flags and distances updated
+    """
+    backend = raycasting_backend(backend)
+    if backend == "cuda":
+        ray_payload = raycastGPU(ray_payload, environment_local, bvh_nodes, any_hit)
+        # deallocate memory on gpu
+        ctx = cuda.current_context()
+        deallocs = ctx.deallocations
+        deallocs.clear()
+    else:
+        ray_payload = raycastCPU(ray_payload, environment_local, bvh_nodes, any_hit)
+
+    return ray_payload
+
+
 def integratedRaycaster(ray_index, scattering_points, environment_local):
     start = timer()
 
@@ -455,6 +1222,9 @@ def visiblespace(
     az_range=np.linspace(-180.0, 180.0, 19),
     elev_range=np.linspace(-90.0, 90.0, 19),
     shell_range=0.5,
+    backend=None,
+    any_hit=True,
+    bvh_nodes=None,
 ):
     """
     Visiblespace generates a matrix stack of visible space for each element, indexed by source_coordinate.
@@ -475,6 +1245,12 @@ def visiblespace(
         array of elevation points in degrees
     shell_range: float
         radius of point cloud shell
+    backend : str
+        the raycasting backend, either 'cuda' or 'cpu', defaults to [None], selecting automatically
+    any_hit : bool
+        if True, rays stop at the first intersection found, defaults to [True]
+    bvh_nodes : numpy array of bvh_node_t
+        bounding volume hierarchy for the environment, defaults to [None], building the hierarchy for this call
 
     Returns
     -------------------
@@ -500,7 +1276,14 @@ def visiblespace(
     # need to create farfield sinks in az,elev coordinates, then convert to xyz sink coordinates, and generate index
     # missed_points,hit_points,missed_index,hit_index,shadow_rays=chunkingRaycaster1D(source_coords,sinks,np.zeros((1,3),dtype=np.float32),initial_index,environment,1,terminate_flag=True)
     hit_index, _ = workchunkingv2(
-        source_coords, sinks, np.empty((0, 3), dtype=np.float32), environment, 1
+        source_coords,
+        sinks,
+        np.empty((0, 3), dtype=np.float32),
+        environment,
+        1,
+        backend=backend,
+        any_hit=any_hit,
+        bvh_nodes=bvh_nodes,
     )
     unified_model = np.append(
         source_coords.astype(np.float32), sinks.astype(np.float32), axis=0
@@ -670,34 +1453,86 @@ def azeltocart(az_data, el_data, radius):
     return x_data, y_data, z_data
 
 
-def convertTriangles(triangle_object):
+def convertTriangles(triangle_object, pose=None):
     """
     convert o3d triangle object to ray tracer triangle class
+
+    Parameters
+    ----------
+    triangle_object : :class:`open3d.geometry.TriangleMesh`
+        the mesh to be converted, or None
+    pose : 4 by 4 numpy array of float
+        homogeneous transform to be applied to the vertices, defaults to [None], leaving the vertices unchanged
+
+    Returns
+    -------
+    triangles : numpy array of triangle_t
+        the triangles of the mesh
     """
-    if triangle_object == None:
+    if triangle_object is None:
         triangles = np.empty(0, dtype=base_types.triangle_t)
     else:
-        vertices = np.asarray(triangle_object.vertices)
-        tri_index = np.asarray(triangle_object.triangles)
-        normals = np.asarray(triangle_object.triangle_normals)
-        triangles = np.empty(len(tri_index), dtype=base_types.triangle_t)
-        for idx in range(len(tri_index)):
-            triangles[idx]["v0x"] = np.single(vertices[tri_index[idx, 0], 0])
-            triangles[idx]["v0y"] = np.single(vertices[tri_index[idx, 0], 1])
-            triangles[idx]["v0z"] = np.single(vertices[tri_index[idx, 0], 2])
-            triangles[idx]["v1x"] = np.single(vertices[tri_index[idx, 1], 0])
-            triangles[idx]["v1y"] = np.single(vertices[tri_index[idx, 1], 1])
-            triangles[idx]["v1z"] = np.single(vertices[tri_index[idx, 1], 2])
-            triangles[idx]["v2x"] = np.single(vertices[tri_index[idx, 2], 0])
-            triangles[idx]["v2y"] = np.single(vertices[tri_index[idx, 2], 1])
-            triangles[idx]["v2z"] = np.single(vertices[tri_index[idx, 2], 2])
-            # triangles[idx]['normx']=np.single(normals[idx,0])
-            # triangles[idx]['normy']=np.single(normals[idx,1])
-            # triangles[idx]['normz']=np.single(normals[idx,2])
+        triangles = triangles_from_vertices(
+            np.asarray(triangle_object.vertices),
+            np.asarray(triangle_object.triangles),
+            pose,
+        )
 
     return triangles
 
 
+def triangles_from_vertices(vertices, tri_index, pose=None):
+    """
+    convert vertices and triangle indices to ray tracer triangle class, indexing the vertices for all triangles at once
+
+    Parameters
+    ----------
+    vertices : n by 3 numpy array of float
+        vertex coordinates
+    tri_index : m by 3 numpy array of int
+        indices of the vertices of each triangle
+    pose : 4 by 4 numpy array of float
+        homogeneous transform to be applied to the vertices, defaults to [None], leaving the vertices unchanged
+
+    Returns
+    -------
+    triangles : numpy array of triangle_t
+        the triangles
+    """
+    if pose is not None:
+        vertices = np.matmul(vertices, pose[:3, :3].T) + pose[:3, 3]
+    triangles = np.empty(tri_index.shape[0], dtype=base_types.triangle_t)
+    # the nine vertex coordinates are stored contiguously in v0, v1, v2 order
+    triangles.view(np.float32).reshape(tri_index.shape[0], 9)[:] = vertices[
+        tri_index
+    ].reshape(tri_index.shape[0], 9)
+    return triangles
+
+
+def transform_triangles(triangles, pose):
+    """
+    apply a homogeneous transform to the vertices of an array of triangles
+
+    Parameters
+    ----------
+    triangles : numpy array of triangle_t
+        the triangles to be transformed
+    pose : 4 by 4 numpy array of float
+        homogeneous transform
+
+    Returns
+    -------
+    transformed : numpy array of triangle_t
+        the transformed triangles
+    """
+    vertices = triangles.view(np.float32).reshape(triangles.shape[0] * 3, 3)
+    transformed = np.empty_like(triangles)
+    transformed.view(np.float32).reshape(triangles.shape[0] * 3, 3)[:] = (
+        np.matmul(vertices, pose[:3, :3].T) + pose[:3, 3]
+    )
+    return transformed
+
+
 def pick_points(pcd):
     """
     test function based on open3d example to pick points, can be used as the basis of a selection function to pick vertices.
@@ -2010,29 +2845,43 @@ def charge_rays_environment1Dv2(sources, sinks, environment_points, point_indexi
     unified_model = np.append(
         np.append(sources, sinks, axis=0), environment_points, axis=0
     )
+    return charge_rays_unified(unified_model, point_indexing)
+
+
+def charge_rays_unified(unified_model, point_indexing):
+    """
+    Generate Ray Payload from the unified model coordinates, with each ray launched from the point in the penultimate
+    column of the point_indexing, towards the point in the final column.
+
+    Parameters
+    ----------
+    unified_model : numpy array of xyz
+        the sources, sinks, and scattering points, in that order
+    point_indexing : numpy array of int
+        the path index, starting from 1 for the first source
+
+    Returns
+    -------
+    temp_ray_payload : array of ray_t type
+        ray payload to be sent to GPU
+
+    """
     temp_ray_payload = np.empty(point_indexing.shape[0], dtype=base_types.ray_t)
-    local_sources = unified_model[point_indexing[:, 0] - 1, :]
-    directions = np.zeros(
-        (len(unified_model[point_indexing[:, 1] - 1, :]), 3), dtype=np.float32
-    )
-    norm_length = np.zeros(
-        (len(unified_model[point_indexing[:, 1] - 1, :]), 1), dtype=np.float32
-    )
+    origins = unified_model[point_indexing[:, -2] - 1, :]
+    directions = np.zeros((point_indexing.shape[0], 3), dtype=np.float32)
+    norm_length = np.zeros((point_indexing.shape[0], 1), dtype=np.float32)
     directions, norm_length = math_functions.calc_dv_norm(
-        unified_model[point_indexing[:, -2] - 1, :],
+        origins,
         unified_model[point_indexing[:, -1] - 1, :],
         directions,
         norm_length,
     )
-    temp_ray_payload[:]["ox"] = unified_model[point_indexing[:, 0] - 1, 0]
-    temp_ray_payload[:]["oy"] = unified_model[point_indexing[:, 0] - 1, 1]
-    temp_ray_payload[:]["oz"] = unified_model[point_indexing[:, 0] - 1, 2]
+    temp_ray_payload[:]["ox"] = origins[:, 0]
+    temp_ray_payload[:]["oy"] = origins[:, 1]
+    temp_ray_payload[:]["oz"] = origins[:, 2]
     temp_ray_payload[:]["dx"] = directions[:, 0]
     temp_ray_payload[:]["dy"] = directions[:, 1]
     temp_ray_payload[:]["dz"] = directions[:, 2]
-    # temp_ray_payload[:]['tx']=unified_model[point_indexing[:,1]-1,0]
-    # temp_ray_payload[:]['ty']=unified_model[point_indexing[:,1]-1,1]
-    # temp_ray_payload[:]['tz']=unified_model[point_indexing[:,1]-1,2]
     temp_ray_payload[:]["dist"] = norm_length[:, 0]
     temp_ray_payload[:]["intersect"] = False
 
@@ -2075,6 +2924,121 @@ def rayHits1Dv2(ray_payload, point_indexing, sink_index):
     return filtered_index, final_index
 
 
+class raycasting_scene:
+    """
+    Session object holding the blocking environment, its bounding volume hierarchy, and optionally the scattering point
+    table for the electromagnetic kernels. When the CUDA backend is used, these are uploaded to the GPU once when the
+    scene is created, and remain resident for every raycasting stage and chunk, and for the frequency domain kernel
+    which follows, until :meth:`release` is called.
+
+    Parameters
+    ----------
+    environment : numpy array of triangle_t
+        blocking environment
+    bvh_nodes : numpy array of bvh_node_t
+        bounding volume hierarchy from :func:`build_bvh`, defaults to [None], testing every triangle
+    backend : str
+        the raycasting backend, either 'cuda' or 'cpu', defaults to [None], selecting the backend automatically
+    point_information : numpy array of scattering_t
+        the point table for the electromagnetic kernels, defaults to [None]
+    """
+
+    def __init__(self, environment, bvh_nodes=None, backend=None, point_information=None):
+        self.backend = raycasting_backend(backend)
+        self.environment = environment
+        self.bvh_nodes = bvh_nodes
+        self.d_environment = None
+        self.d_bvh_nodes = None
+        self.point_information = None
+        self.d_point_information = None
+        if self.backend == "cuda":
+            self.d_environment = cuda.to_device(environment)
+            if bvh_nodes is not None:
+                self.d_bvh_nodes = cuda.to_device(bvh_nodes)
+
+        if point_information is not None:
+            self.set_point_information(point_information)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+    def set_point_information(self, point_information):
+        """
+        Store the point table for the electromagnetic kernels, uploading it to the GPU only if it has changed since the
+        last upload.
+
+        Parameters
+        ----------
+        point_information : numpy array of scattering_t
+            the point table for the electromagnetic kernels
+
+        Returns
+        -------
+        d_point_information : numba device array or numpy array of scattering_t
+            the point table on the device for the CUDA backend, otherwise the host array
+        """
+        if self.point_information is None or not np.array_equal(
+            self.point_information, point_information
+        ):
+            self.point_information = point_information.copy()
+            if self.backend == "cuda":
+                self.d_point_information = cuda.to_device(point_information)
+            else:
+                self.d_point_information = self.point_information
+
+        return self.d_point_information
+
+    def cast(self, ray_payload, any_hit=False):
+        """
+        Cast the ray payload against the resident environment.
+
+        Parameters
+        ----------
+        ray_payload : numpy array of ray_t
+            the rays to be cast
+        any_hit : bool
+            if True, each ray stops at the first intersection found rather than the nearest, defaults to [False]
+
+        Returns
+        -------
+        ray_payload : numpy array of ray_t
+            the rays, with the intersection flags and distances updated
+        """
+        if self.backend == "cuda":
+            return raycastDevice(
+                ray_payload, self.d_environment, self.d_bvh_nodes, any_hit
+            )
+
+        return raycastCPU(ray_payload, self.environment, self.bvh_nodes, any_hit)
+
+    def release(self):
+        """
+        Release the device copies of the environment and point table.
+        """
+        self.d_environment = None
+        self.d_bvh_nodes = None
+        self.d_point_information = None
+        self.point_information = None
+        if self.backend == "cuda":
+            # deallocate memory on gpu
+            ctx = cuda.current_context()
+            deallocs = ctx.deallocations
+            deallocs.clear()
+
+
+def as_scene(environment_local, backend=None, bvh_nodes=None):
+    """
+    Return the environment as a :class:`raycasting_scene`, creating a scene if a triangle array is provided.
+    """
+    if isinstance(environment_local, raycasting_scene):
+        return environment_local
+
+    return raycasting_scene(environment_local, bvh_nodes, backend)
+
+
 def launchRaycaster1Dv2(
     sources, sinks, scattering_points, io_indexing, environment_local
 ):
@@ -2144,7 +3108,14 @@ def launchRaycaster1Dv2(
 
 
 def launchRaycaster1Dv3(
-    sources, sinks, scattering_points, io_indexing, environment_local
+    sources,
+    sinks,
+    scattering_points,
+    io_indexing,
+    environment_local,
+    backend=None,
+    bvh_nodes=None,
+    any_hit=False,
 ):
     # cuda.select_device(0)
     start = timer()
@@ -2154,44 +3125,9 @@ def launchRaycaster1Dv3(
     prep_dt = timer() - start
     raystart = timer()
     ray_num = len(first_ray_payload)
-    tri_num = len(environment_local)
-    # print('Launch Raycaster Triangles ', len(environment_local))
-    max_tris = 2 ** 20
-    triangle_chunk = np.linspace(
-        0, tri_num, math.ceil(tri_num / max_tris) + 1, dtype=np.int32
-    )
-    chunk_size = 2 ** 18
-    threads_in_block = 256
-    # ray_chunks=np.linspace(0,ray_num,math.ceil(ray_num/chunk_size)+1,dtype=np.int32)
-    # for idx in range(len(triangle_chunk)-1):
-    d_environment = cuda.device_array(len(environment_local), dtype=base_types.triangle_t)
-    cuda.to_device(environment_local, to=d_environment)
-
-    d_chunk_payload = cuda.device_array([ray_num], dtype=base_types.ray_t)
-    cuda.to_device(first_ray_payload, to=d_chunk_payload)
-    #
-    # ray_temp=np.empty((chunk_ray_size),dtype=np.bool)
-    # ray_temp[:]=first_ray_payload[ray_chunks[n]:ray_chunks[n+1]]['intersect']
-    # distance_temp=np.empty((chunk_ray_size),dtype=np.float32)
-    # distance_temp[:]=math.inf
-    # dist_list=cuda.to_device(distance_temp)
-    # d_ray_flag=cuda.to_device(ray_temp)
-    # Here, we choose the granularity of the threading on our device. We want
-    # to try to cover the entire workload of rays and targets with simulatenous threads, so we'll
-    # choose a grid of (source_num/16. target_num/16) blocks, each with (16, 16) threads
-    grids = math.ceil(ray_num / threads_in_block)
-    threads = threads_in_block
-    # Execute the kernel
-    # cuda.profile_start()
-    # kernel1Dv2[grids, threads](d_chunk_payload,d_environment,d_ray_flag)
-    kernel1Dv3[grids, threads](d_chunk_payload, d_environment)
-    # cuda.profile_stop()
-    # distmap[source_chunks[n]:source_chunks[n+1],target_chunks[m]:target_chunks[m+1]] = d_distmap_chunked.copy_to_host()
-    first_ray_payload = d_chunk_payload.copy_to_host()
-    # first_ray_payload[ray_chunks[n]:ray_chunks[n+1]]['intersect']=d_chunk_payload['intersect'].copy_to_host()
-    # first_ray_payload[ray_chunks[n]:ray_chunks[n+1]]['dist']=d_chunk_payload['dist'].copy_to_host()
-
-    # cuda.close()
+    first_ray_payload = as_scene(environment_local, backend, bvh_nodes).cast(
+        first_ray_payload, any_hit
+    )
     kernel_dt = timer() - raystart
     start = timer()
     RAYS_CAST = ray_num
@@ -2202,10 +3138,6 @@ def launchRaycaster1Dv3(
         first_ray_payload, io_indexing, sink_index
     )
     mem_dt = timer() - start
-    # deallocate memory on gpu
-    ctx = cuda.current_context()
-    deallocs = ctx.deallocations
-    deallocs.clear()
     # print("First Stage: Prep {:3.1f} s, Raycasting  {:3.1f} s, Path Processing {:3.1f} s".format(prep_dt,kernel_dt,mem_dt) )
     return filtered_index, final_index, RAYS_CAST
 
@@ -2291,9 +3223,18 @@ def chunkingRaycaster1Dv2(
 
 
 def chunkingRaycaster1Dv3(
-    sources, sinks, scattering_points, filtered_index, environment_local, terminate_flag
+    sources,
+    sinks,
+    scattering_points,
+    filtered_index,
+    environment_local,
+    terminate_flag,
+    backend=None,
+    bvh_nodes=None,
+    any_hit=False,
 ):
-    start = timer()
+    scene = as_scene(environment_local, backend, bvh_nodes)
+    backend = scene.backend
     sink_index = np.arange(
         sources.shape[0] + 1, sources.shape[0] + 1 + sinks.shape[0]
     ).reshape(sinks.shape[0], 1)
@@ -2301,139 +3242,22 @@ def chunkingRaycaster1Dv3(
         np.max(sink_index) + 1, np.max(sink_index) + 1 + scattering_points.shape[0]
     ).reshape(scattering_points.shape[0], 1)
     if not terminate_flag:
-        target_indexing = create_model_index(
-            filtered_index, sink_index, scattering_point_index
-        )
-    else:
-        target_indexing = create_model_index(
-            filtered_index, sink_index, np.empty((0, 0), dtype=np.int32)
-        )  # only target rays at sinks
-
-    prep_dt = timer() - start
-    raystart = timer()
-    RAYS_CAST = 0
-    # the rays must fit in GPU memory, aim for no more than 80% utilisation
-    # establish memory limits
-    free_mem, total_mem = cuda.current_context().get_memory_info()
-    max_mem = np.ceil(free_mem * 0.5).astype(int)
-    ray_limit = (
-        np.floor(np.floor((max_mem - environment_local.nbytes) / base_types.ray_t.size) / 1e7)
-        * 1e7
-    ).astype(int)
-    if target_indexing.shape[0] >= ray_limit:
-        # need to split the array and process seperatly
-        sub_target = np.array_split(
-            target_indexing, np.ceil(target_indexing.shape[0] / ray_limit).astype(int)
-        )
-        chunknum = len(sub_target)
-        filtered_index2 = np.empty((0, target_indexing.shape[1]), dtype=np.int32)
-        final_index2 = np.empty((0, target_indexing.shape[1]), dtype=np.int32)
-        # print('chunking total of ',target_indexing.shape[0],' rays in ',chunknum,' batches')
-        for chunkindex in range(chunknum):
-            # cycle the raycaster over the sub arrays
-            threads_in_block = 256
-            second_ray_payload = charge_rays_environment1Dv2(
-                sources, sinks, scattering_points, sub_target[chunkindex]
-            )
-            # ray_chunks=np.linspace(0,ray_num,math.ceil(ray_num/chunk_size)+1,dtype=np.int32)
-            # for idx in range(len(triangle_chunk)-1):
-            d_environment = cuda.device_array(
-                len(environment_local), dtype=base_types.triangle_t
-            )
-            cuda.to_device(environment_local, to=d_environment)
-            d_chunk_payload = cuda.device_array(
-                [second_ray_payload.shape[0]], dtype=base_types.ray_t
-            )
-            cuda.to_device(second_ray_payload, to=d_chunk_payload)
-            #
-            # ray_temp=np.empty((chunk_ray_size),dtype=np.bool)
-            # ray_temp[:]=first_ray_payload[ray_chunks[n]:ray_chunks[n+1]]['intersect']
-            # distance_temp=np.empty((chunk_ray_size),dtype=np.float32)
-            # distance_temp[:]=math.inf
-            # dist_list=cuda.to_device(distance_temp)
-            # d_ray_flag=cuda.to_device(ray_temp)
-            # Here, we choose the granularity of the threading on our device. We want
-            # to try to cover the entire workload of rays and targets with simulatenous threads, so we'll
-            # choose a grid of (source_num/16. target_num/16) blocks, each with (16, 16) threads
-            grids = math.ceil(second_ray_payload.shape[0] / threads_in_block)
-            threads = threads_in_block
-            # Execute the kernel
-            # cuda.profile_start()
-            # kernel1Dv2[grids, threads](d_chunk_payload,d_environment,d_ray_flag)
-            kernel1Dv3[grids, threads](d_chunk_payload, d_environment)
-            # cuda.profile_stop()
-            # distmap[source_chunks[n]:source_chunks[n+1],target_chunks[m]:target_chunks[m+1]] = d_distmap_chunked.copy_to_host()
-            second_ray_payload = d_chunk_payload.copy_to_host()
-            # first_ray_payload[ray_chunks[n]:ray_chunks[n+1]]['intersect']=d_chunk_payload['intersect'].copy_to_host()
-            # first_ray_payload[ray_chunks[n]:ray_chunks[n+1]]['dist']=d_chunk_payload['dist'].copy_to_host()
-
-            # cuda.close()
-            kernel_dt = timer() - raystart
-            start = timer()
-            RAYS_CAST += second_ray_payload.shape[0]
-            temp_filtered_index2, temp_final_index2 = rayHits1Dv2(
-                second_ray_payload, sub_target[chunkindex], sink_index
-            )
-            mem_dt = timer() - start
-            filtered_index2 = np.append(filtered_index2, temp_filtered_index2, axis=0)
-            final_index2 = np.append(final_index2, temp_final_index2, axis=0)
-            # deallocate memory on gpu
-            ctx = cuda.current_context()
-            deallocs = ctx.deallocations
-            deallocs.clear()
+        target_index = np.append(sink_index, scattering_point_index, axis=0)
     else:
-        second_ray_payload = charge_rays_environment1Dv2(
-            sources, sinks, scattering_points, target_indexing
-        )
-        # print('Chunking Raycaster Triangles ', len(environment_local))
-        # max_tris=2**18
-        # triangle_chunk=np.linspace(0,tri_num,math.ceil(tri_num/max_tris)+1,dtype=np.int32)
-
-        # chunk_size=2**11
-        threads_in_block = 256
-        # ray_chunks=np.linspace(0,ray_num,math.ceil(ray_num/chunk_size)+1,dtype=np.int32)
-        # for idx in range(len(triangle_chunk)-1):
-        d_environment = cuda.device_array(len(environment_local), dtype=base_types.triangle_t)
-        cuda.to_device(environment_local, to=d_environment)
-        d_chunk_payload = cuda.device_array(
-            [second_ray_payload.shape[0]], dtype=base_types.ray_t
-        )
-        cuda.to_device(second_ray_payload, to=d_chunk_payload)
-        #
-        # ray_temp=np.empty((chunk_ray_size),dtype=np.bool)
-        # ray_temp[:]=first_ray_payload[ray_chunks[n]:ray_chunks[n+1]]['intersect']
-        # distance_temp=np.empty((chunk_ray_size),dtype=np.float32)
-        # distance_temp[:]=math.inf
-        # dist_list=cuda.to_device(distance_temp)
-        # d_ray_flag=cuda.to_device(ray_temp)
-        # Here, we choose the granularity of the threading on our device. We want
-        # to try to cover the entire workload of rays and targets with simulatenous threads, so we'll
-        # choose a grid of (source_num/16. target_num/16) blocks, each with (16, 16) threads
-        grids = math.ceil(second_ray_payload.shape[0] / threads_in_block)
-        threads = threads_in_block
-        # Execute the kernel
-        # cuda.profile_start()
-        # kernel1Dv2[grids, threads](d_chunk_payload,d_environment,d_ray_flag)
-        kernel1Dv3[grids, threads](d_chunk_payload, d_environment)
-        # cuda.profile_stop()
-        # distmap[source_chunks[n]:source_chunks[n+1],target_chunks[m]:target_chunks[m+1]] = d_distmap_chunked.copy_to_host()
-        second_ray_payload = d_chunk_payload.copy_to_host()
-        # first_ray_payload[ray_chunks[n]:ray_chunks[n+1]]['intersect']=d_chunk_payload['intersect'].copy_to_host()
-        # first_ray_payload[ray_chunks[n]:ray_chunks[n+1]]['dist']=d_chunk_payload['dist'].copy_to_host()
+        target_index = sink_index  # only target rays at sinks
 
-        # cuda.close()
-        kernel_dt = timer() - raystart
-        start = timer()
-        RAYS_CAST += second_ray_payload.shape[0]
-        filtered_index2, final_index2 = rayHits1Dv2(
-            second_ray_payload, target_indexing, sink_index
-        )
-        mem_dt = timer() - start
-        # deallocate memory on gpu
-        ctx = cuda.current_context()
-        deallocs = ctx.deallocations
-        deallocs.clear()
-        # print("Second Stage: Prep {:3.1f} s, Raycasting  {:3.1f} s, Path Processing {:3.1f} s".format(prep_dt,kernel_dt,mem_dt) )
+    # the rays must fit in GPU memory, aim for no more than 50% utilisation
+    max_rays = ray_limit(scene, 0.5, backend)
+    filtered_index2, final_index2, RAYS_CAST = streamingRaycaster(
+        sources,
+        sinks,
+        scattering_points,
+        filtered_index,
+        target_index,
+        scene,
+        max_rays,
+        any_hit=any_hit,
+    )
     return filtered_index2, final_index2, RAYS_CAST
 
 
@@ -2707,48 +3531,351 @@ def create_model_index(source_index, sink_index, scattering_point_index):
         DESCRIPTION.
 
     """
-    io_indexing = np.zeros(
-        (
-            source_index.shape[0]
-            * (sink_index.shape[0] + scattering_point_index.shape[0]),
-            source_index.shape[1] + 1,
-        ),
+    targets = np.append(sink_index.ravel(), scattering_point_index.ravel()).astype(
+        np.int32
+    )
+    io_indexing = np.empty(
+        (source_index.shape[0] * targets.shape[0], source_index.shape[1] + 1),
         dtype=np.int32,
     )
-    idx = 0
-    for n in np.arange(0, source_index.shape[0]):
-        if scattering_point_index.shape[0] == 0:
-            io_indexing[
-                np.arange(
-                    idx, idx + (sink_index.shape[0] + scattering_point_index.shape[0])
-                ),
-                -1,
-            ] = sink_index.ravel()
-        else:
-            io_indexing[
-                np.arange(
-                    idx, idx + (sink_index.shape[0] + scattering_point_index.shape[0])
-                ),
-                -1,
-            ] = np.append(sink_index, scattering_point_index, axis=0).ravel()
-
-        io_indexing[
-            np.arange(
-                idx, idx + (sink_index.shape[0] + scattering_point_index.shape[0])
-            ),
-            0 : source_index.shape[1],
-        ] = source_index[n, :]
-        idx += sink_index.shape[0] + scattering_point_index.shape[0]
-
+    io_indexing[:, :-1] = np.repeat(source_index, targets.shape[0], axis=0)
+    io_indexing[:, -1] = np.tile(targets, source_index.shape[0])
     # then boolean check and filter to ensure there are no loops, aiming next ray at originating point
     return io_indexing[np.not_equal(io_indexing[:, -2], io_indexing[:, -1]), :]
 
 
+def model_index_batches(parent_index, target_index, batch_size):
+    """
+    Generate the model index in batches, equivalent to slicing the output of :func:`create_model_index` into
+    consecutive blocks of rows, without creating the full index. Rows which would aim a ray back at the point it was
+    launched from are dropped from each batch.
+
+    Parameters
+    ----------
+    parent_index : n by m numpy array of int
+        the path index up to the current launch point, with the launch point in the final column
+    target_index : numpy array of int
+        the indices of the points to be targeted from each launch point
+    batch_size : int
+        the maximum number of rows in each batch
+
+    Yields
+    -------
+    batch_index : numpy array of int
+        rows of the model index, with the target in the final column
+    """
+    targets = np.asarray(target_index, dtype=np.int32).ravel()
+    total = parent_index.shape[0] * targets.shape[0]
+    batch_size = max(int(batch_size), 1)
+    for start in range(0, total, batch_size):
+        rows = np.arange(start, min(start + batch_size, total))
+        batch_index = np.empty((rows.shape[0], parent_index.shape[1] + 1), dtype=np.int32)
+        batch_index[:, :-1] = parent_index[rows // targets.shape[0], :]
+        batch_index[:, -1] = targets[rows % targets.shape[0]]
+        yield batch_index[batch_index[:, -2] != batch_index[:, -1], :]
+
+
+def ray_batches(sources, sinks, scattering_points, parent_index, target_index, batch_size):
+    """
+    Generate ray payloads lazily from index ranges, so that only one batch of rays is held in memory at a time.
+
+    Parameters
+    ----------
+    sources : n*3 numpy array of float
+    sinks : m*3 numpy array of float
+    scattering_points : o*3 numpy array of float
+    parent_index : numpy array of int
+        the path index up to the current launch point, with the launch point in the final column
+    target_index : numpy array of int
+        the indices of the points to be targeted from each launch point
+    batch_size : int
+        the maximum number of rays in each batch
+
+    Yields
+    -------
+    batch_index : numpy array of int
+        rows of the model index for the batch
+    ray_payload : numpy array of ray_t
+        the rays for each row of the batch index
+    """
+    unified_model = np.append(
+        np.append(sources, sinks, axis=0), scattering_points, axis=0
+    ).astype(np.float32)
+    for batch_index in model_index_batches(parent_index, target_index, batch_size):
+        if batch_index.shape[0] == 0:
+            continue
+        yield batch_index, charge_rays_unified(unified_model, batch_index)
+
+
+def streamingRaycaster(
+    sources,
+    sinks,
+    scattering_points,
+    parent_index,
+    target_index,
+    environment_local,
+    batch_size,
+    backend=None,
+    bvh_nodes=None,
+    any_hit=False,
+):
+    """
+    Cast rays from the final point of each path in the parent index to each target, generating, casting and compacting
+    the rays one batch at a time.
+
+    Parameters
+    ----------
+    sources : n*3 numpy array of float
+    sinks : m*3 numpy array of float
+    scattering_points : o*3 numpy array of float
+    parent_index : numpy array of int
+        the path index up to the current launch point, with the launch point in the final column
+    target_index : numpy array of int
+        the indices of the points to be targeted from each launch point
+    environment_local : numpy array of triangle_t or :class:`raycasting_scene`
+        blocking environment
+    batch_size : int
+        the maximum number of rays in each batch
+    backend : str
+        the raycasting backend, either 'cuda' or 'cpu', defaults to [None], selecting the backend automatically
+    bvh_nodes : numpy array of bvh_node_t
+        bounding volume hierarchy from :func:`build_bvh`, defaults to [None], testing every triangle
+    any_hit : bool
+        if True, each ray stops at the first intersection found, defaults to [False]
+
+    Returns
+    -------
+    filtered_index : numpy array of int
+        unblocked paths which end at a scattering point
+    final_index : numpy array of int
+        unblocked paths which end at a sink
+    RAYS_CAST : int
+        the number of rays cast
+    """
+    scene = as_scene(environment_local, backend, bvh_nodes)
+    sink_index = np.arange(
+        sources.shape[0] + 1, sources.shape[0] + 1 + sinks.shape[0]
+    ).reshape(sinks.shape[0], 1)
+    filtered_parts = [np.empty((0, parent_index.shape[1] + 1), dtype=np.int32)]
+    final_parts = [np.empty((0, parent_index.shape[1] + 1), dtype=np.int32)]
+    RAYS_CAST = 0
+    for batch_index, ray_payload in ray_batches(
+        sources, sinks, scattering_points, parent_index, target_index, batch_size
+    ):
+        ray_payload = scene.cast(ray_payload, any_hit)
+        RAYS_CAST += ray_payload.shape[0]
+        temp_filtered_index, temp_final_index = rayHits1Dv2(
+            ray_payload, batch_index, sink_index
+        )
+        filtered_parts.append(temp_filtered_index)
+        final_parts.append(temp_final_index)
+
+    # compact the surviving paths
+    filtered_index = np.concatenate(filtered_parts, axis=0)
+    final_index = np.concatenate(final_parts, axis=0)
+    return filtered_index, final_index, RAYS_CAST
+
+
+def visibility_graph(
+    sources,
+    sinks,
+    scattering_points,
+    environment_local,
+    target_index,
+    batch_size,
+    backend=None,
+    bvh_nodes=None,
+    any_hit=True,
+):
+    """
+    Precompute the mutual visibility between the scattering points and the targets, casting each ray once. The graph
+    is stored in compressed sparse row form, with the visible targets of the scattering point with index
+    first_scatter + i held in neighbours[offsets[i]:offsets[i + 1]], in ascending order.
+
+    Parameters
+    ----------
+    sources : n*3 numpy array of float
+    sinks : m*3 numpy array of float
+    scattering_points : o*3 numpy array of float
+    environment_local : numpy array of triangle_t or :class:`raycasting_scene`
+        blocking environment
+    target_index : numpy array of int
+        the indices of the points to be tested for visibility from each scattering point
+    batch_size : int
+        the maximum number of rays in each batch
+    backend : str
+        the raycasting backend, either 'cuda' or 'cpu', defaults to [None], selecting the backend automatically
+    bvh_nodes : numpy array of bvh_node_t
+        bounding volume hierarchy from :func:`build_bvh`, defaults to [None], testing every triangle
+    any_hit : bool
+        if True, each ray stops at the first intersection found, defaults to [True]
+
+    Returns
+    -------
+    offsets : numpy array of int
+        the start of the neighbours of each scattering point, with length o + 1
+    neighbours : numpy array of int32
+        the indices of the visible targets
+    RAYS_CAST : int
+        the number of rays cast
+    """
+    first_scatter = sources.shape[0] + sinks.shape[0] + 1
+    scattering_point_index = np.arange(
+        first_scatter, first_scatter + scattering_points.shape[0], dtype=np.int32
+    ).reshape(-1, 1)
+    filtered_index, final_index, RAYS_CAST = streamingRaycaster(
+        sources,
+        sinks,
+        scattering_points,
+        scattering_point_index,
+        target_index,
+        environment_local,
+        batch_size,
+        backend=backend,
+        bvh_nodes=bvh_nodes,
+        any_hit=any_hit,
+    )
+    edges = np.append(final_index, filtered_index, axis=0)
+    edges = edges[np.lexsort((edges[:, 1], edges[:, 0]))]
+    offsets = np.zeros(scattering_points.shape[0] + 1, dtype=np.int64)
+    np.cumsum(
+        np.bincount(edges[:, 0] - first_scatter, minlength=scattering_points.shape[0]),
+        out=offsets[1:],
+    )
+    return offsets, edges[:, 1].astype(np.int32), RAYS_CAST
+
+
+def visibility_walk(parent_index, offsets, neighbours, first_scatter, sink_limit, sinks_only=False):
+    """
+    Extend each path by one leg using the visibility graph from :func:`visibility_graph`, producing the same rows in
+    the same order as casting the rays with :func:`streamingRaycaster`, without casting any rays.
+
+    Parameters
+    ----------
+    parent_index : n by m numpy array of int
+        the path index up to the current launch point, with a scattering point in the final column
+    offsets : numpy array of int
+        the start of the neighbours of each scattering point
+    neighbours : numpy array of int32
+        the indices of the visible targets
+    first_scatter : int
+        the index of the first scattering point
+    sink_limit : int
+        the index of the final sink, targets with higher indices are scattering points
+    sinks_only : bool
+        if True, only the paths which end at a sink are generated, defaults to [False]
+
+    Returns
+    -------
+    filtered_index : numpy array of int
+        paths which end at a scattering point
+    final_index : numpy array of int
+        paths which end at a sink
+    """
+    launch = parent_index[:, -1] - first_scatter
+    starts = offsets[launch]
+    counts = offsets[launch + 1] - starts
+    if sinks_only:
+        # the neighbours are sorted, so the sinks come first
+        owners = np.repeat(np.arange(offsets.shape[0] - 1), np.diff(offsets))
+        sink_counts = np.bincount(
+            owners[neighbours <= sink_limit], minlength=offsets.shape[0] - 1
+        )
+        counts = sink_counts[launch]
+    rows = np.repeat(np.arange(parent_index.shape[0]), counts)
+    # position of each new row within its parent's neighbours
+    cumulative = np.cumsum(counts) - counts
+    positions = np.repeat(starts - cumulative, counts) + np.arange(rows.shape[0])
+    extended = np.empty((rows.shape[0], parent_index.shape[1] + 1), dtype=np.int32)
+    extended[:, :-1] = parent_index[rows, :]
+    extended[:, -1] = neighbours[positions]
+    sink_rows = extended[:, -1] <= sink_limit
+    return extended[~sink_rows, :], extended[sink_rows, :]
+
+
+def transmitter_paths(
+    sources,
+    scattering_points,
+    environment_local,
+    batch_size=None,
+    backend=None,
+    bvh_nodes=None,
+    any_hit=True,
+):
+    """
+    Cast the first leg of the scattered paths, from every source to every scattering point. These rays do not depend
+    upon the sinks, so the result can be passed to :func:`workchunkingv2` as the first leg for any set of sinks, such
+    as each tile of a coverage map.
+
+    Parameters
+    ----------
+    sources : n*3 numpy array of float
+    scattering_points : o*3 numpy array of float
+    environment_local : numpy array of triangle_t or :class:`raycasting_scene`
+        blocking environment
+    batch_size : int
+        the maximum number of rays in each batch, defaults to [None], using :func:`ray_limit`
+    backend : str
+        the raycasting backend, either 'cuda' or 'cpu', defaults to [None], selecting the backend automatically
+    bvh_nodes : numpy array of bvh_node_t
+        bounding volume hierarchy from :func:`build_bvh`, defaults to [None], testing every triangle
+    any_hit : bool
+        if True, each ray stops at the first intersection found, defaults to [True]
+
+    Returns
+    -------
+    first_leg : n by 2 numpy array of int32
+        the source index of each unblocked path, counting from 1, and the scattering point, counting from 0
+    RAYS_CAST : int
+        the number of rays cast
+    """
+    release_scene = not isinstance(environment_local, raycasting_scene)
+    scene = as_scene(environment_local, backend, bvh_nodes)
+    if batch_size is None:
+        batch_size = ray_limit(scene, 0.8, scene.backend)
+    source_index = np.arange(1, sources.shape[0] + 1).reshape(sources.shape[0], 1)
+    scattering_point_index = np.arange(
+        sources.shape[0] + 1, sources.shape[0] + 1 + scattering_points.shape[0]
+    ).reshape(scattering_points.shape[0], 1)
+    first_leg, _, RAYS_CAST = streamingRaycaster(
+        sources,
+        np.empty((0, 3), dtype=np.float32),
+        scattering_points,
+        source_index,
+        scattering_point_index,
+        scene,
+        batch_size,
+        any_hit=any_hit,
+    )
+    if release_scene:
+        scene.release()
+    first_leg[:, 1] -= sources.shape[0] + 1
+    return first_leg, RAYS_CAST
+
+
 def workchunkingv2(
-    sources, sinks, scattering_points, environment, max_scatter, line_of_sight=True
+    sources,
+    sinks,
+    scattering_points,
+    environment,
+    max_scatter,
+    line_of_sight=True,
+    backend=None,
+    any_hit=True,
+    bvh_nodes=None,
+    scene=None,
+    max_rays_total=None,
+    visibility=None,
+    path_cache=None,
+    compact=False,
+    first_leg=None,
+    direction="forward",
 ):
     """
-    Raycasting index creation and assignment to raycaster, upper bound is around 4.7e8 rays at a time, there is already chunking to prevent overflow of the GPU memory and timeouts
+    Raycasting index creation and assignment to raycaster, upper bound is around 4.7e8 rays at a time, there is already chunking to prevent overflow of the GPU memory and timeouts.
+    The paths are extended one wavefront at a time, so any number of scatters can be considered. After the first leg,
+    the rays between scattering points, and from scattering points to sinks, are cast once to build a visibility graph,
+    and the later legs are generated by walking the graph rather than casting a ray for every surviving path.
 
     Parameters
     ----------
@@ -2757,30 +3884,136 @@ def workchunkingv2(
     scattering_points : o*3 numpy array of float
     environment : numpy array of triangle_t
     max_scatter : int
+        the maximum number of legs in each path, 1 for line of sight only, 2 for single scattering, and so on
     line_of_sight : boolean
+    backend : str
+        the raycasting backend, either 'cuda' or 'cpu', defaults to [None], using the GPU if a CUDA device is available,
+        and the Numba parallel CPU raycaster otherwise
+    any_hit : bool
+        if True, the raycaster only establishes whether each path is blocked, stopping at the first intersection found,
+        rather than searching for the nearest intersection, defaults to [True]
+    bvh_nodes : numpy array of bvh_node_t
+        bounding volume hierarchy for the environment, as returned with the environment by :func:`build_bvh`, defaults
+        to [None], building the hierarchy for this call
+    scene : :class:`raycasting_scene`
+        a scene holding the environment, which will be reused for all raycasting stages and left resident for later
+        use, defaults to [None], creating a scene for this call from the environment
+    max_rays_total : int
+        cap on the total number of rays cast, if the next wavefront could exceed the cap then no further scattering
+        depths are considered and a warning is raised, defaults to [None], no limit
+    visibility : tuple
+        the (offsets, neighbours) visibility graph between the scattering points and the sinks and scattering points
+        from :func:`visibility_graph`, which can be reused while the geometry is unchanged, defaults to [None],
+        casting the rays needed to build the graph for this call
+    path_cache : :class:`lyceanem.raycasting.pathcache.path_cache`
+        on disk cache of raycasting results, keyed by a hash of the points, environment, raycasting settings, and any
+        first leg or visibility graph supplied. If the paths are already in the cache they are returned without
+        raycasting, otherwise they are stored once they have been found, defaults to [None], using :func:`lyceanem.raycasting.pathcache.default_path_cache`. Set to
+        False to disable the cache for this call.
+    compact : bool
+        if True, the paths are returned as a :class:`lyceanem.raycasting.pathstore.path_store`, without padding the
+        shorter paths to the width of the longest, defaults to [False]. The cache holds the paths in this compact form.
+    first_leg : numpy array of int
+        the unblocked paths from the sources to the scattering points from :func:`transmitter_paths`, which do not
+        depend upon the sinks, so they can be shared between calls for different sets of sinks, defaults to [None],
+        casting the first leg rays for this call
+    direction : str
+        the direction in which the paths are traced, either 'forward', launching from the sources, 'reverse',
+        launching from the sinks and reversing the paths found, or 'auto', tracing in reverse when there are fewer
+        sinks than sources, unless a first leg or visibility graph, which are specific to the forward direction, is
+        given, defaults to ['forward']. Back faces are culled, so when tracing in reverse the winding of every
+        triangle is mirrored, and the paths are the same as those found tracing forward, in the same order.
 
     Returns
     ---------
-    full_index : 2D numpy array of ints
+    full_index : 2D numpy array of ints or :class:`lyceanem.raycasting.pathstore.path_store`
         the index for all successful rays cast from source coordinates, to any scattering points, to the sink point for each entry
     RAYS_CAST : int
-        the number of rays cast in this launch.
+        the number of rays cast in this launch, 0 if the paths were loaded from the cache.
     """
     # temp function to chunk the number of rays to prevent creation of ray arrays to large for memory
     # print('WorkChunking Triangles ',len(environment))
     raycasting_timestamp = timer()
-    ray_estimate = (
-        sources.shape[0] * (sinks.shape[0] + scattering_points.shape[0])
-    ) + (
-        sources.shape[0] * (scattering_points.shape[0] * sinks.shape[0] * (max_scatter))
-    )
-    # print("Total of {:3.1f} rays required".format(ray_estimate))
+    if max_scatter < 1:
+        raise ValueError("max_scatter must be at least 1, not {}".format(max_scatter))
+    if direction == "auto":
+        if first_leg is None and visibility is None and sinks.shape[0] < sources.shape[0]:
+            direction = "reverse"
+        else:
+            direction = "forward"
+    if direction not in ("forward", "reverse"):
+        raise ValueError(
+            "direction must be 'forward', 'reverse' or 'auto', not {}".format(direction)
+        )
+    if direction == "reverse" and (first_leg is not None or visibility is not None):
+        raise ValueError(
+            "the first leg and visibility graph can only be used when tracing forward"
+        )
+    if path_cache is None:
+        path_cache = pathcache.default_path_cache()
+    if path_cache:
+        cache_key = pathcache.path_key(
+            sources,
+            sinks,
+            scattering_points,
+            environment if scene is None else scene.environment,
+            max_scatter,
+            line_of_sight,
+            max_rays_total,
+            first_leg=first_leg,
+            visibility=visibility,
+        )
+        cached_paths = path_cache.load(cache_key)
+        if cached_paths is not None:
+            if compact:
+                return cached_paths, 0
+            return cached_paths.to_full_index(max_scatter + 1), 0
+    if direction == "reverse":
+        # launch from the sinks, so the partial paths held between wavefronts, which grow with the number of launch
+        # points, scale with the smaller set of points, then transpose the paths. Each leg is cast in the opposite
+        # direction, so the winding of the triangles is mirrored to keep the same faces culled as tracing forward.
+        # The triangles are not moved, so the bounding volume hierarchy is unchanged.
+        reverse_scene = None
+        if scene is not None:
+            reverse_scene = raycasting_scene(
+                mirror_triangles(scene.environment), scene.bvh_nodes, backend=scene.backend
+            )
+        reverse_index, RAYS_CAST = workchunkingv2(
+            sinks,
+            sources,
+            scattering_points,
+            None if environment is None else mirror_triangles(environment),
+            max_scatter,
+            line_of_sight=line_of_sight,
+            backend=backend,
+            any_hit=any_hit,
+            bvh_nodes=bvh_nodes,
+            scene=reverse_scene,
+            max_rays_total=max_rays_total,
+            path_cache=False,
+            direction="forward",
+        )
+        if reverse_scene is not None:
+            reverse_scene.release()
+        full_index = reverse_paths(reverse_index, sinks.shape[0], sources.shape[0])
+        if compact:
+            full_index = pathstore.compact_paths(full_index)
+        if path_cache:
+            path_cache.store(cache_key, full_index)
+        return full_index, RAYS_CAST
     # establish memory limits
-    free_mem, total_mem = cuda.current_context().get_memory_info()
-    max_mem = np.ceil(free_mem * 0.8).astype(int)
-    ray_limit = (
-        np.floor(np.floor((max_mem - environment.nbytes) / base_types.ray_t.size) / 1e7) * 1e7
-    ).astype(int)
+    if scene is None:
+        if bvh_nodes is None:
+            # the triangles are reordered to match the leaves of the bounding volume hierarchy
+            environment, bvh_nodes = build_bvh(environment)
+        # the environment is uploaded once, and reused for every stage and chunk
+        scene = raycasting_scene(environment, bvh_nodes, backend)
+        release_scene = True
+    else:
+        release_scene = False
+
+    backend = scene.backend
+    max_rays = ray_limit(scene, 0.8, backend)
     # establish index boundaries
     source_index = np.arange(1, sources.shape[0] + 1).reshape(
         sources.shape[0], 1
@@ -2791,229 +4024,171 @@ def workchunkingv2(
     scattering_point_index = np.arange(
         np.max(sink_index) + 1, np.max(sink_index) + 1 + scattering_points.shape[0]
     ).reshape(scattering_points.shape[0], 1)
-    # implement chunking
-    if max_scatter == 1:
-        full_index = np.empty((0, 2), dtype=np.int32)
-        io_indexing = create_model_index(
-            source_index, sink_index, scattering_point_index
-        )
-        if io_indexing.shape[0] >= ray_limit:
-            # need to split the array and process seperatly
-            sub_io = np.array_split(
-                io_indexing, np.ceil(io_indexing.shape[0] / ray_limit).astype(int)
-            )
-            chunknum = len(sub_io)
-
-            for chunkindex in range(chunknum):
-                _, temp_index, first_wave_Rays = launchRaycaster1Dv3(
-                    sources,
-                    sinks,
-                    scattering_points,
-                    sub_io[chunkindex],
-                    copy.deepcopy(environment),
-                )
-                full_index = np.append(full_index, temp_index, axis=0)
+    # rays are generated and cast in batches from index ranges, so memory use depends upon the batch size rather than
+    # the number of sources, sinks and scattering points. Each wavefront extends the surviving paths by one leg.
+    # the completed paths of each wavefront, all with the same number of legs
+    completed_paths = []
+    parent_index = source_index
+    RAYS_CAST = 0
+    for depth in range(1, max_scatter + 1):
+        if depth == max_scatter:
+            # final leg, only target rays at sinks
+            target_index = sink_index
+        elif depth == 1 and not line_of_sight:
+            # drop line of sight rays from queue
+            target_index = scattering_point_index
         else:
-            _, temp_index, first_wave_Rays = launchRaycaster1Dv3(
-                sources,
-                sinks,
-                scattering_points,
-                io_indexing,
-                copy.deepcopy(environment),
-            )
-            full_index = np.append(full_index, temp_index, axis=0)
-            RAYS_CAST = first_wave_Rays
+            target_index = np.append(sink_index, scattering_point_index, axis=0)
 
-    elif max_scatter == 2:
-        full_index = np.empty((0, 3), dtype=np.int32)
-        if line_of_sight:
-            io_indexing = create_model_index(
-                source_index, sink_index, scattering_point_index
-            )
+        shared_first_leg = depth == 1 and first_leg is not None and max_scatter > 1
+        if shared_first_leg:
+            # the rays to the scattering points have already been cast, so only the line of sight rays are needed
+            if line_of_sight:
+                target_index = sink_index
+            else:
+                target_index = np.empty((0, 1), dtype=sink_index.dtype)
+
+        if depth == 1:
+            wavefront_rays = parent_index.shape[0] * target_index.shape[0]
+        elif visibility is None:
+            # the graph is built once, with every edge needed by the remaining legs
+            if max_scatter == 2:
+                graph_targets = sink_index
+            else:
+                graph_targets = np.append(sink_index, scattering_point_index, axis=0)
+            wavefront_rays = scattering_points.shape[0] * graph_targets.shape[0]
         else:
-            # drop line of sight rays from queue
-            io_indexing = create_model_index(
-                source_index, np.empty((0, 1)), scattering_point_index
+            wavefront_rays = 0
+        if max_rays_total is not None and RAYS_CAST + wavefront_rays > max_rays_total:
+            warnings.warn(
+                "Raycasting stopped at {} scatters, as the next wavefront of up to {} rays would exceed the limit "
+                "of {} rays".format(depth - 1, wavefront_rays, max_rays_total)
             )
+            break
 
-        if io_indexing.shape[0] >= ray_limit:
-            # need to split the array and process separately
-            sub_io = np.array_split(
-                io_indexing, np.ceil(io_indexing.shape[0] / ray_limit).astype(int)
-            )
-            chunknum = len(sub_io)
-            final_index = np.empty((0, 3), dtype=np.int32)
-            RAYS_CAST = 0
-            for chunkindex in range(chunknum):
-                (
-                    temp_filtered_index,
-                    temp_final_index,
-                    first_wave_Rays,
-                ) = launchRaycaster1Dv3(
-                    sources,
-                    sinks,
-                    scattering_points,
-                    sub_io[chunkindex],
-                    copy.deepcopy(environment),
-                )
-                # filtered_index = np.append(filtered_index, temp_filtered_index, axis=0)
-                # final_index = np.append(final_index, temp_final_index, axis=0)
-                if temp_filtered_index.shape[0] == 0:
-                    temp_filtered_index2 = np.empty((0, 3), dtype=np.int32)
-                    temp_final_index2 = np.empty((0, 3), dtype=np.int32)
-                    second_wave_rays = 0
-                else:
-                    (
-                        temp_filtered_index2,
-                        temp_final_index2,
-                        second_wave_rays,
-                    ) = chunkingRaycaster1Dv3(
-                        sources,
-                        sinks,
-                        scattering_points,
-                        temp_filtered_index,
-                        environment,
-                        terminate_flag=True,
-                    )
-                RAYS_CAST += first_wave_Rays + second_wave_rays
-                # create combined path network
-                host_size = np.shape(temp_final_index)
-                host_padding = np.zeros((host_size[0], 1), dtype=np.int32)
-                temp_full_index = np.append(
-                    np.append(temp_final_index, host_padding, axis=1),
-                    temp_final_index2,
-                    axis=0,
-                )
-                full_index = np.append(full_index, temp_full_index, axis=0)
-        else:
-            filtered_index, final_index, first_wave_Rays = launchRaycaster1Dv3(
+        if depth == 1:
+            filtered_index, final_index, wavefront_cast = streamingRaycaster(
                 sources,
                 sinks,
                 scattering_points,
-                io_indexing,
-                copy.deepcopy(environment),
+                parent_index,
+                target_index,
+                scene,
+                max_rays,
+                any_hit=any_hit,
             )
-
-            if filtered_index.shape[0] == 0:
-                filtered_index2 = np.empty((0, 3), dtype=np.int32)
-                final_index2 = np.empty((0, 3), dtype=np.int32)
-                second_wave_rays = 0
-            else:
-                filtered_index2, final_index2, second_wave_rays = chunkingRaycaster1Dv3(
+            RAYS_CAST += wavefront_cast
+            if shared_first_leg:
+                filtered_index = np.asarray(first_leg, dtype=np.int32).reshape(-1, 2).copy()
+                filtered_index[:, 1] += np.max(sink_index) + 1
+        else:
+            if visibility is None:
+                offsets, neighbours, graph_cast = visibility_graph(
                     sources,
                     sinks,
                     scattering_points,
-                    filtered_index,
-                    environment,
-                    terminate_flag=True,
-                )
-                # cuda.profile_stop()
-                # print('WorkChunkingMaxScatter2 Triangles ', len(environment), 'Filtered Rays Stage 2', len(filtered_index2), 'Final Rays Stage 2',len(final_index2))
-                start = timer()
-                # filtered_network2,final_network2,filtered_index2,final_index2=rayHits(second_ray_payload,distmap2,io_index2,scatter_inc=2,origins_local=second_origin)
-                RAYS_CAST = first_wave_Rays + second_wave_rays
-                # create combined path network
-                host_size = np.shape(final_index)
-                host_padding = np.zeros((host_size[0], 1), dtype=np.int32)
-                temp_full_index = np.append(
-                    np.append(final_index, host_padding, axis=1), final_index2, axis=0
-                )
-                full_index = np.append(full_index, temp_full_index, axis=0)
-
-    elif max_scatter == 3:
-        full_index = np.empty((0, 4), dtype=np.int32)
-        chunknum = np.minimum(sources.shape[0], np.int(np.ceil(ray_estimate / 2e8)))
-        chunknum = np.maximum(2, chunknum)
-        source_chunking = np.linspace(0, sources.shape[0], chunknum, dtype=np.int32)
-        for chunkindex in range(source_chunking.size - 1):
-            if line_of_sight:
-                io_indexing = create_model_index(
-                    source_index[
-                        source_chunking[chunkindex] : source_chunking[chunkindex + 1]
-                    ],
-                    sink_index,
-                    scattering_point_index,
-                )
-                filtered_index, final_index, first_wave_Rays = launchRaycaster1Dv3(
-                    sources, sinks, scattering_points, io_indexing, environment
-                )
-            else:
-                # drop line of sight rays from queue
-                io_indexing = create_model_index(
-                    source_index[
-                        source_chunking[chunkindex] : source_chunking[chunkindex + 1]
-                    ],
-                    np.empty((0, 1)),
-                    scattering_point_index,
-                )
-                filtered_index, final_index, first_wave_Rays = launchRaycaster1Dv3(
-                    sources, sinks, scattering_points, io_indexing, environment
+                    scene,
+                    graph_targets,
+                    max_rays,
+                    any_hit=any_hit,
                 )
-            filtered_index2, final_index2, second_wave_rays = chunkingRaycaster1Dv3(
-                sources, sinks, scattering_points, filtered_index, environment, False
+                visibility = (offsets, neighbours)
+                RAYS_CAST += graph_cast
+            filtered_index, final_index = visibility_walk(
+                parent_index,
+                visibility[0],
+                visibility[1],
+                np.max(sink_index) + 1,
+                np.max(sink_index),
+                sinks_only=depth == max_scatter,
             )
-            if filtered_index2.shape[0] * sinks.shape[0] > 2e8:
-                temp_chunks = np.int(
-                    np.ceil((filtered_index2.shape[0] * sinks.shape[0]) / 2e8)
-                )
-                temp_chunking = np.linspace(
-                    0, filtered_index2.shape[0], temp_chunks, dtype=np.int32
-                )
-                temp_index = np.empty((0, 4), dtype=np.int32)
-                for temp_chunkindex in range(temp_chunking.shape[0] - 1):
-                    (
-                        filtered_index3,
-                        final_index3_part,
-                        third_wave_rays,
-                    ) = chunkingRaycaster1Dv3(
-                        sources,
-                        sinks,
-                        scattering_points,
-                        filtered_index2[
-                            temp_chunking[temp_chunkindex] : temp_chunking[
-                                temp_chunkindex + 1
-                            ],
-                            :,
-                        ],
-                        environment,
-                        True,
-                    )
-                    temp_index = np.append(temp_index, final_index3_part, axis=0)
+        completed_paths.append(final_index)
+        parent_index = filtered_index
+        if parent_index.shape[0] == 0:
+            break
 
-                final_index3 = temp_index
-            else:
-                filtered_index3, final_index3, third_wave_rays = chunkingRaycaster1Dv3(
-                    sources,
-                    sinks,
-                    scattering_points,
-                    filtered_index2,
-                    environment,
-                    True,
-                )
+    if release_scene:
+        scene.release()
 
-            # cuda.profile_stop()
-            start = timer()
-            # filtered_network2,final_network2,filtered_index2,final_index2=rayHits(second_ray_payload,distmap2,io_index2,scatter_inc=2,origins_local=second_origin)
-            RAYS_CAST = first_wave_Rays + second_wave_rays + third_wave_rays
-            # create combined path network
-            host_size = np.shape(final_index)
-            host_nans = np.zeros((host_size[0], 1), dtype=np.int32)
-            temp_total = np.append(
-                np.append(final_index, host_nans, axis=1), final_index2, axis=0
-            )
-            host_size2 = np.shape(temp_total)
-            host_nans2 = np.zeros((host_size2[0], 1), dtype=np.int32)
-            full_index_temp = np.append(
-                np.append(temp_total, host_nans2, axis=1), final_index3, axis=0
-            )
-            full_index = np.append(full_index, full_index_temp, axis=0)
-            # process for scattering matrix
+    if compact:
+        full_index = pathstore.stack_paths(completed_paths)
+    else:
+        # pad the completed paths to the full index width
+        full_index = np.zeros(
+            (sum(paths.shape[0] for paths in completed_paths), max_scatter + 1),
+            dtype=np.int32,
+        )
+        start = 0
+        for paths in completed_paths:
+            full_index[start : start + paths.shape[0], : paths.shape[1]] = paths
+            start += paths.shape[0]
+
+    if path_cache:
+        path_cache.store(cache_key, full_index)
 
     raycastingduration = raycasting_timestamp - timer()
     # print("Raycasting Duration:  {:3.1f} s, Total Rays: {:3.1f}".format(raycastingduration,RAYS_CAST) )
     return full_index, RAYS_CAST
 
 
+def reverse_paths(full_index, source_num, sink_num):
+    """
+    Transpose a full index traced from the sinks to the sources, by exchanging the source and sink indices and
+    reversing the order of the nodes in each path. The rows are sorted into the order found when tracing from the
+    sources, with the paths grouped by depth, and ordered by their nodes within each depth.
+
+    Parameters
+    ----------
+    full_index : 2D numpy array of int
+        the index of all successful rays from the sinks to the sources, with the sinks numbered from 1, followed by the
+        sources, then the scattering points, and zero padded after the final node
+    source_num : int
+        the number of points the paths were launched from
+    sink_num : int
+        the number of points the paths were traced to
+
+    Returns
+    -------
+    full_index : 2D numpy array of int32
+        the index of the same paths, from the points the paths were traced to, to the points they were launched from
+    """
+    full_index = np.asarray(full_index)
+    lengths = np.count_nonzero(full_index, axis=1)
+    # the padding is only ever after the final node, so each path is reversed in place within its own length
+    columns = lengths.reshape(-1, 1) - 1 - np.arange(full_index.shape[1])
+    reversed_index = np.take_along_axis(full_index, np.maximum(columns, 0), axis=1)
+    reversed_index[columns < 0] = 0
+    transposed_index = reversed_index.astype(np.int32)
+    launched = (reversed_index >= 1) & (reversed_index <= source_num)
+    traced = (reversed_index > source_num) & (reversed_index <= source_num + sink_num)
+    transposed_index[launched] += sink_num
+    transposed_index[traced] -= source_num
+    order = np.lexsort(tuple(transposed_index[:, ::-1].T) + (lengths,))
+    return transposed_index[order, :]
+
+
+def mirror_triangles(environment):
+    """
+    Copy of the environment with the winding of every triangle reversed, by exchanging the second and third vertices,
+    so the front and back faces are exchanged without moving the triangles.
+
+    Parameters
+    ----------
+    environment : numpy array of triangle_t
+        blocking environment
+
+    Returns
+    -------
+    mirrored : numpy array of triangle_t
+        the environment with the winding of every triangle reversed
+    """
+    mirrored = environment.copy()
+    for axis in ("x", "y", "z"):
+        mirrored["v1" + axis] = environment["v2" + axis]
+        mirrored["v2" + axis] = environment["v1" + axis]
+    return mirrored
+
+
 def create_scatter_index(
     source_index, sink_index, scattering_point_index, scattering_mask
 ):
@@ -0,0 +1,53 @@
+import numpy as np
+import open3d as o3d
+import pytest
+from ..raycasting import rayfunctions as RF
+
+
+def cube():
+    # a cube centered at the origin, with side lengths of 1m (default)
+    cube = o3d.geometry.TriangleMesh.create_box()
+    cube.translate(np.array([-0.5, -0.5, -0.5]))
+    return cube
+
+
+@pytest.fixture
+def environment():
+    return RF.convertTriangles(cube())
+
+
+@pytest.fixture
+def scene():
+    # sources on the -x side of the cube, sinks on the +x side, with the outer sinks clear of the cube
+    sources = np.array([[-2.0, 0.0, 0.0], [-2.0, 0.2, 0.0]], dtype=np.float32)
+    sinks = np.array(
+        [[2.0, 0.0, 0.0], [2.0, 3.0, 0.0], [2.0, -3.0, 0.0], [2.0, 0.0, 3.0]],
+        dtype=np.float32,
+    )
+    scattering_points = np.array(
+        [[0.0, 2.0, 0.0], [0.0, -2.0, 0.0], [0.0, 0.0, 0.0]], dtype=np.float32
+    )
+    return sources, sinks, scattering_points
+
+
+def random_scene(triangle_num=500, ray_num=2000):
+    # a random triangle soup with rays between random points, so that many rays are partially occluded
+    rng = np.random.default_rng(1)
+    vertices = rng.uniform(-1.0, 1.0, (triangle_num, 1, 3)) + rng.uniform(
+        -0.2, 0.2, (triangle_num, 3, 3)
+    )
+    environment = np.empty(triangle_num, dtype=RF.base_types.triangle_t)
+    for idx, axis in enumerate(["x", "y", "z"]):
+        environment["v0" + axis] = vertices[:, 0, idx]
+        environment["v1" + axis] = vertices[:, 1, idx]
+        environment["v2" + axis] = vertices[:, 2, idx]
+    origins = rng.uniform(-1.5, 1.5, (ray_num, 3))
+    targets = rng.uniform(-1.5, 1.5, (ray_num, 3))
+    rays = np.empty(ray_num, dtype=RF.base_types.ray_t)
+    lengths = np.linalg.norm(targets - origins, axis=1)
+    directions = (targets - origins) / lengths.reshape(-1, 1)
+    rays["ox"], rays["oy"], rays["oz"] = origins.T
+    rays["dx"], rays["dy"], rays["dz"] = directions.T
+    rays["dist"] = lengths
+    rays["intersect"] = False
+    return environment, rays
@@ -4,6 +4,7 @@ import open3d as o3d
 from numpy.testing import assert_equal, assert_allclose
 from scipy.spatial.transform import Rotation as R
 from ..base_classes import antenna_structures,structures,points
+from ..raycasting import rayfunctions as RF
 
 def cube():
     # a cube centered at the origin, with side lengths of 1m (default)
@@ -72,4 +73,43 @@ def test_excitation_function_x_mz_cp(standard_antenna):
     desired_E_vector=np.array([1*np.exp(-1j*0),1*np.exp(-1j*(np.pi/2)),0],dtype=np.complex64)
     final_vector=np.array([[1*np.exp(-1j*(np.pi/2)),1*np.exp(-1j*0),0]],dtype=np.complex64)
     standard_antenna.pose[:3,:3]= R.from_euler('y',90,degrees=True).as_matrix()
-    assert_allclose(standard_antenna.excitation_function(desired_e_vector=desired_E_vector),final_vector,atol=1e-12)
\ No newline at end of file
+    assert_allclose(standard_antenna.excitation_function(desired_e_vector=desired_E_vector),final_vector,atol=1e-12)
+
+def test_triangles_base_raycaster_pose():
+    #test that the pose of the structure is applied to all the solids, and that empty solids are skipped
+    second_cube = cube()
+    second_cube.translate(np.array([2.0, 0, 0]))
+    base = structures([cube(), None, second_cube])
+    base.pose[:3, :3] = R.from_euler('z', 90, degrees=True).as_matrix()
+    base.pose[:3, 3] = np.array([0, 0, 1.0])
+    triangles = base.triangles_base_raycaster()
+    assert triangles.shape[0] == 24
+    assert_allclose(triangles['v0x'].max(), 0.5, atol=1e-6)
+    assert_allclose(triangles['v0y'].max(), 2.5, atol=1e-6)
+    assert_allclose(triangles['v0z'].min(), 0.5, atol=1e-6)
+
+def test_triangles_base_raycaster_order():
+    #test that the triangles follow the order of the solids, and are a copy of the cached triangles
+    second_cube = cube()
+    second_cube.translate(np.array([2.0, 0, 0]))
+    base = structures([cube(), second_cube])
+    expected = np.append(RF.convertTriangles(cube()), RF.convertTriangles(second_cube))
+    triangles = base.triangles_base_raycaster()
+    for field in expected.dtype.names:
+        assert_allclose(triangles[field], expected[field], atol=1e-6)
+    cached, _ = base.raycaster_environment()
+    assert triangles is not cached
+    triangles['v0x'] = 100.0
+    assert base.raycaster_environment()[0]['v0x'].max() < 100.0
+
+def test_raycaster_environment_cached():
+    #test that the local triangles are reused for a change of pose, and rebuilt when the solids change
+    base = structures([cube()])
+    local_triangles, _ = base.local_triangles()
+    base.pose[:3, 3] = np.array([1.0, 0, 0])
+    triangles, bvh_nodes = base.raycaster_environment()
+    assert base.local_triangles()[0] is local_triangles
+    assert_allclose(triangles['v0x'], local_triangles['v0x'] + 1.0, atol=1e-6)
+    assert_allclose(bvh_nodes[0]['minx'], 0.5, atol=1e-4)
+    base.add_structure(cube())
+    assert base.local_triangles()[0].shape[0] == 24
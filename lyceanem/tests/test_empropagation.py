@@ -1,9 +1,14 @@
 import pytest
 import numpy as np
 import open3d as o3d
+import scipy.constants
 from numpy.testing import assert_equal, assert_allclose
 from scipy.spatial.transform import Rotation as R
-from ..electromagnetics.empropagation import vector_mapping
+from ..electromagnetics import empropagation as EM
+from ..electromagnetics import impulseresponse
+from ..electromagnetics.empropagation import vector_mapping, targettingindex
+from ..raycasting import pathstore
+from .. import base_types
 
 def test_vector_mapping_x_u():
     #initially test in global coordinate set
@@ -57,4 +62,276 @@ def test_vector_mapping_x_y_n():
     desired_E_vector=np.array([0, 0, 1.0],dtype=np.complex64) #uvn axes with n being the normal vector
     final_E_vector=np.array([0.0, 1.0, 0],dtype=np.complex64)
     assert_allclose(vector_mapping(desired_E_vector,normal_vector,rotation_matrix), final_E_vector,
-                    atol=1e-12)
\ No newline at end of file
+                    atol=1e-12)
+
+
+def test_targettingindex_any_depth():
+    #test that the source and sink are found for paths of any depth, in any order of depths
+    full_index = np.array([[1, 3, 4, 5, 2], [1, 2, 0, 0, 0], [1, 4, 2, 0, 0], [1, 4, 5, 2, 0]])
+    depth_slice, scatter_index = targettingindex(full_index)
+    assert_equal(depth_slice, np.array([[1, 2], [1, 2], [1, 2], [1, 2]]))
+    assert_equal(scatter_index, np.array([4, 1, 2, 3]))
+
+
+def test_targettingindex_preserves_order():
+    # the rows stay in the order of the full index, which is not modified, for any path width
+    full_index = np.array(
+        [[2, 9, 8, 7, 6, 4], [1, 3, 0, 0, 0, 0], [2, 7, 5, 0, 0, 0], [1, 6, 7, 8, 3, 0]],
+        dtype=np.int32,
+    )
+    original = full_index.copy()
+    depth_slice, scatter_index = targettingindex(full_index)
+    assert_equal(depth_slice, np.array([[2, 4], [1, 3], [2, 5], [1, 3]]))
+    assert depth_slice.dtype == np.int32
+    assert_equal(scatter_index, np.array([5, 1, 2, 4]))
+    assert_equal(full_index, original)
+
+
+def point_table(positions, excitation=(0.0, 0.0, 1.0)):
+    # electric point sources, with the excitation applied to every point
+    point_information = np.zeros(len(positions), dtype=base_types.scattering_t)
+    point_information["px"], point_information["py"], point_information["pz"] = np.asarray(
+        positions, dtype=np.float32
+    ).T
+    point_information["nz"] = 1.0
+    point_information["ex"], point_information["ey"], point_information["ez"] = excitation
+    point_information["permittivity"] = 8.8541878176e-12
+    point_information["permeability"] = 1.25663706212e-6
+    point_information["Electric"] = True
+    return point_information
+
+
+def test_em_cpu_line_of_sight():
+    # a z polarised source and a sink 2 m away along the x axis
+    point_information = point_table([[0.0, 0.0, 0.0], [2.0, 0.0, 0.0]], (0.0, 0.0, 1.0))
+    point_information["ex"][1], point_information["ey"][1] = 1.0, 1.0
+    wavelength = 0.1
+    scatter_map = EM.EMGPUFreqDomain(
+        1, 1, np.array([[1, 2]]), point_information, wavelength, backend="cpu"
+    )
+    loss = np.exp(1j * 2.0 * 2 * np.pi / wavelength) * wavelength / (4 * np.pi * 2.0)
+    assert scatter_map.shape == (1, 1, 3)
+    assert_allclose(scatter_map[0, 0], np.array([0.0, 0.0, loss]), rtol=1e-6, atol=1e-12)
+
+
+def test_em_cpu_partial_networks(monkeypatch):
+    # the result should not depend upon how the paths are divided between the partial networks
+    rng = np.random.default_rng(2)
+    point_information = point_table(rng.uniform(-1.0, 1.0, (9, 3)), (1.0, 0.5, 0.2))
+    sources, sinks = np.arange(1, 3), np.arange(3, 6)
+    full_index = np.zeros((0, 3), dtype=np.int32)
+    for source in sources:
+        for sink in sinks:
+            full_index = np.append(full_index, [[source, sink, 0]], axis=0)
+            for scatter in range(6, 10):
+                full_index = np.append(full_index, [[source, scatter, sink]], axis=0)
+    threaded = EM.EMGPUFreqDomain(
+        2, 3, full_index, point_information, 0.1, backend="cpu", accumulator="scatter"
+    )
+    monkeypatch.setattr(EM, "CPU_ACCUMULATOR_BYTES", 0)
+    single = EM.EMGPUFreqDomain(
+        2, 3, full_index, point_information, 0.1, backend="cpu", accumulator="scatter"
+    )
+    assert_allclose(threaded, single, rtol=1e-10)
+    # the default sorted segmented sum matches the partial networks
+    segmented = EM.EMGPUFreqDomain(2, 3, full_index, point_information, 0.1, backend="cpu")
+    assert_allclose(segmented, threaded, rtol=1e-10)
+    # the padding after the sink is ignored, so the line of sight paths match the unpadded index
+    line_of_sight = full_index[full_index[:, 2] == 0, :2]
+    assert_allclose(
+        EM.EMGPUFreqDomain(2, 3, line_of_sight, point_information, 0.1, backend="cpu"),
+        EM.EMGPUFreqDomain(
+            2, 3, full_index[full_index[:, 2] == 0], point_information, 0.1, backend="cpu"
+        ),
+    )
+
+
+def test_frequency_sweep_matches_single_frequency():
+    rng = np.random.default_rng(3)
+    point_information = point_table(rng.uniform(-1.0, 1.0, (7, 3)), (0.3, 1.0, 0.2))
+    full_index = np.array(
+        [[1, 3, 0], [1, 4, 0], [2, 3, 0], [1, 5, 3], [2, 6, 4], [2, 7, 3], [1, 6, 3]]
+    )
+    wavelengths = np.array([0.05, 0.1, 0.3])
+    path_lengths, polar_coefficients = EM.EMGPUJointPathLengthandPolar(
+        2, 2, full_index, point_information, backend="cpu"
+    )
+    sweep = EM.EMFrequencySweep(
+        2, 2, full_index, path_lengths, polar_coefficients, wavelengths
+    )
+    assert sweep.shape == (3, 2, 2, 3)
+    for idx, wavelength in enumerate(wavelengths):
+        assert_allclose(
+            sweep[idx],
+            EM.EMGPUFreqDomain(2, 2, full_index, point_information, wavelength, backend="cpu"),
+            rtol=1e-10,
+        )
+
+
+def test_apply_transfer_tensor():
+    rng = np.random.default_rng(4)
+    transfer = rng.normal(size=(2, 4, 3, 3)) + 1j * rng.normal(size=(2, 4, 3, 3))
+    weights = rng.normal(size=(5, 2, 3)) + 1j * rng.normal(size=(5, 2, 3))
+    fields = EM.apply_transfer_tensor(transfer, weights)
+    assert fields.shape == (5, 2, 4, 3)
+    for excitation in range(5):
+        for source in range(2):
+            for sink in range(4):
+                assert_allclose(
+                    fields[excitation, source, sink],
+                    transfer[source, sink] @ weights[excitation, source],
+                )
+
+
+def test_em_cpu_single_precision():
+    # the single precision network should agree with the double precision path to float32 accuracy
+    rng = np.random.default_rng(5)
+    point_information = point_table(rng.uniform(-1.0, 1.0, (40, 3)), (1.0, 0.5, 0.2))
+    full_index = np.array(
+        [
+            [source, scatter, sink]
+            for source in range(1, 3)
+            for sink in range(3, 6)
+            for scatter in range(6, 41)
+        ]
+    )
+    double = EM.EMGPUFreqDomain(2, 3, full_index, point_information, 0.1, backend="cpu")
+    single = EM.EMGPUFreqDomain(
+        2, 3, full_index, point_information, 0.1, backend="cpu", precision="single"
+    )
+    assert single.dtype == np.complex64
+    assert_allclose(single, double, rtol=1e-5, atol=1e-6 * np.abs(double).max())
+    with pytest.raises(ValueError):
+        EM.EMGPUFreqDomain(
+            2, 3, full_index, point_information, 0.1, backend="cpu", precision="half"
+        )
+    with pytest.raises(ValueError):
+        EM.EMGPUFreqDomain(
+            2,
+            3,
+            full_index,
+            point_information,
+            0.1,
+            backend="cpu",
+            precision="single",
+            accumulator="scatter",
+        )
+
+
+def test_segment_sum_compensated():
+    # compensated summation of many small terms onto a large one retains the small terms
+    path_fields = np.full((100001, 3), 1e-4 + 1e-4j, dtype=np.complex64)
+    path_fields[0] = 1.0 + 1.0j
+    order, offsets, segment_pairs = EM.path_segments(np.zeros(100001, dtype=np.int64))
+    assert_equal(segment_pairs, np.array([0]))
+    segment_sums = np.zeros((1, 3), dtype=np.complex64)
+    EM.segmentsumCPU(path_fields, order, offsets, segment_sums)
+    reference = np.sum(path_fields.astype(np.complex128), axis=0)
+    assert_allclose(segment_sums[0], reference, rtol=1e-6)
+
+
+def test_path_segments_unsorted():
+    # the paths of each pair are gathered in their original order, whatever order the pairs arrive in
+    full_index = np.array([[2, 4, 0], [1, 3, 0], [2, 5, 3], [1, 5, 4], [1, 6, 3], [2, 4, 0]])
+    pairs = EM.path_pairs(2, 2, full_index)
+    assert_equal(pairs, np.array([3, 0, 2, 1, 0, 3]))
+    order, offsets, segment_pairs = EM.path_segments(pairs)
+    assert_equal(segment_pairs, np.array([0, 1, 2, 3]))
+    assert_equal(offsets, np.array([0, 2, 3, 4, 6]))
+    assert_equal(order, np.array([1, 4, 3, 2, 0, 5]))
+
+
+def test_em_cpu_path_store():
+    # the compact path store gives the same networks as the zero padded index
+    rng = np.random.default_rng(6)
+    point_information = point_table(rng.uniform(-1.0, 1.0, (8, 3)), (0.3, 1.0, 0.2))
+    full_index = np.array(
+        [[1, 3, 0, 0], [2, 4, 0, 0], [1, 5, 3, 0], [2, 6, 4, 0], [1, 5, 8, 4], [2, 7, 3, 0]]
+    )
+    paths = pathstore.compact_paths(full_index)
+    for accumulator in ("segment", "scatter"):
+        assert_allclose(
+            EM.EMGPUFreqDomain(
+                2, 2, paths, point_information, 0.1, backend="cpu", accumulator=accumulator
+            ),
+            EM.EMGPUFreqDomain(
+                2, 2, full_index, point_information, 0.1, backend="cpu", accumulator=accumulator
+            ),
+            rtol=1e-12,
+        )
+    for compact, padded in zip(
+        EM.EMGPUJointPathLengthandPolar(2, 2, paths, point_information, backend="cpu"),
+        EM.EMGPUJointPathLengthandPolar(2, 2, full_index, point_information, backend="cpu"),
+    ):
+        assert_allclose(compact, padded, rtol=1e-12)
+
+
+def test_em_cpu_time_domain_taps():
+    # at the design wavelength, the phase of each tap from its arrival time gives the frequency domain network
+    rng = np.random.default_rng(7)
+    point_information = point_table(rng.uniform(-1.0, 1.0, (8, 3)), (0.3, 1.0, 0.2))
+    full_index = np.array(
+        [[1, 3, 0, 0], [2, 4, 0, 0], [1, 5, 3, 0], [2, 6, 4, 0], [1, 5, 8, 4], [2, 7, 3, 0]]
+    )
+    wavelength = 0.1
+    taps = EM.EMTimeDomainTaps(2, 2, full_index, point_information, wavelength, backend="cpu")
+    assert len(taps) == full_index.shape[0]
+    assert_equal(taps.sources, [0, 1, 0, 1, 0, 1])
+    assert_equal(taps.sinks, [0, 1, 0, 1, 1, 0])
+    assert_equal(taps.depths, [0, 0, 1, 1, 2, 1])
+    phases = np.exp(1j * 2 * np.pi * scipy.constants.c * taps.delays / wavelength)
+    scatter_map = np.zeros((2, 2, 3), dtype=np.complex128)
+    np.add.at(
+        scatter_map, (taps.sources, taps.sinks), taps.amplitudes * phases.reshape(-1, 1)
+    )
+    assert_allclose(
+        scatter_map,
+        EM.EMGPUFreqDomain(2, 2, full_index, point_information, wavelength, backend="cpu"),
+        rtol=1e-6,
+    )
+    # the imaginary part of the x excitation delays every path through the point
+    point_information["ex"][2] = 0.3 + 1e-9j
+    delayed = EM.EMTimeDomainTaps(2, 2, full_index, point_information, wavelength, backend="cpu")
+    assert_allclose(delayed.delays - taps.delays, [1e-9, 0, 1e-9, 0, 0, 1e-9], atol=1e-15)
+    assert_allclose(delayed.amplitudes, taps.amplitudes)
+
+
+def test_time_domain_cpu():
+    # the time domain response on the CPU, with the line of sight arrival in the sample after the path delay
+    point_information = point_table([[0.0, 0.0, 0.0], [3.0, 0.0, 0.0], [0.0, 4.0, 0.0]])
+    full_index = np.array([[1, 2], [1, 3]])
+    excitation_signal = np.ones(8)
+    time_map, time_ref = EM.TimeDomain(
+        1, 2, point_information, full_index, 0.5, 0.1, excitation_signal, 1e9, 64
+    )
+    assert time_map.shape == (2, 3, 64)
+    assert time_map.dtype == np.float32
+    assert_allclose(time_ref, 3.0 / scipy.constants.c)
+    # ignoring the round off of the FFT convolution before the arrival
+    first = np.flatnonzero(np.abs(time_map[0, 2]) > 1e-6 * np.max(np.abs(time_map[0, 2])))[0]
+    assert first == np.digitize(3.0 / scipy.constants.c, np.linspace(0, 64e-9, 64))
+    fractional, _ = EM.TimeDomain(
+        1, 2, point_information, full_index, 0.5, 0.1, excitation_signal, 1e9, 64,
+        fractional_delay=True,
+    )
+    assert_allclose(np.sum(fractional, axis=2), np.sum(time_map, axis=2), rtol=1e-5)
+
+
+def test_time_domain_streaming_cpu(tmp_path):
+    # the streaming engine writes the same time map as synthesising the taps in memory, with a budget which only fits
+    # windows of 60 samples
+    rng = np.random.default_rng(8)
+    point_information = point_table(rng.uniform(-1.0, 1.0, (8, 3)), (0.3, 1.0, 0.2))
+    full_index = np.array(
+        [[1, 3, 0, 0], [2, 4, 0, 0], [1, 5, 3, 0], [2, 6, 4, 0], [1, 5, 8, 4], [2, 7, 3, 0]]
+    )
+    excitation_signal = np.hanning(12)
+    time_map, wake_time = EM.TimeDomainv4(
+        2, 2, point_information, full_index, 0.5, 0.1, excitation_signal, 2e10, 256,
+        filename=tmp_path / "time_map.npy", memory_budget=10000, backend="cpu",
+    )
+    taps = EM.EMTimeDomainTaps(2, 2, full_index, point_information, 0.1, backend="cpu")
+    reference, reference_wake_time = impulseresponse.synthesise(taps, excitation_signal, 2e10, 256)
+    assert wake_time == reference_wake_time
+    assert isinstance(time_map, np.memmap)
+    assert_allclose(time_map, reference, atol=1e-15)
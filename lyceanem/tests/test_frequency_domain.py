@@ -0,0 +1,111 @@
+import numpy as np
+import open3d as o3d
+from numpy.testing import assert_allclose
+from ..base_classes import structures
+from ..electromagnetics import empropagation as EM
+from ..models import frequency_domain as FD
+
+
+def plate():
+    # a small plate below the aperture, so that there is a blocking environment
+    solid = o3d.geometry.TriangleMesh.create_box(0.2, 0.2, 0.01)
+    solid.translate(np.array([-0.1, -0.1, -0.2]))
+    solid.compute_triangle_normals()
+    return structures([solid])
+
+
+def aperture(points):
+    coords = o3d.geometry.PointCloud()
+    coords.points = o3d.utility.Vector3dVector(np.asarray(points, dtype=np.float64))
+    coords.normals = o3d.utility.Vector3dVector(
+        np.repeat(np.array([[0.0, 0.0, 1.0]]), len(points), axis=0)
+    )
+    return coords
+
+
+def test_farfield_elements_single_pass():
+    # each element pattern should match the pattern of that element on its own, and sum to the array pattern
+    points = [[0.0, 0.0, 0.0], [0.05, 0.0, 0.0]]
+    az_range = np.linspace(-180.0, 180.0, 13)
+    el_range = np.linspace(-90.0, 90.0, 7)
+    settings = dict(wavelength=0.1, farfield_distance=20.0)
+    etheta, ephi = FD.calculate_farfield(
+        aperture(points), plate(), np.array([1.0, 0, 0]), az_range, el_range,
+        elements=True, **settings
+    )
+    assert etheta.shape == (2, 7, 13)
+    array_etheta, array_ephi = FD.calculate_farfield(
+        aperture(points), plate(), np.array([1.0, 0, 0]), az_range, el_range, **settings
+    )
+    assert_allclose(np.sum(etheta, axis=0), array_etheta, rtol=1e-5, atol=1e-9)
+    assert_allclose(np.sum(ephi, axis=0), array_ephi, rtol=1e-5, atol=1e-9)
+    for element in range(2):
+        single_etheta, single_ephi = FD.calculate_farfield(
+            aperture(points[element : element + 1]), plate(), np.array([1.0, 0, 0]),
+            az_range, el_range, **settings
+        )
+        # the excitation is normalised by the number of elements
+        assert_allclose(etheta[element] * 2, single_etheta, rtol=1e-5, atol=1e-9)
+        assert_allclose(ephi[element] * 2, single_ephi, rtol=1e-5, atol=1e-9)
+
+
+def test_farfield_sweep_matches_single_frequency():
+    points = [[0.0, 0.0, 0.0], [0.05, 0.0, 0.0]]
+    az_range = np.linspace(-180.0, 180.0, 13)
+    el_range = np.linspace(-90.0, 90.0, 7)
+    wavelengths = np.array([0.1, 0.15])
+    etheta, ephi = FD.calculate_farfield_sweep(
+        aperture(points), plate(), np.array([1.0, 0, 0]), az_range, el_range, wavelengths,
+        farfield_distance=20.0, elements=True,
+    )
+    assert etheta.shape == (2, 2, 7, 13)
+    for idx, wavelength in enumerate(wavelengths):
+        single_etheta, single_ephi = FD.calculate_farfield(
+            aperture(points), plate(), np.array([1.0, 0, 0]), az_range, el_range,
+            wavelength=wavelength, farfield_distance=20.0, elements=True,
+        )
+        assert_allclose(etheta[idx], single_etheta, rtol=1e-5, atol=1e-9)
+        assert_allclose(ephi[idx], single_ephi, rtol=1e-5, atol=1e-9)
+
+
+def test_transfer_tensor_reweighting():
+    sources = aperture([[0.0, 0.0, 0.0], [0.05, 0.0, 0.0]])
+    sinks = aperture([[0.0, 0.0, 1.0], [0.5, 0.0, 1.0], [0.0, 0.5, 1.0]])
+    transfer = FD.calculate_transfer_tensor(sources, sinks, plate(), wavelength=0.1)
+    assert transfer.shape == (2, 3, 3, 3)
+    for excitation in [np.array([1.0, 0.0, 0.0]), np.array([0.3, 1.0, 0.5j])]:
+        Ex, Ey, Ez = FD.calculate_scattering(
+            sources, sinks, plate(), excitation, wavelength=0.1, elements=True
+        )
+        weights = np.repeat(excitation.reshape(1, 3), 2, axis=0).astype(np.complex64)
+        fields = EM.apply_transfer_tensor(transfer, weights)
+        assert_allclose(fields[..., 0], Ex, rtol=1e-5, atol=1e-9)
+        assert_allclose(fields[..., 1], Ey, rtol=1e-5, atol=1e-9)
+        assert_allclose(fields[..., 2], Ez, rtol=1e-5, atol=1e-9)
+
+
+
+def test_coverage_matches_scattering(tmp_path):
+    # the tiled coverage map should match the element responses from a single call, summed over the sources
+    sources = aperture([[0.0, 0.0, 0.0], [0.05, 0.0, 0.0]])
+    x, y = np.meshgrid(np.linspace(-0.3, 0.3, 3), np.linspace(-0.3, 0.3, 2))
+    sinks = aperture(np.stack((x.ravel(), y.ravel(), np.full(x.size, 0.5)), axis=1))
+    scatter_points = aperture([[0.05, 0.05, -0.19], [-0.05, 0.0, -0.19], [0.0, -0.05, -0.19]])
+    for scattering in (0, 1):
+        Ex, Ey, Ez = FD.calculate_scattering(
+            sources, sinks, plate(), np.array([[1.0, 0.0, 0.0]]),
+            scatter_points=scatter_points, wavelength=0.1, scattering=scattering,
+            elements=True,
+        )
+        coverage = FD.calculate_coverage(
+            sources, sinks, plate(), np.array([1.0, 0.0, 0.0]),
+            scatter_points=scatter_points, wavelength=0.1, scattering=scattering,
+            batch_size=4, filename=tmp_path / "coverage_{}.npy".format(scattering),
+        )
+        assert isinstance(coverage, np.memmap)
+        assert coverage.shape == (6, 3)
+        reference = np.stack([np.sum(field, axis=0) for field in (Ex, Ey, Ez)], axis=1)
+        assert_allclose(coverage, reference, rtol=1e-5, atol=1e-9)
+        assert_allclose(
+            np.load(tmp_path / "coverage_{}.npy".format(scattering)), coverage
+        )
@@ -0,0 +1,242 @@
+import tracemalloc
+
+import numpy as np
+import pytest
+from numpy.testing import assert_allclose, assert_equal
+from ..electromagnetics import empropagation as EM
+from ..electromagnetics import impulseresponse as IR
+
+
+def random_taps(source_num=2, sink_num=3, tap_num=40, seed=3):
+    rng = np.random.default_rng(seed)
+    return IR.channel_taps(
+        source_num,
+        sink_num,
+        rng.integers(0, source_num, tap_num),
+        rng.integers(0, sink_num, tap_num),
+        rng.uniform(1e-8, 6e-8, tap_num),
+        rng.normal(size=(tap_num, 3)),
+        rng.integers(0, 3, tap_num),
+    )
+
+
+def shifted_sum(taps, excitation_signal, sampling_freq, num_samples, wake_time):
+    # add a shifted copy of the excitation for every tap, truncated at the end of the time map
+    time_map = np.zeros((taps.source_num, taps.sink_num, num_samples, 3))
+    for tap in range(len(taps)):
+        start = int((taps.delays[tap] - wake_time) // (1.0 / sampling_freq))
+        if start < 0 or start >= num_samples:
+            continue
+        end = min(num_samples, start + excitation_signal.shape[0])
+        time_map[taps.sources[tap], taps.sinks[tap], start:end, :] += (
+            excitation_signal[: end - start].reshape(-1, 1) * taps.amplitudes[tap]
+        )
+    return time_map
+
+
+def test_synthesise_matches_shifted_sum():
+    taps = random_taps()
+    excitation_signal = np.sin(np.linspace(0, 6 * np.pi, 25)) * np.hanning(25)
+    time_map, wake_time = IR.synthesise(taps, excitation_signal, 1e9, 64)
+    assert time_map.shape == (2, 3, 64, 3)
+    assert wake_time == np.min(taps.delays)
+    assert_allclose(
+        time_map,
+        shifted_sum(taps, excitation_signal, 1e9, 64, wake_time),
+        atol=1e-12,
+    )
+    # an earlier wake time shifts the response later, and taps beyond the end are dropped
+    time_map, _ = IR.synthesise(taps, excitation_signal, 1e9, 64, wake_time=0.0)
+    assert_allclose(
+        time_map, shifted_sum(taps, excitation_signal, 1e9, 64, 0.0), atol=1e-12
+    )
+
+
+def test_overlap_add_batches(monkeypatch):
+    # the segments are convolved in many small batches, with the same result as a single batch
+    taps = random_taps(source_num=3, sink_num=4, tap_num=200, seed=9)
+    excitation_signal = np.sin(np.linspace(0, 6 * np.pi, 25))
+    reference = shifted_sum(taps, excitation_signal, 1e9, 64, np.min(taps.delays))
+    monkeypatch.setattr(IR, "SYNTHESIS_BATCH_BYTES", 1)
+    response = IR.overlap_add(
+        taps.pairs(),
+        taps.sample_index(1e9),
+        taps.amplitudes,
+        12,
+        excitation_signal,
+        64,
+        block_size=8,
+    )
+    assert_allclose(response, reference.reshape(12, 64, 3), atol=1e-12)
+
+
+def test_channel_taps_empty():
+    taps = IR.channel_taps(1, 2, [], [], [], np.zeros((0, 3)), [])
+    assert len(taps) == 0
+    assert taps.wake_time() == 0.0
+    time_map, _ = IR.synthesise(taps, np.ones(4), 1e9, 8)
+    assert_equal(time_map, np.zeros((1, 2, 8, 3)))
+
+
+def test_overlap_add_matches_time_sorting():
+    # the overlap-add synthesiser gives the same time map as adding a shifted excitation for every path
+    rng = np.random.default_rng(4)
+    source_num, sink_num, num_samples = 2, 3, 200
+    depthslice = np.stack(
+        (
+            rng.integers(1, source_num + 1, 60),
+            rng.integers(source_num + 1, source_num + sink_num + 1, 60),
+        ),
+        axis=1,
+    )
+    time_steps = rng.integers(0, num_samples - 40, 60)
+    loss = rng.uniform(0.1, 1.0, 60)
+    polar = rng.uniform(0.0, 1.0, (60, 3))
+    excitation_signal = np.sin(np.linspace(0, 4 * np.pi, 31))
+    reference = EM.time_sortingv2(
+        source_num,
+        sink_num,
+        time_steps,
+        depthslice,
+        loss,
+        polar,
+        np.zeros((sink_num, 3, num_samples)),
+        excitation_signal,
+    )
+    for block_size in (None, 1, 7, 64, 1000):
+        response = IR.overlap_add(
+            depthslice[:, 1] - source_num - 1,
+            time_steps,
+            loss.reshape(-1, 1) * polar,
+            sink_num,
+            excitation_signal,
+            num_samples,
+            block_size=block_size,
+        )
+        assert_allclose(np.swapaxes(response, 1, 2), reference, atol=1e-12)
+
+
+def test_overlap_add_fractional_delay():
+    excitation_signal = np.hanning(9)
+    whole = IR.overlap_add([0, 0], [3, 4], np.ones((2, 3)), 1, excitation_signal, 32)
+    # half way between two samples is the average of the two, and no fraction is the sample itself
+    half = IR.overlap_add(
+        [0], [3], np.ones((1, 3)) * 2.0, 1, excitation_signal, 32, fractions=[0.5]
+    )
+    assert_allclose(half, whole, atol=1e-12)
+    none = IR.overlap_add([0], [3], np.ones((1, 3)), 1, excitation_signal, 32, fractions=[0.0])
+    assert_allclose(
+        none, IR.overlap_add([0], [3], np.ones((1, 3)), 1, excitation_signal, 32), atol=1e-12
+    )
+    taps = random_taps()
+    time_map, _ = IR.synthesise(taps, excitation_signal, 1e9, 256, fractional_delay=True)
+    # the interpolation preserves the total amplitude of each tap
+    assert_allclose(
+        np.sum(time_map, axis=(0, 1, 2)),
+        np.sum(taps.amplitudes, axis=0) * np.sum(excitation_signal),
+        rtol=1e-9,
+    )
+
+
+def test_synthesise_memory_budget(tmp_path):
+    # blocks of two sinks, then single sinks in windows of 16 and 6 samples, give the same response as a single block
+    taps = random_taps(source_num=2, sink_num=5, tap_num=80)
+    excitation_signal = np.sin(np.linspace(0, 6 * np.pi, 25))
+    _, wake_time = IR.synthesise(taps, excitation_signal, 1e9, 96)
+    block_size, fft_length, _ = IR.convolution_layout(25, np.iinfo(np.int64).max)
+    overhead = 24 + fft_length + 2 * block_size
+
+    def budget(samples):
+        # the budget for a window of samples for both sources, with the lead, padding and FFT scratch
+        return IR.segment_bytes(block_size, fft_length) + 2 * 3 * 8 * (samples + overhead)
+
+    for memory_budget in (budget(2 * (96 + overhead) - overhead), budget(16), budget(6)):
+        for fractional_delay in (False, True):
+            blocked, blocked_wake_time = IR.synthesise(
+                taps,
+                excitation_signal,
+                1e9,
+                96,
+                fractional_delay=fractional_delay,
+                filename=tmp_path / "time_map.npy",
+                memory_budget=memory_budget,
+            )
+            assert blocked_wake_time == wake_time
+            single, _ = IR.synthesise(
+                taps, excitation_signal, 1e9, 96, fractional_delay=fractional_delay
+            )
+            assert_allclose(blocked, single, atol=1e-12)
+            assert_allclose(np.load(tmp_path / "time_map.npy"), single, atol=1e-12)
+    # the peak allocation while streaming to a file stays within the budget, apart from the taps and a fixed overhead
+    for memory_budget in (4 * 10**5, 10**6):
+        IR.synthesise(
+            taps, excitation_signal, 1e9, 20000, filename=tmp_path / "time_map.npy",
+            memory_budget=memory_budget,
+        )
+        tracemalloc.start()
+        IR.synthesise(
+            taps, excitation_signal, 1e9, 20000, filename=tmp_path / "time_map.npy",
+            memory_budget=memory_budget,
+        )
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        assert peak < memory_budget + 2 ** 16
+    # an excitation longer than the budget allows is an error, rather than an unbounded allocation
+    with pytest.raises(ValueError):
+        IR.synthesise(
+            taps, np.ones(20000), 1e9, 20000, filename=tmp_path / "time_map.npy",
+            memory_budget=10**6,
+        )
+
+
+def test_synthesise_windows_matches_synthesise():
+    taps = random_taps(tap_num=60)
+    excitation_signal = np.sin(np.linspace(0, 6 * np.pi, 25)) * np.hanning(25)
+    for fractional_delay in [False, True]:
+        time_map, _ = IR.synthesise(
+            taps,
+            excitation_signal,
+            1e9,
+            80,
+            wake_time=0.0,
+            fractional_delay=fractional_delay,
+            wake_sample=3,
+        )
+        # smaller budgets synthesise the windows in several chunks, then split the windows between chunks
+        for memory_budget in [None, 15000, 12500]:
+            windows = IR.synthesise_windows(
+                taps,
+                excitation_signal,
+                1e9,
+                80,
+                wake_time=0.0,
+                fractional_delay=fractional_delay,
+                wake_sample=3,
+                memory_budget=memory_budget,
+            )
+            assert_allclose(windows.to_time_map(), time_map, atol=1e-12)
+            assert_allclose(
+                windows.combined(), np.sum(time_map, axis=(0, 1)), atol=1e-12
+            )
+    start, response = windows.window(1, 2)
+    assert_allclose(
+        response, time_map[1, 2, start : start + response.shape[0]], atol=1e-12
+    )
+    assert np.all(np.abs(time_map[1, 2, :start]) < 1e-12)
+
+
+def test_synthesise_windows_skips_leading_samples():
+    # a long delay before a short response only allocates the active window of each pair
+    taps = random_taps(source_num=1, sink_num=2, tap_num=10)
+    taps.delays += 1e-5
+    excitation_signal = np.ones(8)
+    windows = IR.synthesise_windows(taps, excitation_signal, 1e9, 20000, wake_time=0.0)
+    assert np.all(windows.starts >= 10000)
+    assert np.all(windows.lengths <= 50 + excitation_signal.shape[0])
+    assert windows.nbytes() < 2 * 20000 * 3 * 8 // 10
+    time_map, _ = IR.synthesise(taps, excitation_signal, 1e9, 20000, wake_time=0.0)
+    assert_allclose(windows.to_time_map(), time_map, atol=1e-12)
+    # pairs without taps have empty windows, and windows past the end of the response are dropped
+    empty = IR.synthesise_windows(taps, excitation_signal, 1e9, 100, wake_time=0.0)
+    assert_equal(empty.lengths, 0)
+    assert_equal(empty.combined(), np.zeros((100, 3)))
@@ -0,0 +1,143 @@
+import os
+
+import numpy as np
+from numpy.testing import assert_equal
+from ..raycasting import pathcache
+from ..raycasting import pathstore
+from ..raycasting import rayfunctions as RF
+from .conftest import cube
+
+
+def test_path_key():
+    sources = np.zeros((2, 3), dtype=np.float32)
+    sinks = np.ones((3, 3), dtype=np.float32)
+    scattering_points = np.empty((0, 3), dtype=np.float32)
+    environment = RF.convertTriangles(cube())
+    key = pathcache.path_key(sources, sinks, scattering_points, environment, 2)
+    assert key == pathcache.path_key(
+        sources.copy(), sinks.copy(), scattering_points, environment.copy(), 2
+    )
+    assert key != pathcache.path_key(sources, sinks, scattering_points, environment, 3)
+    assert key != pathcache.path_key(
+        sources, sinks, scattering_points, environment, 2, line_of_sight=False
+    )
+    moved = sinks.copy()
+    moved[0, 0] = 2.0
+    assert key != pathcache.path_key(sources, moved, scattering_points, environment, 2)
+    # the triangles are hashed in a canonical order, so reordering them for the BVH keeps the key
+    bvh_environment, _ = RF.build_bvh(environment)
+    assert key == pathcache.path_key(
+        sources, sinks, scattering_points, bvh_environment, 2
+    )
+    assert key == pathcache.path_key(
+        sources, sinks, scattering_points, environment[::-1], 2
+    )
+    assert key != pathcache.path_key(sources, sinks, scattering_points, environment[1:], 2)
+    # paths found from a supplied first leg or visibility graph are cached separately
+    first_leg = np.array([[1, 0]], dtype=np.int32)
+    visibility = (np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int32))
+    assert key != pathcache.path_key(
+        sources, sinks, scattering_points, environment, 2, first_leg=first_leg
+    )
+    assert key != pathcache.path_key(
+        sources, sinks, scattering_points, environment, 2, visibility=visibility
+    )
+
+
+def test_workchunking_cached_cpu(tmp_path, environment, scene):
+    sources, sinks, scattering_points = scene
+    cache = pathcache.path_cache(tmp_path)
+    reference, rays = RF.workchunkingv2(
+        sources, sinks, scattering_points, environment, 3, backend="cpu", path_cache=False
+    )
+    first, first_rays = RF.workchunkingv2(
+        sources, sinks, scattering_points, environment, 3, backend="cpu", path_cache=cache
+    )
+    cached, cached_rays = RF.workchunkingv2(
+        sources, sinks, scattering_points, environment, 3, backend="cpu", path_cache=cache
+    )
+    assert first_rays == rays and cached_rays == 0
+    assert_equal(first, reference)
+    assert_equal(cached, reference)
+    # the cache holds the compact paths, which are returned without expanding them
+    compact, compact_rays = RF.workchunkingv2(
+        sources, sinks, scattering_points, environment, 3, backend="cpu", path_cache=cache,
+        compact=True,
+    )
+    assert compact_rays == 0
+    assert isinstance(compact, pathstore.path_store)
+    assert isinstance(compact.nodes.base, np.memmap)
+    assert_equal(compact.to_full_index(4), reference)
+
+
+def test_default_path_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(pathcache, "_default_cache", None)
+    monkeypatch.delenv(pathcache.PATH_CACHE_DIRECTORY, raising=False)
+    assert pathcache.default_path_cache() is None
+    monkeypatch.setenv(pathcache.PATH_CACHE_DIRECTORY, str(tmp_path))
+    assert pathcache.default_path_cache().directory == tmp_path
+    assert pathcache.set_path_cache(None) is None
+    assert pathcache.default_path_cache() is None
+
+
+def test_path_cache_lru_eviction(tmp_path):
+    full_index = np.tile(np.array([[1, 3, 2]], dtype=np.int32), (1000, 1))
+    cache = pathcache.path_cache(tmp_path, max_bytes=30000)
+    cache.store("a", full_index)
+    cache.store("b", full_index)
+    # make "a" the least recently used, then use it again
+    for filename in cache.files("a"):
+        os.utime(filename, (0, 0))
+    cache.load("a")
+    for filename in cache.files("b"):
+        os.utime(filename, (1, 1))
+    cache.store("c", full_index)
+    assert cache.size() <= 30000
+    assert cache.load("b") is None
+    assert cache.load("a") is not None
+    assert_equal(cache.load("c").to_full_index(), full_index)
+
+
+def test_workchunking_cache_shared_with_scene_cpu(tmp_path, environment, scene):
+    # the scene holds the triangles in BVH order, but the same geometry shares a cache entry
+    sources, sinks, scattering_points = scene
+    cache = pathcache.path_cache(tmp_path)
+    reference, _ = RF.workchunkingv2(
+        sources, sinks, scattering_points, environment, 3, backend="cpu", path_cache=cache
+    )
+    bvh_environment, bvh_nodes = RF.build_bvh(environment)
+    with RF.raycasting_scene(bvh_environment, bvh_nodes, backend="cpu") as shared_scene:
+        cached, rays = RF.workchunkingv2(
+            sources, sinks, scattering_points, None, 3, scene=shared_scene, path_cache=cache
+        )
+    assert rays == 0
+    assert_equal(cached, reference)
+    # a visibility graph without any edges is a different problem, so the plain result is not returned for it
+    visibility = (
+        np.zeros(scattering_points.shape[0] + 1, dtype=np.int64),
+        np.zeros(0, dtype=np.int32),
+    )
+    blocked, rays = RF.workchunkingv2(
+        sources, sinks, scattering_points, environment, 3, backend="cpu",
+        path_cache=cache, visibility=visibility,
+    )
+    assert rays > 0
+    assert blocked.shape[0] < reference.shape[0]
+
+
+def test_workchunking_cache_shared_between_directions_cpu(tmp_path, environment, scene):
+    # tracing in reverse finds the same paths, so they are cached under the key of the forward problem
+    sources, sinks, scattering_points = scene
+    cache = pathcache.path_cache(tmp_path)
+    reverse, rays = RF.workchunkingv2(
+        sources, sinks, scattering_points, environment, 3, backend="cpu", path_cache=cache,
+        direction="reverse",
+    )
+    assert rays > 0
+    forward, rays = RF.workchunkingv2(
+        sources, sinks, scattering_points, environment, 3, backend="cpu", path_cache=cache,
+        direction="forward",
+    )
+    assert rays == 0
+    assert_equal(forward, reverse)
+    assert len(list(tmp_path.glob("*_nodes.npy"))) == 1
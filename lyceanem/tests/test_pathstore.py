@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+from numpy.testing import assert_equal
+from ..raycasting import pathstore
+from ..raycasting import rayfunctions as RF
+from .conftest import cube
+
+
+@pytest.fixture
+def full_index():
+    return np.array(
+        [[1, 3, 0, 0], [2, 4, 0, 0], [1, 5, 3, 0], [2, 5, 6, 4], [1, 6, 4, 0]],
+        dtype=np.int32,
+    )
+
+
+def test_compact_paths(full_index):
+    paths = pathstore.compact_paths(full_index)
+    assert_equal(paths.nodes, np.array([1, 3, 2, 4, 1, 5, 3, 2, 5, 6, 4, 1, 6, 4]))
+    assert_equal(
+        paths.blocks, np.array([[0, 0, 2], [2, 4, 3], [3, 7, 4], [4, 11, 3], [5, 14, 0]])
+    )
+    assert paths.shape == full_index.shape
+    assert len(paths) == 5
+    assert_equal(paths.depths(), np.array([1, 1, 2, 3, 2]))
+    assert_equal(paths.targets(), np.array([[1, 3], [2, 4], [1, 3], [2, 4], [1, 4]]))
+    assert_equal(paths.to_full_index(), full_index)
+    assert_equal(paths.to_full_index(5)[:, :4], full_index)
+
+
+def test_stack_paths(full_index):
+    blocks = [full_index[:2, :2], full_index[[2, 4], :3], full_index[:0], full_index[3:4]]
+    paths = pathstore.stack_paths(blocks)
+    assert_equal(paths.blocks, np.array([[0, 0, 2], [2, 4, 3], [4, 10, 4], [5, 14, 0]]))
+    assert_equal(paths.to_full_index(), full_index[[0, 1, 2, 4, 3]])
+    assert len(pathstore.stack_paths([])) == 0
+
+
+def test_path_slice(full_index):
+    # every path is found from the block table, for the store and for the padded index used in place
+    for paths in (pathstore.compact_paths(full_index), full_index):
+        nodes, blocks = pathstore.path_arrays(paths)
+        for ray in range(full_index.shape[0]):
+            path = pathstore.pathsliceCPU(nodes, blocks, ray)
+            assert_equal(path[path != 0], full_index[ray][full_index[ray] != 0])
+    nodes, blocks = pathstore.path_arrays(full_index)
+    assert_equal(blocks, np.array([[0, 0, 4], [5, 20, 0]]))
+
+
+def test_workchunking_compact_cpu(scene):
+    sources, sinks, scattering_points = scene
+    environment = RF.convertTriangles(cube())
+    full_index, rays = RF.workchunkingv2(
+        sources, sinks, scattering_points, environment, 3, backend="cpu", path_cache=False
+    )
+    paths, compact_rays = RF.workchunkingv2(
+        sources,
+        sinks,
+        scattering_points,
+        environment,
+        3,
+        backend="cpu",
+        path_cache=False,
+        compact=True,
+    )
+    assert isinstance(paths, pathstore.path_store)
+    assert compact_rays == rays
+    assert_equal(paths.to_full_index(full_index.shape[1]), full_index)
+    assert paths.nbytes() < full_index.nbytes
@@ -0,0 +1,405 @@
+import pytest
+import numpy as np
+import open3d as o3d
+from numpy.testing import assert_equal
+from ..raycasting import rayfunctions as RF
+from .conftest import cube, random_scene
+
+
+def test_raycasting_backend_cpu():
+    assert RF.raycasting_backend("cpu") == "cpu"
+
+
+def test_raycasting_backend_unknown():
+    with pytest.raises(ValueError):
+        RF.raycasting_backend("opencl")
+
+
+def test_raycasting_backend_auto():
+    backend = RF.raycasting_backend()
+    if RF.cuda.is_available():
+        assert backend == "cuda"
+    else:
+        assert backend == "cpu"
+        with pytest.raises(RuntimeError):
+            RF.raycasting_backend("cuda")
+
+
+def test_line_of_sight_cpu(environment, scene):
+    # the direct paths through the cube are blocked, the paths to the outer sinks are clear
+    sources, sinks, _ = scene
+    full_index, _ = RF.workchunkingv2(
+        sources,
+        sinks,
+        np.empty((0, 3), dtype=np.float32),
+        environment,
+        1,
+        backend="cpu",
+    )
+    final_index = np.array([[1, 4], [1, 5], [1, 6], [2, 4], [2, 5], [2, 6]])
+    assert_equal(full_index, final_index)
+
+
+def test_single_scatter_cpu(environment, scene):
+    # the scattering point at the centre of the cube is hidden, the others are visible from both sides
+    sources, sinks, scattering_points = scene
+    full_index, _ = RF.workchunkingv2(
+        sources, sinks, scattering_points, environment, 2, backend="cpu"
+    )
+    line_of_sight = np.array(
+        [[1, 4, 0], [1, 5, 0], [1, 6, 0], [2, 4, 0], [2, 5, 0], [2, 6, 0]]
+    )
+    assert_equal(full_index[: line_of_sight.shape[0]], line_of_sight)
+    scattered = full_index[line_of_sight.shape[0] :]
+    assert np.all(np.isin(scattered[:, 1], [7, 8]))
+    assert scattered.shape[0] == 2 * 2 * 4
+
+
+def test_bvh_leaves_cover_environment():
+    environment, _ = random_scene()
+    ordered, bvh_nodes = RF.build_bvh(environment)
+    leaves = bvh_nodes[bvh_nodes["tri_num"] > 0]
+    covered = np.concatenate(
+        [np.arange(leaf["first"], leaf["first"] + leaf["tri_num"]) for leaf in leaves]
+    )
+    assert_equal(np.sort(covered), np.arange(environment.shape[0]))
+    assert_equal(np.sort(ordered, order=list(ordered.dtype.names)),
+                 np.sort(environment, order=list(environment.dtype.names)))
+
+
+def test_bvh_matches_brute_force_cpu():
+    environment, rays = random_scene()
+    brute_force = RF.castRays(rays.copy(), environment, backend="cpu")
+    ordered, bvh_nodes = RF.build_bvh(environment)
+    accelerated = RF.castRays(rays.copy(), ordered, backend="cpu", bvh_nodes=bvh_nodes)
+    assert np.any(brute_force["intersect"]) and not np.all(brute_force["intersect"])
+    assert_equal(accelerated["intersect"], brute_force["intersect"])
+    assert_equal(accelerated["dist"], brute_force["dist"])
+
+
+def test_any_hit_matches_closest_hit_cpu():
+    # any hit mode only guarantees the intersection flag, which must agree with the closest hit search
+    environment, rays = random_scene()
+    closest = RF.castRays(rays.copy(), environment, backend="cpu")
+    any_hit = RF.castRays(rays.copy(), environment, backend="cpu", any_hit=True)
+    ordered, bvh_nodes = RF.build_bvh(environment)
+    any_hit_bvh = RF.castRays(
+        rays.copy(), ordered, backend="cpu", bvh_nodes=bvh_nodes, any_hit=True
+    )
+    assert_equal(any_hit["intersect"], closest["intersect"])
+    assert_equal(any_hit_bvh["intersect"], closest["intersect"])
+    assert np.all(any_hit["dist"] >= closest["dist"])
+
+
+def test_workchunking_any_hit_cpu(environment, scene):
+    sources, sinks, scattering_points = scene
+    closest, _ = RF.workchunkingv2(
+        sources, sinks, scattering_points, environment, 3, backend="cpu", any_hit=False
+    )
+    any_hit, _ = RF.workchunkingv2(
+        sources, sinks, scattering_points, environment, 3, backend="cpu"
+    )
+    assert_equal(any_hit, closest)
+
+
+def test_model_index_batches_match_model_index():
+    source_index = np.arange(1, 4).reshape(-1, 1)
+    sink_index = np.arange(4, 6).reshape(-1, 1)
+    scattering_point_index = np.arange(6, 9).reshape(-1, 1)
+    io_indexing = RF.create_model_index(source_index, sink_index, scattering_point_index)
+    parent_index = io_indexing[io_indexing[:, -1] > 5]
+    full = RF.create_model_index(parent_index, sink_index, scattering_point_index)
+    batches = list(
+        RF.model_index_batches(
+            parent_index, np.append(sink_index, scattering_point_index), 4
+        )
+    )
+    assert all(batch.shape[0] <= 4 for batch in batches)
+    assert_equal(np.concatenate(batches, axis=0), full)
+
+
+def test_streaming_batch_size_invariant_cpu(environment, scene):
+    sources, sinks, scattering_points = scene
+    source_index = np.arange(1, 3).reshape(-1, 1)
+    targets = np.arange(3, 10).reshape(-1, 1)
+    single = RF.streamingRaycaster(
+        sources, sinks, scattering_points, source_index, targets, environment, 1000,
+        backend="cpu",
+    )
+    batched = RF.streamingRaycaster(
+        sources, sinks, scattering_points, source_index, targets, environment, 3,
+        backend="cpu",
+    )
+    assert_equal(batched[0], single[0])
+    assert_equal(batched[1], single[1])
+    assert batched[2] == single[2]
+
+
+def test_convert_triangles():
+    mesh = cube()
+    vertices = np.asarray(mesh.vertices)
+    tri_index = np.asarray(mesh.triangles)
+    triangles = RF.convertTriangles(mesh)
+    for vertex in range(3):
+        for idx, axis in enumerate(["x", "y", "z"]):
+            assert_equal(
+                triangles["v{}{}".format(vertex, axis)],
+                vertices[tri_index[:, vertex], idx].astype(np.float32),
+            )
+
+
+def test_convert_triangles_pose():
+    mesh = cube()
+    pose = np.eye(4)
+    pose[:3, :3] = o3d.geometry.TriangleMesh.get_rotation_matrix_from_xyz(
+        np.radians([30.0, 0.0, 45.0])
+    )
+    pose[:3, 3] = [1.0, -2.0, 0.5]
+    transformed = o3d.geometry.TriangleMesh(mesh)
+    transformed.transform(pose)
+    assert_equal(RF.convertTriangles(mesh, pose), RF.convertTriangles(transformed))
+
+
+def test_refit_bvh_matches_rebuild_cpu():
+    environment, rays = random_scene()
+    ordered, bvh_nodes = RF.build_bvh(environment)
+    pose = np.eye(4)
+    pose[:3, :3] = o3d.geometry.TriangleMesh.get_rotation_matrix_from_xyz(
+        np.radians([10.0, 20.0, 30.0])
+    )
+    pose[:3, 3] = [0.1, 0.2, -0.1]
+    moved = RF.transform_triangles(ordered, pose)
+    refitted = RF.castRays(
+        rays.copy(), moved, backend="cpu", bvh_nodes=RF.refit_bvh(moved, bvh_nodes)
+    )
+    brute_force = RF.castRays(rays.copy(), moved, backend="cpu")
+    assert_equal(refitted["intersect"], brute_force["intersect"])
+
+
+def test_scene_reused_cpu(environment, scene):
+    sources, sinks, scattering_points = scene
+    reference, _ = RF.workchunkingv2(
+        sources, sinks, scattering_points, environment, 3, backend="cpu"
+    )
+    ordered, bvh_nodes = RF.build_bvh(environment)
+    with RF.raycasting_scene(ordered, bvh_nodes, backend="cpu") as resident:
+        first, _ = RF.workchunkingv2(
+            sources, sinks, scattering_points, None, 3, scene=resident
+        )
+        second, _ = RF.workchunkingv2(
+            sources, sinks, scattering_points, None, 3, scene=resident
+        )
+    assert_equal(first, reference)
+    assert_equal(second, reference)
+
+
+def test_scene_point_information():
+    resident = RF.raycasting_scene(
+        np.empty(0, dtype=RF.base_types.triangle_t), backend="cpu"
+    )
+    point_information = np.zeros(4, dtype=RF.base_types.scattering_t)
+    stored = resident.set_point_information(point_information)
+    assert resident.set_point_information(point_information.copy()) is stored
+    point_information["ex"] = 1.0
+    assert_equal(resident.set_point_information(point_information), point_information)
+
+
+def test_higher_order_scattering_cpu(environment, scene):
+    # paths with more scatters than the fixed branches used to allow
+    sources, sinks, _ = scene
+    scattering_points = np.array([[0.0, 2.0, 2.0], [0.0, -2.0, 2.0]], dtype=np.float32)
+    full_index, _ = RF.workchunkingv2(
+        sources, sinks, scattering_points, environment, 5, backend="cpu"
+    )
+    assert full_index.shape[1] == 6
+    legs = np.count_nonzero(full_index, axis=1) - 1
+    assert legs.max() == 5
+    # the paths are grouped by the number of legs
+    assert np.all(np.diff(legs) >= 0)
+    lower, _ = RF.workchunkingv2(
+        sources, sinks, scattering_points, environment, 3, backend="cpu"
+    )
+    assert_equal(full_index[legs <= 3, :4], lower)
+
+
+def test_total_ray_cap_cpu(environment, scene):
+    sources, sinks, scattering_points = scene
+    with pytest.warns(UserWarning):
+        full_index, rays = RF.workchunkingv2(
+            sources,
+            sinks,
+            scattering_points,
+            environment,
+            3,
+            backend="cpu",
+            max_rays_total=20,
+        )
+    assert rays <= 20
+    assert np.all(full_index[:, 2:] == 0)
+
+
+def test_visibility_graph_cpu(environment, scene):
+    sources, sinks, scattering_points = scene
+    targets = np.arange(3, 10).reshape(-1, 1)
+    offsets, neighbours, rays = RF.visibility_graph(
+        sources, sinks, scattering_points, environment, targets, 1000, backend="cpu"
+    )
+    assert rays == 3 * 6
+    assert offsets.shape[0] == 4 and offsets[-1] == neighbours.shape[0]
+    filtered, final, _ = RF.streamingRaycaster(
+        sources, sinks, scattering_points, np.arange(7, 10).reshape(-1, 1), targets,
+        environment, 1000, backend="cpu",
+    )
+    for point in range(3):
+        visible = np.sort(
+            np.append(final[final[:, 0] == point + 7, 1], filtered[filtered[:, 0] == point + 7, 1])
+        )
+        assert_equal(neighbours[offsets[point] : offsets[point + 1]], visible)
+
+
+def test_visibility_walk_matches_raycasting_cpu(environment, scene):
+    # walking the graph gives the same paths, in the same order, as casting a ray for every path
+    sources, sinks, _ = scene
+    scattering_points = np.array(
+        [[0.0, 2.0, 2.0], [0.0, -2.0, 2.0], [0.0, 2.0, 0.0]], dtype=np.float32
+    )
+    targets = np.arange(3, 10).reshape(-1, 1)
+    parent_index, _, _ = RF.streamingRaycaster(
+        sources, sinks, scattering_points, np.arange(1, 3).reshape(-1, 1), targets,
+        environment, 1000, backend="cpu",
+    )
+    offsets, neighbours, _ = RF.visibility_graph(
+        sources, sinks, scattering_points, environment, targets, 1000, backend="cpu"
+    )
+    for depth in range(3):
+        filtered, final, _ = RF.streamingRaycaster(
+            sources, sinks, scattering_points, parent_index, targets, environment, 1000,
+            backend="cpu",
+        )
+        walk_filtered, walk_final = RF.visibility_walk(parent_index, offsets, neighbours, 7, 6)
+        assert_equal(walk_filtered, filtered)
+        assert_equal(walk_final, final)
+        _, sinks_only = RF.visibility_walk(
+            parent_index, offsets, neighbours, 7, 6, sinks_only=True
+        )
+        assert_equal(sinks_only, final)
+        parent_index = filtered
+    assert parent_index.shape[0] > 0
+
+
+def test_visibility_reused_cpu(environment, scene):
+    sources, sinks, scattering_points = scene
+    reference, _ = RF.workchunkingv2(
+        sources, sinks, scattering_points, environment, 3, backend="cpu"
+    )
+    offsets, neighbours, _ = RF.visibility_graph(
+        sources, sinks, scattering_points, environment, np.arange(3, 10), 1000, backend="cpu"
+    )
+    reused, rays = RF.workchunkingv2(
+        sources, sinks, scattering_points, environment, 3, backend="cpu",
+        visibility=(offsets, neighbours),
+    )
+    assert_equal(reused, reference)
+    # only the first leg is raycast
+    assert rays == 2 * 7
+
+
+def test_first_leg_shared_cpu(environment, scene):
+    sources, sinks, scattering_points = scene
+    first_leg, first_rays = RF.transmitter_paths(
+        sources, scattering_points, environment, backend="cpu"
+    )
+    assert first_rays == 2 * 3
+    # the sinks are split into tiles, each reusing the rays from the sources to the scattering points
+    for max_scatter in (2, 3):
+        for line_of_sight in (True, False):
+            for tile in (sinks[:3], sinks[3:]):
+                reference, _ = RF.workchunkingv2(
+                    sources, tile, scattering_points, environment, max_scatter,
+                    line_of_sight=line_of_sight, backend="cpu", path_cache=False,
+                )
+                shared, rays = RF.workchunkingv2(
+                    sources, tile, scattering_points, environment, max_scatter,
+                    line_of_sight=line_of_sight, backend="cpu", path_cache=False,
+                    first_leg=first_leg,
+                )
+                assert_equal(shared, reference)
+
+
+def test_reverse_tracing_cpu(environment, scene):
+    # more sources than sinks, so the automatic choice traces from the sinks
+    sinks, sources, scattering_points = scene
+    for max_scatter in (1, 2, 3):
+        for line_of_sight in (True, False):
+            forward, _ = RF.workchunkingv2(
+                sources, sinks, scattering_points, environment, max_scatter,
+                line_of_sight=line_of_sight, backend="cpu", path_cache=False,
+                direction="forward",
+            )
+            reverse, _ = RF.workchunkingv2(
+                sources, sinks, scattering_points, environment, max_scatter,
+                line_of_sight=line_of_sight, backend="cpu", path_cache=False,
+                direction="reverse",
+            )
+            automatic, _ = RF.workchunkingv2(
+                sources, sinks, scattering_points, environment, max_scatter,
+                line_of_sight=line_of_sight, backend="cpu", path_cache=False,
+                direction="auto",
+            )
+            assert_equal(reverse, forward)
+            assert_equal(automatic, forward)
+    with pytest.raises(ValueError):
+        RF.workchunkingv2(
+            sources, sinks, scattering_points, environment, 1, backend="cpu",
+            path_cache=False, direction="sideways",
+        )
+
+
+def test_reverse_tracing_single_sided_cpu():
+    # an open mesh of one triangle facing +z, which only blocks the rays arriving from above
+    triangle = o3d.geometry.TriangleMesh()
+    triangle.vertices = o3d.utility.Vector3dVector(
+        np.array([[-5.0, -5.0, 0.0], [5.0, -5.0, 0.0], [0.0, 5.0, 0.0]])
+    )
+    triangle.triangles = o3d.utility.Vector3iVector(np.array([[0, 1, 2]]))
+    environment = RF.convertTriangles(triangle)
+    above = np.array([[0.0, 0.0, 1.0], [0.1, 0.0, 1.0]], dtype=np.float32)
+    below = np.array([[0.0, 0.0, -1.0]], dtype=np.float32)
+    scattering_points = np.array([[0.0, 0.0, 2.0], [0.0, 0.0, -2.0]], dtype=np.float32)
+    for sources, sinks in ((above, below), (below, above)):
+        for max_scatter in (1, 2):
+            forward, _ = RF.workchunkingv2(
+                sources, sinks, scattering_points, environment, max_scatter,
+                backend="cpu", path_cache=False,
+            )
+            for direction in ("reverse", "auto"):
+                traced, _ = RF.workchunkingv2(
+                    sources, sinks, scattering_points, environment, max_scatter,
+                    backend="cpu", path_cache=False, direction=direction,
+                )
+                assert_equal(traced, forward)
+            bvh_environment, bvh_nodes = RF.build_bvh(environment)
+            with RF.raycasting_scene(bvh_environment, bvh_nodes, backend="cpu") as shared_scene:
+                traced, _ = RF.workchunkingv2(
+                    sources, sinks, scattering_points, None, max_scatter,
+                    scene=shared_scene, path_cache=False, direction="reverse",
+                )
+            assert_equal(traced, forward)
+    # the direct paths from above are blocked, those from below pass through the back of the triangle
+    blocked, _ = RF.workchunkingv2(
+        above, below, scattering_points[:0], environment, 1, backend="cpu", path_cache=False
+    )
+    assert blocked.shape[0] == 0
+    clear, _ = RF.workchunkingv2(
+        below, above, scattering_points[:0], environment, 1, backend="cpu", path_cache=False
+    )
+    assert clear.shape[0] == 2
+
+
+def test_reverse_paths():
+    # one source and two sinks traced from the sinks, with the scattering point numbered 4
+    reverse_index = np.array([[2, 3, 0], [1, 4, 3], [1, 3, 0]], dtype=np.int32)
+    assert_equal(
+        RF.reverse_paths(reverse_index, 2, 1),
+        np.array([[1, 2, 0], [1, 3, 0], [1, 4, 2]], dtype=np.int32),
+    )
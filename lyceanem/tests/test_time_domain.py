@@ -0,0 +1,112 @@
+import numpy as np
+import open3d as o3d
+import scipy.constants
+from numpy.testing import assert_allclose
+from ..base_classes import structures
+from ..models import time_domain as TD
+
+
+def plate():
+    # a small plate below the aperture, so that there is a blocking environment
+    solid = o3d.geometry.TriangleMesh.create_box(0.2, 0.2, 0.01)
+    solid.translate(np.array([-0.1, -0.1, -0.2]))
+    solid.compute_triangle_normals()
+    return structures([solid])
+
+
+def aperture(points):
+    coords = o3d.geometry.PointCloud()
+    coords.points = o3d.utility.Vector3dVector(np.asarray(points, dtype=np.float64))
+    coords.normals = o3d.utility.Vector3dVector(
+        np.repeat(np.array([[0.0, 0.0, 1.0]]), len(points), axis=0)
+    )
+    return coords
+
+
+def test_impulse_response_line_of_sight():
+    sources = [[0.0, 0.0, 0.0], [0.05, 0.0, 0.0]]
+    sinks = [[0.0, 0.0, 3.0], [1.0, 0.0, 3.0], [0.0, 1.0, 2.0]]
+    taps = TD.calculate_impulse_response(
+        aperture(sources), aperture(sinks), plate(), np.array([1.0, 0, 0]),
+        wavelength=0.1, project_vectors=False,
+    )
+    assert len(taps) == 6
+    distances = np.linalg.norm(
+        np.asarray(sinks)[taps.sinks] - np.asarray(sources)[taps.sources], axis=1
+    )
+    assert_allclose(taps.delays, distances / scipy.constants.c, rtol=1e-6)
+    assert np.all(taps.depths == 0)
+    # each new excitation only needs the convolution, and the response starts at the wake time
+    sampling_freq = 2e10
+    excitation = np.hanning(16)
+    Ex, Ey, Ez, wake_time = TD.apply_excitation(
+        taps, excitation, sampling_freq=sampling_freq, num_samples=512
+    )
+    assert wake_time == np.min(taps.delays)
+    wake_index = np.digitize(wake_time, np.linspace(0, 512 / sampling_freq, 512))
+    assert np.all(Ex[:wake_index] == 0.0)
+    # the response is linear in the excitation, and sums to the excitation scaled by the taps
+    Ex2, _, _, _ = TD.apply_excitation(
+        taps, 2.0 * excitation, sampling_freq=sampling_freq, num_samples=512
+    )
+    assert_allclose(Ex2, 2.0 * Ex, atol=1e-15)
+    assert_allclose(
+        np.sum(Ex), np.sum(taps.amplitudes[:, 0]) * np.sum(excitation), rtol=1e-9
+    )
+
+
+def test_elements_single_pass(tmp_path):
+    # the element responses come from one pass over the paths, and sum to the combined response
+    sources = [[0.0, 0.0, 0.0], [0.05, 0.0, 0.0]]
+    sinks = [[0.0, 0.0, 3.0], [1.0, 0.0, 3.0], [0.0, 1.0, 2.0]]
+    excitation = np.hanning(16)
+    settings = dict(wavelength=0.1, sampling_freq=2e10, num_samples=512)
+    filename = tmp_path / "elements.npy"
+    Ex, Ey, Ez, wake_time = TD.calculate_scattering(
+        aperture(sources), aperture(sinks), excitation, plate(), np.array([1.0, 0, 0]),
+        elements=True, filename=filename, **settings
+    )
+    assert Ex.shape == (2, 3, 512)
+    time_map = np.load(filename, mmap_mode="r")
+    assert time_map.shape == (2, 3, 512, 3)
+    assert_allclose(time_map[..., 1], Ey)
+    taps = TD.calculate_impulse_response(
+        aperture(sources), aperture(sinks), plate(), np.array([1.0, 0, 0]), wavelength=0.1
+    )
+    combined = TD.apply_excitation(taps, excitation, sampling_freq=2e10, num_samples=512)
+    assert wake_time == combined[3]
+    for element_response, combined_response in zip((Ex, Ey, Ez), combined[:3]):
+        assert_allclose(
+            np.sum(element_response, axis=(0, 1)), combined_response, atol=1e-12
+        )
+    # the response of each element only includes the paths launched from it
+    first_element = TD.calculate_impulse_response(
+        aperture(sources[:1]), aperture(sinks), plate(), np.array([1.0, 0, 0]), wavelength=0.1
+    )
+    Ex_first, _, _, _ = TD.apply_excitation(
+        first_element, excitation, sampling_freq=2e10, num_samples=512
+    )
+    # the excitation is normalised by the number of elements
+    assert_allclose(np.sum(Ex[0], axis=0) * 2, Ex_first, atol=1e-12)
+
+
+def test_combined_response_gated():
+    # the combined response is synthesised only from the wake time, and matches the response from the taps
+    sources = [[0.0, 0.0, 0.0], [0.05, 0.0, 0.0]]
+    sinks = [[0.0, 0.0, 3.0], [1.0, 0.0, 3.0], [0.0, 1.0, 2.0]]
+    excitation = np.hanning(16)
+    Ex, Ey, Ez, wake_time = TD.calculate_scattering(
+        aperture(sources), aperture(sinks), excitation, plate(), np.array([1.0, 0, 0]),
+        wavelength=0.1, sampling_freq=2e10, num_samples=512,
+    )
+    assert Ex.shape == (512,)
+    taps = TD.calculate_impulse_response(
+        aperture(sources), aperture(sinks), plate(), np.array([1.0, 0, 0]), wavelength=0.1
+    )
+    combined = TD.apply_excitation(taps, excitation, sampling_freq=2e10, num_samples=512)
+    assert wake_time == combined[3]
+    for response, combined_response in zip((Ex, Ey, Ez), combined[:3]):
+        assert_allclose(response, combined_response, atol=1e-12)
+    wake_index = np.digitize(wake_time, np.linspace(0, 512 / 2e10, 512))
+    assert np.all(Ex[:wake_index] == 0.0)
+    assert np.any(Ex[wake_index:] != 0.0)